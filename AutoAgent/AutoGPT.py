@@ -2,22 +2,55 @@ from langchain.chat_models.base import BaseChatModel
 from langchain.llms.base import BaseLLM
 from langchain.tools import BaseTool
 from langchain.vectorstores.base import VectorStoreRetriever
-from langchain.output_parsers import PydanticOutputParser
-from typing import List, Optional
-from ..Utils.ThoughtAndAction import ThoughtAndAction
-from ..Utils.CommonUtils import Friendly  
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+from ..Utils.ThoughtAndAction import Action, Thought, ThoughtAndAction, ThoughtAndActions
+from ..Utils.JsonExtraction import TolerantPydanticOutputParser
 from ..Utils.PromptTemplateBuilder import PromptTemplateBuilder
+from ..Utils.PromptBudget import PromptBudget
+from ..Utils.LazySummaryMemory import LazySummaryMemory
+from ..Utils.Metrics import Metrics
+from ..Utils.ToolRegistry import ToolRegistry
+from ..Utils.JsonExtraction import IncrementalJsonParser
+from ..Utils.Speculation import SPECULATIVE_METADATA_KEY, ToolSpeculation, is_speculative_tool
+from ..Utils.JobManager import BACKGROUND_METADATA_KEY, DEFAULT_JOB_LIMITS, DEFAULT_MAX_RUNNING_JOBS, JobManager, set_job_manager
+from ..Utils.ProcessUtils import ProcessLimits
+from ..Utils.ObservationPipeline import ObservationCompressor, ObservationPipeline, OutputStore, set_output_store
+from ..Utils.StepEvents import (
+    ActionStartEvent,
+    FinalEvent,
+    ObservationEvent,
+    PromptUsageEvent,
+    StepEvent,
+    ThoughtEvent,
+    ToolOutputEvent,
+    ToolOutputSink,
+    set_tool_output_sink,
+)
 from langchain.memory import (
     ConversationBufferWindowMemory,
-    ConversationSummaryMemory,
     VectorStoreRetrieverMemory,
 )
 from langchain.schema import Document
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.globals import get_llm_cache
+import asyncio
+import logging
 import warnings
+import contextlib
+from contextlib import aclosing
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 from langchain_openai import OpenAI
 from langchain_core.pydantic_v1 import ValidationError
+from pydantic import ValidationError as PydanticValidationError
+from langchain_core.exceptions import OutputParserException
+
+logger = logging.getLogger(__name__)
+
+# 回复无法解析时使用的占位动作，执行时返回格式错误提示
+INVALID_RESPONSE_ACTION = "INVALID_RESPONSE"
+# 找不到工具时指标的 tool 标签；不用模型写的名称，避免任意字符串变成新的时间序列
+UNKNOWN_TOOL_LABEL = "unknown"
 
 
 class AutoGPT:
@@ -25,24 +58,58 @@ class AutoGPT:
         self,
         llm: BaseLLM | BaseChatModel,
         prompts_path: str,
-        tools: List[BaseTool],
+        tools: List[BaseTool] | ToolRegistry,  # 工具列表或注册表；列表会被包装成注册表，按名称查找不再线性扫描
         agent_name: Optional[str] = "Cyber Security Assistant",
         agent_role: Optional[str] = "Cybersecurity intelligent assistant robot that can automatically solve problems by using tools and instructions",
         max_thought_steps: Optional[int] = 10,
         memory_retriever: Optional[VectorStoreRetriever] = None,
         manual: Optional[bool] = False,  # 新增参数，决定模式
+        max_parallel_actions: Optional[int] = 1,  # 一步内最多同时执行的动作数，大于 1 时启用多动作输出格式
+        tool_concurrency: Optional[Dict[str, int]] = None,  # 每个工具的最大并发数，例如 {"NmapScan": 2}
+        event_queue_size: Optional[int] = 64,  # 工具输出事件的缓冲上限，消费者跟不上时工具会被阻塞
+        prompt_budget: Optional[PromptBudget] = None,  # 主 prompt 各段的 token 预算，不传时使用默认预算
+        metrics: Optional[Metrics] = None,  # 各阶段的耗时和计数，不传时只在进程内聚合
+        speculative_dispatch: Optional[bool] = True,  # 流式接收回复，action 完整后提前执行 metadata 标记为 speculative 的工具
+        background_jobs: Optional[bool] = True,  # 提供 StartJob 等工具，把 metadata 标记为 background 的工具放到后台执行
+        max_background_jobs: Optional[int] = DEFAULT_MAX_RUNNING_JOBS,  # 同时运行的后台任务数
+        job_limits: Optional[ProcessLimits] = None,  # 后台任务中子进程的资源限制，不传时使用 DEFAULT_JOB_LIMITS
+        compress_observations: Optional[bool] = True,  # 过长的执行结果压缩后再写入记忆，完整输出可以通过 ReadOutput 查看
+        observation_pipelines: Optional[Dict[str, Optional[ObservationPipeline]]] = None,  # 按工具名称覆盖默认的压缩流程，None 表示不压缩
     ):
         self.llm = llm
         self.prompts_path = prompts_path
-        self.tools = tools
+        self.tools = tools if isinstance(tools, ToolRegistry) else ToolRegistry(tools)
         self.agent_name = agent_name
         self.agent_role = agent_role
         self.max_thought_steps = max_thought_steps
         self.memory_retriever = memory_retriever  
         self.manual = manual 
-
-        self.output_parser = PydanticOutputParser(
-            pydantic_object=ThoughtAndAction
+        self.max_parallel_actions = max(1, max_parallel_actions or 1)
+        self.tool_concurrency = tool_concurrency or {}
+        self.event_queue_size = event_queue_size
+        self.prompt_budget = prompt_budget or PromptBudget()
+        self.metrics = metrics or Metrics()
+        # 人工确认模式下工具必须等用户确认后才能执行，不做提前执行
+        self.speculative_dispatch = (
+            bool(speculative_dispatch) and not manual and self.tools.has_metadata(SPECULATIVE_METADATA_KEY)
+        )
+        # 后台任务同样绕过人工确认，所以人工模式下不启用；没有可以放到后台的工具时也不提供任务工具
+        self.background_jobs = (
+            bool(background_jobs) and not manual and self.tools.has_metadata(BACKGROUND_METADATA_KEY)
+        )
+        self.max_background_jobs = max(1, max_background_jobs or 1)
+        self.job_limits = job_limits or DEFAULT_JOB_LIMITS
+        if self.background_jobs:
+            from ..Tools.JobTools import job_tools
+            self.tools = self.tools.extended(job_tools)
+        self.compress_observations = bool(compress_observations)
+        self.observation_pipelines = observation_pipelines or {}
+        if self.compress_observations:
+            from ..Tools.OutputTools import read_output_tool
+            self.tools = self.tools.extended([read_output_tool])
+
+        self.output_parser = TolerantPydanticOutputParser(
+            pydantic_object=ThoughtAndActions if self.max_parallel_actions > 1 else ThoughtAndAction
         )
 
         self.step_prompt = (
@@ -56,11 +123,7 @@ class AutoGPT:
             .format()
         )
         # Initialize memories
-        self.short_term_memory = ConversationBufferWindowMemory(
-            ai_prefix="Reason",  # 默认格式是：human 和 AI，AutoGpt 不存在 human，所以改成和我们情况符合的思考和行动
-            human_prefix="Act",
-            k=self.max_thought_steps,  # 短时记忆存储的窗口大小，设置为思考步数，表示全部存储
-        )
+        self.short_term_memory = self.new_short_term_memory()
 
 
         if self.memory_retriever is not None:
@@ -70,237 +133,589 @@ class AutoGPT:
         else:
             self.long_term_memory = None
 
-    def run(self, task_description: str, verbose=False) -> str:
+    def new_short_term_memory(self) -> ConversationBufferWindowMemory:
+        """
+        创建一份新的短时记忆。多会话场景下每个会话持有自己的一份，传给 run/arun 以实现会话隔离。
         """
-        Runs the AutoGPT agent, handling multiple tasks based on user input.
+        return ConversationBufferWindowMemory(
+            ai_prefix="Reason",  # 默认格式是：human 和 AI，AutoGpt 不存在 human，所以改成和我们情况符合的思考和行动
+            human_prefix="Act",
+            k=self.max_thought_steps,  # 短时记忆存储的窗口大小，设置为思考步数，表示全部存储
+        )
+
+    def run(
+        self,
+        task_description: str,
+        verbose=False,
+        short_term_memory: Optional[ConversationBufferWindowMemory] = None,
+    ) -> str:
+        """
+        Runs the AutoGPT agent synchronously.
+        这是 run_stream 的一层薄封装，同步和异步两条路径共用同一套 step 实现；verbose 时把事件打印出来。
+        注意：不能在已经运行中的事件循环里调用，此时请直接 await arun。
+        """
+        reply = ""
+        for event in self.run_stream(task_description, short_term_memory=short_term_memory):
+            if verbose:
+                self._print_event(event)
+            if isinstance(event, FinalEvent):
+                reply = event.reply
+        return reply
+
+    async def arun(
+        self,
+        task_description: str,
+        verbose=False,
+        short_term_memory: Optional[ConversationBufferWindowMemory] = None,
+    ) -> str:
         """
+        Runs the AutoGPT agent on the current event loop and returns the final reply.
+        """
+        reply = ""
+        async for event in self.astream(task_description, short_term_memory=short_term_memory):
+            if verbose:
+                self._print_event(event)
+            if isinstance(event, FinalEvent):
+                reply = event.reply
+        return reply
+
+    def run_stream(
+        self,
+        task_description: str,
+        short_term_memory: Optional[ConversationBufferWindowMemory] = None,
+    ) -> Iterator[StepEvent]:
+        """
+        同步生成器版本的 astream：在私有的事件循环上一次推进一个事件。
+        调用方不取下一个事件时 agent 不会继续往下执行，工具输出也会在有界队列处阻塞。
+        """
+        loop = asyncio.new_event_loop()
+        events = self.astream(task_description, short_term_memory=short_term_memory)
+        try:
+            while True:
+                try:
+                    event = loop.run_until_complete(events.__anext__())
+                except StopAsyncIteration:
+                    break
+                yield event
+        finally:
+            loop.run_until_complete(events.aclose())
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    async def astream(
+        self,
+        task_description: str,
+        short_term_memory: Optional[ConversationBufferWindowMemory] = None,
+    ) -> AsyncIterator[StepEvent]:
+        """
+        Runs the AutoGPT agent, yielding typed events: prompt_usage, thought, action_start, tool_output, observation, final.
+        LLM 调用走 chain.ainvoke，记忆读写走 aload_memory_variables / asave_context，工具走 tool.arun，
+        因此一个进程可以在同一个事件循环里并发驱动多个 agent 会话。
+        short_term_memory 不传时使用实例自带的短时记忆，多会话时每个会话传入自己的一份。
+        """
+        if short_term_memory is None:
+            short_term_memory = self.short_term_memory
         initial_task_description = task_description  # Rename for internal use
         finish_all_tasks = False
         reply = ""
-
-        # 长时记忆通过 summary 来总结，使用统一的 self.llm
-        summary_memory = ConversationSummaryMemory(
+        # 并发限制：全局一个，加上每个工具一个；asyncio 的信号量绑定事件循环，所以每次运行单独创建
+        limits = self._create_limits()
+        # 本次任务内长时记忆的检索结果缓存，写入新的长时记忆后失效
+        long_memory_cache = {}
+
+        # 长时记忆通过 summary 来总结，使用统一的 self.llm；
+        # 每步只记录原始轮次，积攒到阈值时在后台总结，读取摘要时再把剩下的轮次一次性总结掉
+        summary_memory = LazySummaryMemory(
             llm=self.llm,  
             buffer="问题：" + initial_task_description + "\n",
             ai_prefix="Reason",
             human_prefix="Act",
+            background=True,
         )
 
-        while not finish_all_tasks:
-            thought_step_count = 0  # 当前思考轮数
-            last_action = None  # 更新上一次的 action 标识
-            finish_turn = False  # 是否完成任务，判断 action 是否是 FINISH 得到，如果完成，需要进行输出最终结果
-
-            prompt_template = (
-                PromptTemplateBuilder(self.prompts_path)
-                .build(
-                    tools=self.tools,
-                    output_parser=self.output_parser,
-                )
-                .partial(
-                    ai_name=self.agent_name,
-                    ai_role=self.agent_role,
-                    task_description=initial_task_description,
-                )
-            )
-            chain = prompt_template | self.llm
-
-            while thought_step_count < self.max_thought_steps:
-                # 调用一次 step，获取 thought 和 action
-                thought_and_action = self._step(
-                    chain=chain,
-                    task_description=initial_task_description,
-                    short_term_memory=self.short_term_memory,
-                    long_term_memory=self.long_term_memory,
-                )
-                # 判断是否重复，如果重复，则需要重新思考
-                action = thought_and_action.action
-                if self._is_repeated(last_action, action):  # 这里只让他进行一次重思考
-                    thought_and_action = self._step(
+        speculation = None
+        try:
+            while not finish_all_tasks:
+                thought_step_count = 0  # 当前思考轮数
+                last_action = None  # 更新上一次的 action 标识
+                finish_turn = False  # 是否完成任务，判断 action 是否是 FINISH 得到，如果完成，需要进行输出最终结果
+
+                chain = self._build_chain(initial_task_description)
+
+                while thought_step_count < self.max_thought_steps:
+                    # 调用一次 step，获取 thought 和 action；可以提前执行的动作在回复生成期间就开始执行
+                    prompt_usage = {}
+                    speculation = self._new_speculation(thought_step_count, limits, last_action)
+                    thought_and_action = await self._astep(
                         chain=chain,
                         task_description=initial_task_description,
-                        short_term_memory=self.short_term_memory,
+                        short_term_memory=short_term_memory,
                         long_term_memory=self.long_term_memory,
-                        force_rethink=True,
+                        long_memory_cache=long_memory_cache,
+                        usage=prompt_usage,
+                        speculation=speculation,
                     )
+                    # 判断是否重复，如果重复，则需要重新思考
                     action = thought_and_action.action
+                    if self._is_repeated(last_action, action):  # 这里只让他进行一次重思考
+                        self.metrics.inc("forced_rethinks_total")
+                        if speculation is not None:
+                            await self._acancel_speculation(speculation)
+                        thought_and_action = await self._astep(
+                            chain=chain,
+                            task_description=initial_task_description,
+                            short_term_memory=short_term_memory,
+                            long_term_memory=self.long_term_memory,
+                            force_rethink=True,
+                            long_memory_cache=long_memory_cache,
+                            usage=prompt_usage,
+                            speculation=speculation,
+                        )
+                        action = thought_and_action.action
 
-                # 更新上一次的 action
-                last_action = action
+                    # 完整回复的动作与提前执行的不一致时取消提前执行的工具
+                    if speculation is not None and speculation.started:
+                        if speculation.matches(action) and not thought_and_action.is_finish():
+                            self.metrics.inc("speculative_hits_total", tool=speculation.tool_name)
+                        else:
+                            await self._acancel_speculation(speculation)
 
-                # 打印当前的 thought 和 action
-                if verbose:
-                    print(str(thought_and_action.thought))
+                    # 更新上一次的 action
+                    last_action = action
 
-                # 根据指令判断整体任务是否完成
-                if thought_and_action.is_finish():  # 之所以在这里判断 finish 进行 break，因为是根据前面的 short_term_memory 来判断的任务结束，所以不需要存储后面的 short_term_memory, 任务已经结束
-                    finish_turn = True
-                    break
+                    yield PromptUsageEvent(
+                        step=thought_step_count,
+                        sections=prompt_usage,
+                        budgets=self.prompt_budget.budgets,
+                    )
 
-                # 如果 manual 模式开启，进行用户确认
-                if self.manual:
-                    user_confirm = self._prompt_user_confirmation(action)
-                    if not user_confirm:
-                        # 用户未确认，提供选项
-                        user_choice = self._prompt_user_choice()
-                        if user_choice == '1':
-                            # 选项1：总结并退出
-                            reply = self._final_step(summary_memory, initial_task_description)
-                            print(reply)
-                            finish_all_tasks = True
-                            return reply
-                        elif user_choice == '2':
-                            # 选项2：添加讨论并修改操作
-                            additional_discussion = self._get_user_input("请输入额外的讨论内容，以修改操作：")
-                            
-                            # 短期记忆
-                            self.short_term_memory.save_context(
-                                {"input": "用户补充：" + additional_discussion},
-                                {"output": "已记录用户的补充内容，并将在下一步操作中考虑这些信息。"},
-                            )
+                    actions = thought_and_action.all_actions()
+                    self.metrics.inc("steps_total")
+                    yield ThoughtEvent(
+                        step=thought_step_count,
+                        thought=thought_and_action.thought,
+                        actions=actions,
+                    )
+
+                    # 根据指令判断整体任务是否完成
+                    if thought_and_action.is_finish():  # 之所以在这里判断 finish 进行 break，因为是根据前面的 short_term_memory 来判断的任务结束，所以不需要存储后面的 short_term_memory, 任务已经结束
+                        finish_turn = True
+                        break
+
+                    # 如果 manual 模式开启，进行用户确认；input() 会阻塞，放到线程里执行，避免卡住事件循环
+                    if self.manual:
+                        user_confirm = await asyncio.to_thread(
+                            self._prompt_user_confirmation, action if len(actions) == 1 else actions
+                        )
+                        if not user_confirm:
+                            # 用户未确认，提供选项
+                            user_choice = await asyncio.to_thread(self._prompt_user_choice)
+                            if user_choice == '1':
+                                # 选项1：总结并退出
+                                reply = await self._afinal_step(summary_memory, initial_task_description)
+                                yield FinalEvent(step=thought_step_count, reply=reply, finished=False)
+                                return
+                            elif user_choice == '2':
+                                # 选项2：添加讨论并修改操作
+                                additional_discussion = await asyncio.to_thread(
+                                    self._get_user_input, "请输入额外的讨论内容，以修改操作："
+                                )
                             
-                            # 摘要记忆
-                            summary_memory.save_context(
-                                {"input": "用户补充：" + additional_discussion},
-                                {"output": "系统已记录用户的补充内容，并将在下一步操作中考虑这些信息。"},
-                            )
+                                # 短期记忆
+                                await short_term_memory.asave_context(
+                                    {"input": "用户补充：" + additional_discussion},
+                                    {"output": "已记录用户的补充内容，并将在下一步操作中考虑这些信息。"},
+                                )
                             
-                            # 长期记忆
-                            if self.long_term_memory is not None:
-                                self.long_term_memory.save_context(
+                                # 摘要记忆
+                                await self._asave_summary(
+                                    summary_memory,
                                     {"input": "用户补充：" + additional_discussion},
-                                    {"output": "记录用户补充内容以供后续参考。"},
+                                    {"output": "系统已记录用户的补充内容，并将在下一步操作中考虑这些信息。"},
                                 )
                             
-                            print("已添加额外的讨论内容，系统将重新评估操作。")
+                                # 长期记忆
+                                if self.long_term_memory is not None:
+                                    await self.long_term_memory.asave_context(
+                                        {"input": "用户补充：" + additional_discussion},
+                                        {"output": "记录用户补充内容以供后续参考。"},
+                                    )
+                                    long_memory_cache.clear()
                             
-                            # 更新任务描述，包含新的讨论内容
-                            initial_task_description += f"\n用户补充：{additional_discussion}"
+                                logger.info("已添加额外的讨论内容，系统将重新评估操作。")
                             
-                            # 重新构建链以包含更新后的长时记忆
-                            prompt_template = (
-                                PromptTemplateBuilder(self.prompts_path)
-                                .build(
-                                    tools=self.tools,
-                                    output_parser=self.output_parser,
-                                )
-                                .partial(
-                                    ai_name=self.agent_name,
-                                    ai_role=self.agent_role,
-                                    task_description=initial_task_description,
-                                )
-                            )
-                            chain = prompt_template | self.llm
+                                # 更新任务描述，包含新的讨论内容
+                                initial_task_description += f"\n用户补充：{additional_discussion}"
                             
-                            # 重置思考步数和上一个动作，以重新开始思考过程
-                            thought_step_count = 0
-                            last_action = None
-                            continue  # 重新开始思考步骤
-                        else:
-                            print("无效的选择，继续执行默认操作。")
-
-                # 正常情况下，是需要去调用工具
-                tool = self._find_tool(action.name)
-                if tool is None:  # 没有找到对应的工具，报错
-                    result = (
-                        f"Error: 找不到工具或指令 '{action.name}'. "
-                        f"请从提供的工具/指令列表中选择，请确保按对的格式输出."
-                    )
-                else:  # 找到工具，进行运行，得到结果
-                    try:
-                        observation = tool.run(action.args)
-                    except ValidationError as e:
-                        observation = (
-                            f"Validation Error in args: {str(e)}, args: {action.args}."
-                        )
-                    except Exception as e:
-                        observation = (
-                            f"Error: {str(e)}, {type(e).__name__}, args: {action.args}."
-                        )
-                    result = (
-                        f"执行：{str(action)}\n"
-                        f"返回结果：{observation}"
-                    )
-                # 打印中间结果
-                if verbose:
-                    print(result)
-
-                # 更新短时记忆，存储 thought 和 action 作为输入，以及执行结果作为输出
-                self.short_term_memory.save_context(
-                    {"input": str(thought_and_action.thought)},
-                    {"output": result},
-                )
-
-                # 更新短时记忆时，也更新一下长时记忆，但是长时记忆是通过 summary 来总结
-                summary_memory.save_context(
-                    {"input": str(thought_and_action.thought)},
-                    {"output": result},
-                )
-
-                thought_step_count += 1
-
-            # 任务结束的时候，加入长时记忆即可
-            long_memory_history = summary_memory.load_memory_variables({}).get("history", "")
-            self.long_term_memory.save_context(
-                {"input": initial_task_description},
-                {"output": long_memory_history},
+                                # 重新构建链以包含更新后的长时记忆
+                                chain = self._build_chain(initial_task_description)
+                            
+                                # 重置思考步数和上一个动作，以重新开始思考过程
+                                thought_step_count = 0
+                                last_action = None
+                                continue  # 重新开始思考步骤
+                            else:
+                                logger.warning("无效的选择 %r，继续执行默认操作。", user_choice)
+
+                    # 正常情况下，是需要去调用工具；多个动作并发执行，工具输出边执行边以事件的形式产出，
+                    # 结果按动作给出的顺序合并
+                    results = []
+                    async with aclosing(
+                        self._arun_actions(thought_step_count, actions, limits, results, speculation)
+                    ) as events:
+                        async for event in events:
+                            yield event
+                    result = "\n\n".join(results)
+
+                    await self._asave_step(short_term_memory, summary_memory, thought_and_action.thought, result)
+
+                    thought_step_count += 1
+
+                # 任务结束的时候，加入长时记忆即可
+                if self.long_term_memory is not None:
+                    await self._asave_long_term(summary_memory, initial_task_description)
+
+                if finish_turn:  # 如果满足结束条件，则进行后续处理
+                    reply = await self._afinal_step(summary_memory, initial_task_description)
+                else:  # 没有结果，返回最后一次思考的结果
+                    reply = thought_and_action.thought.speak
+                yield FinalEvent(step=thought_step_count, reply=reply, finished=finish_turn)
+                # Decide whether to continue based on the context
+                # user_decision = self._prompt_user_to_continue()
+                # if user_decision.lower() in ['yes', 'y', '是', 'y是', '是的']:
+                #     task_description = self._get_user_input("请输入下一个任务描述：")
+                #     initial_task_description = task_description  # Update for next iteration
+                #     continue
+                finish_all_tasks = True
+                # short_term_memory.clear()
+                # if long_term_memory is not None:
+                #     self._clear_long_term_memory(long_term_memory)
+                # print("记忆已清除，任务已结束。")
+                break
+        finally:
+            if speculation is not None and speculation.started:
+                await self._acancel_speculation(speculation)
+            if "jobs" in limits:
+                await limits["jobs"].aclose()
+            await summary_memory.aclose()
+
+    # 把事件打印到终端，供 verbose 模式（命令行）使用；prompt 的 token 统计在 _astep 里以 DEBUG 级别记录日志
+    def _print_event(self, event: StepEvent):
+        if isinstance(event, ThoughtEvent):
+            print(str(event.thought))
+        elif isinstance(event, ToolOutputEvent):
+            print(event.chunk, end="")
+        elif isinstance(event, ObservationEvent):
+            print(event.result)
+        elif isinstance(event, FinalEvent):
+            print(event.reply)
+
+    # 构建主 prompt 对应的链，模板本身由 PromptTemplateBuilder 缓存；工具列表超出预算时换成精简格式
+    def _build_chain(self, task_description):
+        with self.metrics.span("template_build"):
+            prompt_template = PromptTemplateBuilder(self.prompts_path).build(
+                tools=self.tools,
+                output_parser=self.output_parser,
             )
+            prompt_template = prompt_template.partial(
+                ai_name=self.agent_name,
+                ai_role=self.agent_role,
+                task_description=task_description,
+                tools=self.prompt_budget.fit_tools(self.tools, prompt_template.partial_variables["tools"]),
+            )
+        return prompt_template | self.llm
 
-            if finish_turn:  # 如果满足结束条件，则进行后续处理
-                reply = self._final_step(summary_memory, initial_task_description)
-            else:  # 没有结果，返回最后一次思考的结果
-                reply = thought_and_action.thought.speak
-            print(reply)
-            # Decide whether to continue based on the context
-            # user_decision = self._prompt_user_to_continue()
-            # if user_decision.lower() in ['yes', 'y', '是', 'y是', '是的']:
-            #     task_description = self._get_user_input("请输入下一个任务描述：")
-            #     initial_task_description = task_description  # Update for next iteration
-            #     continue
-            finish_all_tasks = True
-            # short_term_memory.clear()
-            # if long_term_memory is not None:
-            #     self._clear_long_term_memory(long_term_memory)
-            # print("记忆已清除，任务已结束。")
-            break
-
-        return reply
-
-    def _step(
+    async def _astep(
         self,
         chain,
         task_description,
         short_term_memory,
         long_term_memory,
         force_rethink=False,
+        long_memory_cache=None,
+        usage=None,
+        speculation=None,
     ):
-        # 去向量库里检索相似度符合的长时记忆
-        long_memory = ""
-        if long_term_memory is not None:
-            long_memory = long_term_memory.load_memory_variables(
+        long_memory = await self._aload_long_term_memory(long_term_memory, task_description, long_memory_cache)
+        prompt_value, sections = await self._arender_prompt(chain, short_term_memory, long_memory, force_rethink)
+        if usage is not None:
+            usage.clear()
+            usage.update(self.prompt_budget.usage(sections, prompt=prompt_value.to_string()))
+            for section, tokens in usage.items():
+                self.metrics.inc("prompt_tokens_total", tokens, section=section)
+            logger.debug("prompt tokens: %s", dict(usage))
+        current_response = await self._ainvoke_llm(chain, prompt_value, speculation)
+        return self._parse_response(current_response)
+
+    # 去向量库里检索相似度符合的长时记忆；同一任务内查询文本不变，在向量库没有新写入之前直接复用上一次的结果
+    async def _aload_long_term_memory(self, long_term_memory, task_description, long_memory_cache=None):
+        if long_term_memory is None:
+            return ""
+        cache_key = (task_description, self._long_term_generation())
+        if long_memory_cache is not None and cache_key in long_memory_cache:
+            self.metrics.inc("long_term_cache_hits_total")
+            return long_memory_cache[cache_key]
+        with self.metrics.span("long_term_retrieval"):
+            long_memory = (await long_term_memory.aload_memory_variables(
                 {"prompt": task_description}  # 拿任务检索内存 memory，获取历史记录；至于里面的 key，并不重要，可以认为是标识而已；根据相似度检索的
-            ).get("history", "")
-        else:
-            long_memory = ""
-
-        current_response = chain.invoke(
-            {
-                "short_term_memory": short_term_memory.load_memory_variables({}).get("history", ""),
-                "long_term_memory": long_memory,
+            )).get("history", "")
+        if long_memory_cache is not None:
+            long_memory_cache[cache_key] = long_memory
+        return long_memory
+
+    # 按预算装配记忆并渲染 prompt，返回 (prompt_value, 各段文本)；和 chain.ainvoke 相比多出来的一步渲染用于统计 token
+    async def _arender_prompt(self, chain, short_term_memory, long_memory, force_rethink=False):
+        # 短时记忆直接取窗口里的消息，由 PromptBudget 压缩较早的执行结果
+        with self.metrics.span("prompt_render"):
+            inputs = {
+                "short_term_memory": self.prompt_budget.fit_short_term_memory(
+                    short_term_memory.buffer_as_messages,
+                    human_prefix=short_term_memory.human_prefix,
+                    ai_prefix=short_term_memory.ai_prefix,
+                ),
+                "long_term_memory": self.prompt_budget.fit_long_term_memory(long_memory),
                 "step_instruction": self.step_prompt if not force_rethink else self.force_rethink_prompt,
             }
-        )
+            prompt_value = await chain.first.ainvoke(inputs)
+        sections = {
+            "tools": chain.first.partial_variables["tools"],
+            "long_term_memory": inputs["long_term_memory"],
+            "short_term_memory": inputs["short_term_memory"],
+        }
+        return prompt_value, sections
+
+    async def _ainvoke_llm(self, chain, prompt_value, speculation=None):
+        self.metrics.inc("llm_calls_total")
+        with self.metrics.span("llm_invoke"):
+            if speculation is None or not self._can_stream(chain.last):
+                return await chain.last.ainvoke(prompt_value)
+            return await self._astream_llm(chain.last, prompt_value, speculation)
+
+    # 流式接收回复，顶层的 action 一结束就尝试提前执行；返回拼接后的完整回复
+    async def _astream_llm(self, llm, prompt_value, speculation):
+        parser = IncrementalJsonParser()
+        chunks = []
+        async for chunk in llm.astream(prompt_value):
+            text = chunk.content if isinstance(chunk, BaseMessage) else str(chunk)
+            chunks.append(text)
+            if not speculation.started and "action" in parser.feed(text):
+                self._start_speculation(speculation, parser)
+        return AIMessage(content="".join(chunks))
+
+    def _start_speculation(self, speculation, parser):
         try:
-            thought_and_action = self.output_parser.parse(
-                Friendly(current_response.content)
+            action = Action(**parser.value("action"))
+        except (ValueError, TypeError, PydanticValidationError):
+            return
+        tool = self._find_tool(action.name)
+        if tool is None or not is_speculative_tool(tool):
+            return
+        # 与上一步相同的动作会触发重新思考，不值得提前执行
+        if self._is_repeated(speculation.last_action, action):
+            return
+        self.metrics.inc("speculative_dispatch_total", tool=tool.name)
+        speculation.start(action, tool.name, self._arun_action)
+
+    async def _acancel_speculation(self, speculation):
+        if speculation.started:
+            self.metrics.inc("speculative_cancels_total", tool=speculation.tool_name)
+        await speculation.cancel()
+
+    def _new_speculation(self, step, limits, last_action):
+        if not self.speculative_dispatch:
+            return None
+        return ToolSpeculation(step, limits, self.event_queue_size, last_action)
+
+    # 设置了 LLM 缓存时 astream 会绕过缓存，这种情况下仍然走 ainvoke
+    @staticmethod
+    def _can_stream(llm):
+        cache = getattr(llm, "cache", None)
+        if cache is None:
+            return get_llm_cache() is None
+        return cache is False
+
+    def _parse_response(self, current_response):
+        try:
+            with self.metrics.span("output_parse"):
+                thought_and_action = self.output_parser.parse(current_response.content)
+        except OutputParserException as e:
+            # 修复后仍然无法解析：不中断任务，把错误作为这一步的执行结果反馈给模型
+            self.metrics.inc("parse_failures_total")
+            logger.warning("模型回复无法解析：%s", str(e).split("\n")[0])
+            logger.debug("无法解析的回复：\n%s", current_response.content)
+            thought_and_action = ThoughtAndAction(
+                thought=Thought(text="", reasoning="", plan=[], criticism="", speak=""),
+                action=Action(name=INVALID_RESPONSE_ACTION, args={"error": str(e).split("\n")[0]}),
             )
-        except Exception as e:
-            print("---------------------------------------------------")
-            print(Friendly(current_response.content))  # 这个地方容易报错，暂时没有查出来，偶尔报错
-            print("---------------------------------------------------")
-            thought_and_action = ThoughtAndAction()  # 提供一个默认值以避免后续错误
         return thought_and_action
 
+    def _create_limits(self):
+        limits = {
+            "global": asyncio.Semaphore(self.max_parallel_actions),
+            "tools": {
+                name: asyncio.Semaphore(max(1, limit))
+                for name, limit in self.tool_concurrency.items()
+            },
+        }
+        if self.background_jobs:
+            # 后台任务在本次运行结束时随 limits 一起关闭
+            limits["jobs"] = JobManager(
+                run_action=lambda action, sink: self._arun_action(action, limits, sink, background=True),
+                find_tool=self._find_tool,
+                max_running=self.max_background_jobs,
+                limits=self.job_limits,
+                metrics=self.metrics,
+            )
+        if self.compress_observations:
+            # 原始输出只在本次运行内可以查看，多个会话共用一个 agent 时互相看不到
+            limits["outputs"] = ObservationCompressor(OutputStore(), self.observation_pipelines)
+        return limits
+
+    # 并发执行一步里的全部动作，执行期间边产出 action_start / tool_output / observation 事件，
+    # 执行结果按动作顺序追加到 results
+    # 第一个动作已经提前执行时沿用它的事件队列和执行任务
+    async def _arun_actions(self, step, actions, limits, results, speculation=None):
+        loop = asyncio.get_running_loop()
+        speculated = speculation is not None and speculation.matches(actions[0])
+        queue = speculation.queue if speculated else asyncio.Queue(maxsize=self.event_queue_size)
+        sinks = [
+            ToolOutputSink(loop, queue, step, index, action.name)
+            for index, action in enumerate(actions)
+        ]
+        if speculated:
+            sinks[0], first_run = speculation.take()
+        runs = [
+            first_run if speculated and index == 0 else self._arun_action(action, limits, sink)
+            for index, (action, sink) in enumerate(zip(actions, sinks))
+        ]
+        for index, action in enumerate(actions):
+            yield ActionStartEvent(step=step, index=index, action=action)
+
+        task = asyncio.ensure_future(asyncio.gather(*runs))
+        getter = None
+        try:
+            while True:
+                if getter is None:
+                    getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({task, getter}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    yield getter.result()
+                    getter = None
+                    continue
+                break
+            # 工具已经结束，取出队列中剩下的输出
+            while not queue.empty():
+                yield queue.get_nowait()
+            for index, (action, result) in enumerate(zip(actions, task.result())):
+                results.append(result)
+                yield ObservationEvent(step=step, index=index, action=action, result=result)
+        finally:
+            for sink in sinks:
+                sink.closed = True
+            if getter is not None:
+                getter.cancel()
+            if not task.done():
+                # 调用方提前停止消费事件时取消工具执行，子进程会随之被结束
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+
+    # 向量库的写入代数；其他会话写入共享向量库后，本任务缓存的检索结果也会随之失效
+    def _long_term_generation(self):
+        vectorstore = getattr(self.memory_retriever, "vectorstore", None)
+        return getattr(vectorstore, "generation", None)
+
+    # 查找并异步执行 action 对应的工具，返回写入记忆的结果文本
+    # background 为 True 时是后台任务：不占用全局的动作并发数，由后台任务管理器自己限制数量
+    async def _arun_action(self, action, limits, sink=None, background=False):
+        # 在当前任务的上下文里登记输出去向和后台任务管理器，工具读取到的输出会变成 ToolOutputEvent
+        set_tool_output_sink(sink)
+        set_job_manager(limits.get("jobs"))
+        compressor = limits.get("outputs")
+        set_output_store(compressor.store if compressor is not None else None)
+        if action.name == INVALID_RESPONSE_ACTION:
+            return (
+                f"Error: 上一次回复无法解析为规定的 JSON 格式（{action.args.get('error')}）. "
+                f"请严格按照回复格式输出一个 JSON 对象，不要附加其他内容."
+            )
+        tool = self._find_tool(action.name)
+        if tool is None:  # 没有找到对应的工具，报错
+            self.metrics.inc("tool_errors_total", tool=UNKNOWN_TOOL_LABEL, kind="not_found")
+            return (
+                f"Error: 找不到工具或指令 '{action.name}'. "
+                f"请从提供的工具/指令列表中选择，请确保按对的格式输出."
+            )
+        # 找到工具，进行运行，得到结果；没有提供 coroutine 的工具会被 langchain 放到线程池中执行，
+        # 同时运行的数量受全局和单个工具的信号量限制
+        tool_limit = limits["tools"].get(tool.name)
+        global_limit = contextlib.nullcontext() if background else limits["global"]
+        self.metrics.inc("tool_calls_total", tool=tool.name)
+        try:
+            async with global_limit:
+                with self.metrics.span("tool_run", tool=tool.name):
+                    if tool_limit is not None:
+                        async with tool_limit:
+                            observation = await tool.arun(action.args)
+                    else:
+                        observation = await tool.arun(action.args)
+                    observation = await self._acompress_observation(compressor, tool.name, str(observation))
+        except ValidationError as e:
+            self.metrics.inc("tool_errors_total", tool=tool.name, kind="validation")
+            observation = (
+                f"Validation Error in args: {str(e)}, args: {action.args}."
+            )
+        except Exception as e:
+            self.metrics.inc("tool_errors_total", tool=tool.name, kind="exception")
+            observation = (
+                f"Error: {str(e)}, {type(e).__name__}, args: {action.args}."
+            )
+        return (
+            f"执行：{str(action)}\n"
+            f"返回结果：{observation}"
+        )
+
+    # 统计工具输出的字节数，并压缩过长的执行结果；在 tool_run span 内调用，压缩耗时计入工具阶段。
+    # 大输出的压缩要花几十毫秒，放到线程里做，不阻塞事件循环上的其他动作和事件流
+    async def _acompress_observation(self, compressor, tool_name, observation):
+        self.metrics.inc("tool_output_bytes_total", len(observation.encode("utf-8")), tool=tool_name)
+        if compressor is None or not compressor.needs_compression(tool_name, observation):
+            return observation
+        compressed = await asyncio.to_thread(compressor.compress, tool_name, observation)
+        if len(compressed) != len(observation):
+            self.metrics.inc("observations_compressed_total", tool=tool_name)
+            self.metrics.inc("observation_chars_saved_total", len(observation) - len(compressed), tool=tool_name)
+        return compressed
+
+    # 记录一步的结果：短时记忆存储 thought 作为输入、执行结果作为输出，摘要记忆记录同样的内容
+    async def _asave_step(self, short_term_memory, summary_memory, thought, result):
+        with self.metrics.span("memory_save", memory="short_term"):
+            await short_term_memory.asave_context(
+                {"input": str(thought)},
+                {"output": result},
+            )
+        with self.metrics.span("memory_save", memory="summary"):
+            await self._asave_summary(
+                summary_memory,
+                {"input": str(thought)},
+                {"output": result},
+            )
+
+    # 记录一轮到摘要记忆；LazySummaryMemory 通常不调用 LLM，超过阈值时的总结在后台任务里进行
+    async def _asave_summary(self, summary_memory, inputs, outputs):
+        await summary_memory.asave_context(inputs, outputs)
+
+    # 任务结束时把整个任务的摘要写入长时记忆
+    async def _asave_long_term(self, summary_memory, task_description):
+        with self.metrics.span("summary_load"):
+            long_memory_history = (await summary_memory.aload_memory_variables({})).get("history", "")
+        with self.metrics.span("memory_save", memory="long_term"):
+            await self.long_term_memory.asave_context(
+                {"input": task_description},
+                {"output": long_memory_history},
+            )
+
     # 用于判断两次 action (Action 对象) 是否重复，如果重复需要 reforce，判断名称和参数
     def _is_repeated(self, last_action, action):
         # 判断 obj
@@ -323,14 +738,13 @@ class AutoGPT:
 
         return True
 
-    # 根据名称查找工具
+    # 根据名称查找工具，名称忽略大小写和空白的差异
     def _find_tool(self, tool_name):
-        for tool in self.tools:
-            if tool.name == tool_name:
-                return tool
-        return None
+        return self.tools.get(tool_name)
 
-    def _final_step(self, summary_memory, task_description):
+    async def _afinal_step(self, summary_memory, task_description):
+        with self.metrics.span("summary_load"):
+            summary = (await summary_memory.aload_memory_variables({})).get("history", "")
         finish_prompt = (
             PromptTemplateBuilder(self.prompts_path, "finish_instruction.templ")
             .build()
@@ -338,13 +752,15 @@ class AutoGPT:
                 ai_name=self.agent_name,
                 ai_role=self.agent_role,
                 task_description=task_description,
-                short_term_memory=summary_memory.load_memory_variables({}).get("history", ""),
+                short_term_memory=summary,
             )
         )
 
         chain = finish_prompt | self.llm
-        response = chain.invoke({})
-        return response
+        self.metrics.inc("llm_calls_total")
+        with self.metrics.span("final_step"):
+            response = await chain.ainvoke({})
+        return getattr(response, "content", response)  # ChatModel 返回消息对象，LLM 直接返回字符串
 
     def _prompt_user_to_continue(self) -> str:
         """
@@ -372,16 +788,18 @@ class AutoGPT:
         """
         当用户不确认执行操作时，提供选项让用户选择下一步操作。
         """
-        print("请选择下一步操作：")
-        print("1. 直接总结内容并退出")
-        print("2. 添加额外的讨论内容以修改操作")
-        choice = input("请输入选项编号 (1/2): ")
+        choice = input(
+            "请选择下一步操作：\n"
+            "1. 直接总结内容并退出\n"
+            "2. 添加额外的讨论内容以修改操作\n"
+            "请输入选项编号 (1/2): "
+        )
         return choice.strip()
 
     def _clear_long_term_memory(self, long_term_memory: VectorStoreRetrieverMemory):
 
         try:
             long_term_memory.clear()
-            print("长时记忆已清除。")
+            logger.info("长时记忆已清除。")
         except AttributeError:
-            print("无法清除长时记忆：'clear' 方法不存在。请根据您的 VectorStoreRetrieverMemory 实现进行清除。")
+            logger.warning("无法清除长时记忆：'clear' 方法不存在。请根据您的 VectorStoreRetrieverMemory 实现进行清除。")
@@ -1,29 +1,80 @@
-import http.server    
 import os
 from langchain.tools import StructuredTool
 from pydantic.v1 import BaseModel, Field
+from ..Utils.StaticServer import get_server_registry
+
+# 默认的服务目录，相对当前工作目录；服务器监听所有网卡，只允许提供这个目录及其子目录
+DEFAULT_SERVER_DIR = "server"
 
 class BuildServerInput(BaseModel):
     port: int = Field(description="The port number to listen on")
+    directory: str = Field(
+        default=DEFAULT_SERVER_DIR,
+        description="要提供的目录，相对当前工作目录，必须是 server 或它的子目录（例如 server/payloads），默认为 server",
+    )
+
+class StopServerInput(BaseModel):
+    port: int = Field(description="要停止的服务器所监听的端口")
+
+class ListServersInput(BaseModel):
+    pass
+
+def _resolve_server_dir(directory: str) -> str:
+    """
+    把 directory 解析为真实路径（展开 ..、符号链接），不在 server 目录内时抛出 ValueError。
+    服务器监听 0.0.0.0，同一网络中的任何机器都能访问，不能把工作目录（里面有 api_keys.env）或系统目录暴露出去。
+    """
+    root = os.path.realpath(os.path.join(os.getcwd(), DEFAULT_SERVER_DIR))
+    server_dir = os.path.realpath(os.path.join(os.getcwd(), directory))
+    if os.path.commonpath([root, server_dir]) != root:
+        raise ValueError(f"只能提供 {root} 或它的子目录，{directory!r} 解析为 {server_dir}，不在其中")
+    return server_dir
 
-def build_server(port: int) -> str:
+def build_server(port: int, directory: str = DEFAULT_SERVER_DIR) -> str:
     """
-    在相对目录/server下的指定端口上启动一个简单的 HTTP 服务器，并返回服务器地址。
+    在相对目录/server（或它的子目录）下的指定端口上启动一个 HTTP 服务器，并返回服务器地址。
+    服务器在后台线程中运行，工具立即返回；同一个进程里的服务器可以用 list_servers 查看、stop_server 停止。
     """
-    current_dir = os.getcwd()
-    server_dir = os.path.join(current_dir, "server")
-    
-    class CustomHandler(http.server.SimpleHTTPRequestHandler):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, directory=server_dir, **kwargs)
-    
-    server = http.server.HTTPServer(("", port), CustomHandler)
-    server_address = f"http://localhost:{port}"
-    return f"服务器已在 {server_address} 启动，服务目录为 {server_dir}"
+    try:
+        server_dir = _resolve_server_dir(directory)
+        server = get_server_registry().start(server_dir, port)
+    except ValueError as e:
+        return f"服务器启动失败：{e}"
+    return f"服务器已启动：{server.describe()}"
+
+def stop_server(port: int) -> str:
+    """停止指定端口上的服务器，返回它运行期间的统计"""
+    try:
+        server = get_server_registry().stop(port)
+    except ValueError as e:
+        return str(e)
+    return f"服务器已停止：{server.describe()}"
+
+def list_servers() -> str:
+    """列出运行中的服务器和它们最近的请求"""
+    servers = get_server_registry().servers()
+    if not servers:
+        return "当前没有运行中的服务器。"
+    return "\n\n".join(server.describe(recent=5) for server in servers)
 
 build_server_tool = StructuredTool.from_function(
     func=build_server,
     name="build_server",
-    description="在相对目录/server下的指定端口上启动一个简单的 HTTP 服务器，并返回服务器地址。",
+    description="在相对目录/server（或它的子目录）下的指定端口上启动一个 HTTP 服务器（后台运行，监听所有网卡，支持并发下载），"
+                "并返回服务器地址。要提供的文件需要先放进 server 目录。",
     args_schema=BuildServerInput
 )
+
+stop_server_tool = StructuredTool.from_function(
+    func=stop_server,
+    name="stop_server",
+    description="停止 build_server 启动的、监听指定端口的 HTTP 服务器",
+    args_schema=StopServerInput
+)
+
+list_servers_tool = StructuredTool.from_function(
+    func=list_servers,
+    name="list_servers",
+    description="列出 build_server 启动的 HTTP 服务器，包括地址、目录、请求数和最近的请求，可以用来确认目标是否下载了文件",
+    args_schema=ListServersInput
+)
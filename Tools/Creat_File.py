@@ -1,31 +1,122 @@
+import hashlib
 import os
+from typing import List, Optional, Tuple
 from langchain.tools import StructuredTool
 from pydantic.v1 import BaseModel, Field
+from ..Utils.FileUtils import atomic_write_text, file_digest
 
-class CreateFileInput(BaseModel):
-    filename: str = Field(description="要创建的文件名")
-    content: str = Field(description="要创建的文件内容")
-    directory: str = Field(description="创建文件的目录（可以是相对路径或绝对路径）")
+FILE_MODES = ("write", "append", "patch")
+# 一次批量写入最多的文件数
+MAX_BATCH_FILES = 50
 
-def create_file(filename: str, content: str, directory: str) -> str:
+class FileWrite(BaseModel):
+    filename: str = Field(description="文件名，可以包含子目录")
+    content: str = Field(default="", description="写入的内容；patch 模式下是替换指定行的新内容")
+    directory: Optional[str] = Field(default=None, description="文件所在目录，不填时使用外层的 directory")
+    mode: str = Field(
+        default="write",
+        description="write：创建或整体覆盖文件；append：把内容追加到文件末尾，适合分多次写入大文件；"
+                    "patch：用 content 替换第 start_line 到 end_line 行，只修改文件的一部分",
+    )
+    start_line: Optional[int] = Field(default=None, description="patch 模式：要替换的第一行，从 1 开始")
+    end_line: Optional[int] = Field(
+        default=None,
+        description="patch 模式：要替换的最后一行（包含）；等于 start_line - 1 时不删除任何行，在 start_line 之前插入",
+    )
+
+class CreateFileInput(FileWrite):
+    filename: Optional[str] = Field(default=None, description="要创建的文件名；批量写入时不填")
+    content: str = Field(default="", description="要创建的文件内容；patch 模式下是替换指定行的新内容")
+    directory: str = Field(default=".", description="创建文件的目录（可以是相对路径或绝对路径）")
+    files: Optional[List[FileWrite]] = Field(
+        default=None, description=f"批量写入：一次写入多个文件（最多 {MAX_BATCH_FILES} 个），每项的参数与单个文件相同"
+    )
+    skip_unchanged: bool = Field(default=True, description="写入后内容与现有文件完全相同时跳过，不重写文件")
+
+def _patch(path: str, content: str, start_line: Optional[int], end_line: Optional[int]) -> Tuple[str, str]:
+    if start_line is None:
+        raise ValueError("patch 模式需要 start_line")
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        lines = file.read().splitlines(keepends=True)
+    end_line = start_line if end_line is None else end_line
+    if not 1 <= start_line <= len(lines) + 1 or not start_line - 1 <= end_line <= len(lines):
+        raise ValueError(f"行号范围 {start_line}-{end_line} 超出文件范围（共 {len(lines)} 行）")
+    new_lines = content.splitlines(keepends=True)
+    if new_lines and not new_lines[-1].endswith(("\n", "\r")) and end_line < len(lines):
+        # 替换的内容后面还有原来的行，补上换行，避免两行被拼成一行
+        new_lines[-1] += "\r\n" if lines[0].endswith("\r\n") else "\n"
+    result = "".join(lines[:start_line - 1] + new_lines + lines[end_line:])
+    if end_line < start_line:
+        summary = f"在第 {start_line} 行之前插入 {len(new_lines)} 行"
+    else:
+        summary = f"第 {start_line}-{end_line} 行替换为 {len(new_lines)} 行"
+    return result, f"{summary}，现在共 {len(result.splitlines())} 行"
+
+def _write_one(item: FileWrite, directory: str, skip_unchanged: bool) -> str:
+    if item.mode not in FILE_MODES:
+        raise ValueError(f"未知的写入模式 '{item.mode}'，可选：{', '.join(FILE_MODES)}")
+    # 如果是相对路径，将其转换为绝对路径
+    directory = os.path.abspath(item.directory or directory)
+    file_path = os.path.join(directory, item.filename)
+    # 确保目录存在（文件名中可以带子目录），如果不存在则创建
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    if item.mode == "append":
+        # 追加直接写在文件末尾，不重写整个文件，分块写入大文件时每次只花费新内容的开销
+        with open(file_path, 'a', encoding='utf-8', newline='') as file:
+            file.write(item.content)
+        return f"已向 {file_path} 追加 {len(item.content)} 个字符，文件现有 {os.path.getsize(file_path)} 字节"
+
+    if item.mode == "patch":
+        if not os.path.exists(file_path):
+            raise ValueError(f"文件 {file_path} 不存在，无法按行修改")
+        content, summary = _patch(file_path, item.content, item.start_line, item.end_line)
+    else:
+        content, summary = item.content, f"共 {len(item.content)} 个字符"
+    if skip_unchanged and file_digest(file_path) == hashlib.sha256(content.encode("utf-8")).hexdigest():
+        return f"文件 {file_path} 内容没有变化，已跳过"
+    atomic_write_text(file_path, content)
+    return f"文件 {item.filename} 已成功写入 {directory}（{summary}）"
+
+def create_file(
+    filename: Optional[str] = None,
+    content: str = "",
+    directory: str = ".",
+    mode: str = "write",
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+    files: Optional[List[FileWrite]] = None,
+    skip_unchanged: bool = True,
+) -> str:
     """
-    在指定目录下创建一个文件，支持相对路径和绝对路径，并返回文件路径。
+    在指定目录下创建或修改文件，支持相对路径和绝对路径。
+    write 和 patch 先写临时文件再原子替换；files 一次写入多个文件，某个文件出错不影响其他文件。
     """
-    # 如果是相对路径，将其转换为绝对路径
-    if not os.path.isabs(directory):
-        directory = os.path.abspath(directory)
-    
-    # 确保目录存在，如果不存在则创建
-    os.makedirs(directory, exist_ok=True)
-    
-    file_path = os.path.join(directory, filename)
-    with open(file_path, 'w') as file:
-        file.write(content)
-    return f"文件 {filename} 已成功创建在 {directory}"
+    if files:
+        if len(files) > MAX_BATCH_FILES:
+            return f"一次最多写入 {MAX_BATCH_FILES} 个文件，本次有 {len(files)} 个，请分批写入"
+        results = []
+        for item in files:
+            item = item if isinstance(item, FileWrite) else FileWrite(**item)
+            try:
+                results.append(_write_one(item, directory, skip_unchanged))
+            except (OSError, ValueError) as e:
+                results.append(f"写入 {item.filename} 失败：{e}")
+        return "\n".join(results)
+    if not filename:
+        return "请提供 filename，或者用 files 批量写入"
+    item = FileWrite(
+        filename=filename, content=content, directory=directory, mode=mode, start_line=start_line, end_line=end_line
+    )
+    try:
+        return _write_one(item, directory, skip_unchanged)
+    except (OSError, ValueError) as e:
+        return f"写入 {filename} 失败：{e}"
 
 create_file_tool = StructuredTool.from_function(
     func=create_file,
     name="create_file",
-    description="在指定目录下创建一个文件，支持相对路径和绝对路径，并返回文件路径。",
+    description="在指定目录下创建或修改文件，支持相对路径和绝对路径。"
+                "修改大文件的几行时用 patch 模式只替换这几行，不要重写整个文件；"
+                "很长的文件可以先 write 第一部分，再用 append 分几次追加；多个文件可以用 files 一次写入。",
     args_schema=CreateFileInput
 )
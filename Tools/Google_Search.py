@@ -4,9 +4,17 @@ import os
 import requests
 from langchain.tools import StructuredTool
 from pydantic.v1 import BaseModel, Field
+from ..Utils.HttpClient import fetch
+from ..Utils.ToolResultCache import cached_tool_result
+
+# 搜索结果变化较慢，同一任务里反复搜索相同内容时直接用缓存
+GOOGLE_SEARCH_CACHE_TTL = 6 * 3600
+# 一页搜索结果的 JSON 通常在几十 KB 以内
+GOOGLE_SEARCH_MAX_BYTES = 1024 * 1024
 
 class CustomSearchInput(BaseModel):
     query: str = Field(description="要搜索的查询字符串")
+    refresh: bool = Field(default=False, description="为 true 时忽略缓存，重新搜索")
 
 def run_google_search(query: str) -> str:
     """
@@ -30,8 +38,9 @@ def run_google_search(query: str) -> str:
     }
 
     try:
-        response = requests.get(endpoint, params=params, timeout=10)  # 设置超时为10秒
-        response.raise_for_status()
+        response = fetch("GET", endpoint, params=params, timeout=10, max_bytes=GOOGLE_SEARCH_MAX_BYTES)  # 设置超时为10秒
+        if response.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{response.status_code} {response.reason}")
         results = response.json()
 
         items = results.get("items", [])
@@ -58,13 +67,24 @@ def run_google_search(query: str) -> str:
         return f"发生未知错误: {err}"
 
 
+def _google_search_cacheable(result: str) -> bool:
+    # 只缓存正常的搜索结果，未配置密钥、超时和请求错误都不缓存
+    return result.startswith("标题:") or result == "没有找到相关结果。"
+
+
 google_search_tool = StructuredTool.from_function(
-    func=run_google_search,
+    func=cached_tool_result(
+        "google_search",
+        GOOGLE_SEARCH_CACHE_TTL,
+        key=lambda args: {"query": " ".join(args["query"].lower().split())},
+        cacheable=_google_search_cacheable,
+    )(run_google_search),
     name="google_search",
     description=(
         "备用工具：用于通过谷歌自定义搜索 JSON API 执行网页搜索。"
         "输入一个搜索查询，返回相关的搜索结果。"
         "当主搜索工具不可用时使用。"
     ),
-    args_schema=CustomSearchInput
+    args_schema=CustomSearchInput,
+    metadata={"speculative": True},
 )
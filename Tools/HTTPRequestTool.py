@@ -1,24 +1,44 @@
-import requests
 from langchain.tools import StructuredTool
 from pydantic.v1 import BaseModel, Field
 from typing import Optional
+from ..Utils.HttpClient import fetch, summarize_body
+from ..Utils.ToolResultCache import cached_tool_result
+
+# 只有不带请求体的 GET 请求会被缓存，有效期较短
+HTTP_GET_CACHE_TTL = 5 * 60
 
 class HTTPRequestQuery(BaseModel):
     url: str = Field(description="目标 URL")
     method: str = Field(description="HTTP 方法（GET, POST, PUT, DELETE 等）")
     headers: Optional[dict] = Field(default=None, description="HTTP 请求头")
     data: Optional[str] = Field(default=None, description="请求体数据（用于 POST, PUT 等）")
+    refresh: bool = Field(default=False, description="为 true 时不使用缓存的 GET 响应")
 
 def send_http_request(url: str, method: str, headers: Optional[dict] = None, data: Optional[str] = None) -> str:
-    """发送 HTTP 请求并获取响应"""
+    """发送 HTTP 请求，返回状态码、响应头和响应体（HTML 在源码前附上标题、表单等概要）"""
     try:
-        response = requests.request(method, url, headers=headers, data=data, timeout=10)
-        return f"HTTP 状态码: {response.status_code}\n响应头: {dict(response.headers)}\n响应体: {response.text}..."
+        response = fetch(method, url, headers=headers, data=data)
+        return f"HTTP 状态码: {response.status_code}\n响应头: {response.headers}\n响应体:\n{summarize_body(response)}"
     except Exception as e:
         return f"发送 HTTP 请求时出错：{str(e)}"
 
+def _http_cache_key(args: dict) -> Optional[dict]:
+    # POST、PUT 等请求可能改变服务端状态，不缓存
+    if args["method"].strip().upper() != "GET" or args["data"]:
+        return None
+    headers = {str(name).lower(): value for name, value in (args["headers"] or {}).items()}
+    return {"url": args["url"].strip(), "headers": headers}
+
+
+def _http_cacheable(result: str) -> bool:
+    # 5xx 通常是暂时性的故障，不缓存
+    return result.startswith("HTTP 状态码") and not result.startswith("HTTP 状态码: 5")
+
+
 http_request_tool = StructuredTool.from_function(
-    func=send_http_request,
+    func=cached_tool_result(
+        "Send HTTP Request", HTTP_GET_CACHE_TTL, key=_http_cache_key, cacheable=_http_cacheable
+    )(send_http_request),
     name="Send HTTP Request",
     description="发送 HTTP 请求到指定 URL，并获取响应",
     args_schema=HTTPRequestQuery
@@ -1,7 +1,13 @@
-import subprocess
+import shutil
 from langchain.tools import StructuredTool
 from pydantic.v1 import BaseModel, Field
 import platform
+from ..Utils.ProcessUtils import arun_process, describe_limits, run_process, shell_argv
+
+# 安装命令允许运行的秒数和每个输出流保留的字节数；通过 run_process / arun_process 运行，
+# 后台任务里会受 ProcessLimits 限制，任务被取消时连同子进程一起结束
+INSTALL_TIMEOUT = 600
+INSTALL_MAX_OUTPUT_BYTES = 1024 * 1024
 
 # 扩展后的允许安装的工具列表（用于网络安全和系统管理）
 ALLOWED_TOOLS = [
@@ -47,14 +53,11 @@ def get_install_command(tool_name: str) -> str:
             import distro
             distro_name = distro.id().lower()
         except ImportError:
-            # 如果未安装 distro 库，尝试安装
+            # 没有 distro 库时直接读取 /etc/os-release，不在工具执行过程中安装 Python 包
             try:
-                subprocess.run("pip install distro", shell=True, check=True)
-                import distro
-                distro_name = distro.id().lower()
-            except Exception:
-                # 如果仍然无法获取发行版，提示用户安装 distro 库
-                raise ValueError("无法确定 Linux 发行版，请确保安装了 'distro' 库。")
+                distro_name = platform.freedesktop_os_release().get("ID", "").lower()
+            except OSError:
+                raise ValueError("无法确定 Linux 发行版，请安装 'distro' 库。")
 
         if 'ubuntu' in distro_name or 'debian' in distro_name:
             return f"sudo apt-get update && sudo apt-get install -y {tool_name}"
@@ -75,32 +78,57 @@ def get_install_command(tool_name: str) -> str:
     else:
         raise ValueError(f"不支持的操作系统：{os_type}")
 
-def check_and_install_tool(tool_name: str) -> str:
-    """检查工具是否已安装，如果未安装则尝试安装"""
+def _prepare_install(tool_name: str):
+    """返回 (提前结束时的结果, 安装命令)：不允许安装或已经安装时不需要运行命令"""
     if tool_name not in ALLOWED_TOOLS:
-        return f"不允许安装工具：{tool_name}"
-
+        return f"不允许安装工具：{tool_name}", None
     # 检查工具是否已安装
-    check_command = f"which {tool_name}" if platform.system() != 'Windows' else f"where {tool_name}"
-    result = subprocess.run(check_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    if result.returncode == 0:
-        return f"工具 {tool_name} 已安装。"
-
-    # 尝试安装工具
+    if shutil.which(tool_name):
+        return f"工具 {tool_name} 已安装。", None
     try:
-        install_command = get_install_command(tool_name)
-        install_result = subprocess.run(install_command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        return f"工具 {tool_name} 安装成功。"
-    except subprocess.CalledProcessError as e:
-        return f"工具 {tool_name} 安装失败：{e.stderr.strip()}"
+        return None, get_install_command(tool_name)
     except ValueError as ve:
-        return str(ve)
+        return str(ve), None
+
+def _format_install_result(tool_name: str, result) -> str:
+    notes = describe_limits(result, INSTALL_TIMEOUT, INSTALL_MAX_OUTPUT_BYTES)
+    if result.returncode == 0 and not (result.timed_out or result.truncated):
+        text = f"工具 {tool_name} 安装成功。"
+    else:
+        text = f"工具 {tool_name} 安装失败：{result.stderr.decode(errors='ignore').strip()}"
+    return f"{text}\n{notes}" if notes else text
+
+def check_and_install_tool(tool_name: str) -> str:
+    """检查工具是否已安装，如果未安装则尝试安装"""
+    message, install_command = _prepare_install(tool_name)
+    if install_command is None:
+        return message
+    try:
+        result = run_process(
+            shell_argv(install_command), timeout=INSTALL_TIMEOUT, max_output_bytes=INSTALL_MAX_OUTPUT_BYTES
+        )
+        return _format_install_result(tool_name, result)
+    except Exception as e:
+        return f"发生未知错误：{str(e)}"
+
+async def acheck_and_install_tool(tool_name: str) -> str:
+    """check_and_install_tool 的异步版本，基于 asyncio 子进程；被取消时安装进程随之结束"""
+    message, install_command = _prepare_install(tool_name)
+    if install_command is None:
+        return message
+    try:
+        result = await arun_process(
+            shell_argv(install_command), timeout=INSTALL_TIMEOUT, max_output_bytes=INSTALL_MAX_OUTPUT_BYTES
+        )
+        return _format_install_result(tool_name, result)
     except Exception as e:
         return f"发生未知错误：{str(e)}"
 
 install_tool = StructuredTool.from_function(
     func=check_and_install_tool,
+    coroutine=acheck_and_install_tool,
     name="InstallTool",
     description="用于检查并安装所需的工具（仅限允许的工具）。请确保遵守所有适用的法律和法规，合法、道德地使用这些工具。",
-    args_schema=InstallInput
+    args_schema=InstallInput,
+    metadata={"background": True},
 )
\ No newline at end of file
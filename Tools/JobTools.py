@@ -0,0 +1,119 @@
+from typing import Optional
+from langchain.tools import StructuredTool
+from pydantic.v1 import BaseModel, Field
+from ..Utils.JobManager import get_job_manager
+
+# AwaitJob 单次最多等待的秒数，等待期间 agent 不会继续思考
+MAX_AWAIT_SECONDS = 600
+DEFAULT_TAIL_LINES = 20
+
+class StartJobInput(BaseModel):
+    tool: str = Field(description="要在后台执行的工具名称，只能是支持后台执行的工具")
+    args: dict = Field(default_factory=dict, description="传给该工具的参数，与直接调用时相同")
+
+class JobIdInput(BaseModel):
+    job_id: Optional[str] = Field(default=None, description="后台任务编号，例如 job-1；不填时列出全部后台任务")
+
+class TailJobInput(BaseModel):
+    job_id: str = Field(description="后台任务编号")
+    lines: int = Field(default=DEFAULT_TAIL_LINES, description="返回最后多少行输出")
+
+class AwaitJobInput(BaseModel):
+    job_id: str = Field(description="后台任务编号")
+    timeout: int = Field(default=60, description=f"最多等待的秒数（不超过 {MAX_AWAIT_SECONDS}），超时后任务继续在后台运行")
+
+class CancelJobInput(BaseModel):
+    job_id: str = Field(description="后台任务编号")
+
+
+def _manager():
+    manager = get_job_manager()
+    if manager is None:
+        raise ValueError("当前没有启用后台任务")
+    return manager
+
+
+async def start_job(tool: str, args: Optional[dict] = None) -> str:
+    """在后台开始执行工具，立即返回任务编号"""
+    try:
+        job = _manager().start(tool, args or {})
+    except ValueError as e:
+        return f"无法创建后台任务：{e}"
+    return f"已创建后台任务 {job.id}（{job.action.name}），可以继续其他工作，之后用 PollJob/TailJob/AwaitJob 查看结果。"
+
+
+async def poll_job(job_id: Optional[str] = None) -> str:
+    """查询后台任务的状态；结束的任务附带结果，运行中的任务附带最后几行输出"""
+    try:
+        manager = _manager()
+        if not job_id:
+            jobs = manager.jobs()
+            return "\n".join(job.describe() for job in jobs) if jobs else "当前没有后台任务。"
+        return manager.get(job_id).describe(tail_lines=5)
+    except ValueError as e:
+        return str(e)
+
+
+async def tail_job(job_id: str, lines: int = DEFAULT_TAIL_LINES) -> str:
+    """查看后台任务最近的输出"""
+    try:
+        job = _manager().get(job_id)
+    except ValueError as e:
+        return str(e)
+    tail = job.output.tail(max(1, lines))
+    dropped = f"（更早的 {job.output.dropped} 字节输出已丢弃）\n" if job.output.dropped else ""
+    return f"{job.id} [{job.status}] 最后 {lines} 行输出：\n{dropped}{tail or '（暂无输出）'}"
+
+
+async def await_job(job_id: str, timeout: int = 60) -> str:
+    """等待后台任务结束并返回结果，超时时返回当前状态"""
+    try:
+        job = await _manager().wait(job_id, max(0, min(timeout, MAX_AWAIT_SECONDS)))
+    except ValueError as e:
+        return str(e)
+    if job.finished:
+        return job.describe()
+    return f"等待 {timeout} 秒后任务仍在运行：\n{job.describe(tail_lines=5)}"
+
+
+async def cancel_job(job_id: str) -> str:
+    """取消后台任务，任务启动的子进程会被结束"""
+    try:
+        job = await _manager().cancel(job_id)
+    except ValueError as e:
+        return str(e)
+    return job.describe()
+
+
+job_tools = [
+    StructuredTool.from_function(
+        coroutine=start_job,
+        name="StartJob",
+        description="把耗时较长的工具（如 NmapScan、Shell、InstallTool）放到后台执行，立即返回任务编号，期间可以继续执行其他动作",
+        args_schema=StartJobInput,
+    ),
+    StructuredTool.from_function(
+        coroutine=poll_job,
+        name="PollJob",
+        description="查询后台任务的状态和结果，不填 job_id 时列出全部后台任务",
+        args_schema=JobIdInput,
+    ),
+    StructuredTool.from_function(
+        coroutine=tail_job,
+        name="TailJob",
+        description="查看后台任务最近的输出",
+        args_schema=TailJobInput,
+    ),
+    StructuredTool.from_function(
+        coroutine=await_job,
+        name="AwaitJob",
+        description="等待后台任务结束并返回结果，可以指定最多等待的秒数",
+        args_schema=AwaitJobInput,
+    ),
+    StructuredTool.from_function(
+        coroutine=cancel_job,
+        name="CancelJob",
+        description="取消正在运行或排队的后台任务",
+        args_schema=CancelJobInput,
+    ),
+]
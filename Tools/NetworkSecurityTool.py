@@ -1,18 +1,33 @@
 import requests
 from langchain.tools import StructuredTool
 from pydantic.v1 import BaseModel, Field
+from ..Utils.HttpClient import fetch
+from ..Utils.ToolResultCache import cached_tool_result
+
+# CVE 条目很少变化，检索结果缓存一天
+CVE_CACHE_TTL = 24 * 3600
+CVE_TIMEOUT = 15
+# 引用较多的 CVE 条目可能有几百 KB
+CVE_MAX_BYTES = 2 * 1024 * 1024
+CVE_ERROR_PREFIX = "检索 CVE 信息时出错"
 
 class CVEQuery(BaseModel):
     query: str = Field(description="要搜索的 CVE 编号")
+    refresh: bool = Field(default=False, description="为 true 时忽略缓存，重新检索")
 
 def cve_search(query: str) -> str:
     """根据查询搜索 CVE 信息"""
     url = f"https://cve.circl.lu/api/cve/{query}"  # 修正 URL
-    response = requests.get(url)
-    
+    try:
+        response = fetch("GET", url, timeout=CVE_TIMEOUT, max_bytes=CVE_MAX_BYTES)
+        data = response.json() if response.status_code == 200 else None
+    except requests.exceptions.Timeout:
+        return f"{CVE_ERROR_PREFIX}：请求超过 {CVE_TIMEOUT} 秒未响应。"
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return f"{CVE_ERROR_PREFIX}：{e}"
+
     if response.status_code == 200:
-        data = response.json()
-        if 'id' in data:
+        if isinstance(data, dict) and 'id' in data:
             cve_info = data
             # 提取 CVE 信息
             references = ', '.join(cve_info.get('references', []))  # 修正引用提取逻辑
@@ -24,12 +39,21 @@ def cve_search(query: str) -> str:
         else:
             return "未找到相关的 CVE 信息。"
     else:
-        return f"检索 CVE 信息时出错。状态码: {response.status_code}"
+        return f"{CVE_ERROR_PREFIX}。状态码: {response.status_code}"
+
+def _cve_cacheable(result: str) -> bool:
+    return not result.startswith(CVE_ERROR_PREFIX)
 
 # 使用 langchain 的工具
 cve_search_tool = StructuredTool.from_function(
-    func=cve_search,
+    func=cached_tool_result(
+        "CVE Search",
+        CVE_CACHE_TTL,
+        key=lambda args: {"query": args["query"].strip().upper()},  # CVE 编号不区分大小写
+        cacheable=_cve_cacheable,
+    )(cve_search),
     name="CVE Search",
     description="根据查询搜索 CVE（公共漏洞和暴露）信息",
-    args_schema=CVEQuery
+    args_schema=CVEQuery,
+    metadata={"speculative": True},  # 只读的检索，允许提前执行
 )
\ No newline at end of file
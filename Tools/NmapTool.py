@@ -1,129 +1,109 @@
-import subprocess
 from pydantic.v1 import BaseModel, Field
-import threading
-import queue
-import time
+import os
+import re
 from langchain.tools import StructuredTool
+from ..Utils.NmapScanner import apipelined_scan, ascan, pipelined_scan, scan
+from ..Utils.ToolResultCache import cached_tool_result
+
+# 全端口 -sV 扫描可能需要很久，这里给出较宽的时间上限；每个分片的 XML 输出超过上限时结束该分片
+NMAP_TIMEOUT = 3600
+NMAP_MAX_OUTPUT_BYTES = 4 * 1024 * 1024
+# 同时运行的 nmap 进程数：-sV 的探测主要在等网络往返，核数较少时也至少并行 4 个分片
+NMAP_MAX_PARALLEL = min(8, max(4, os.cpu_count() or 1))
+# 两阶段扫描中每次服务探测只涉及少数几个端口，时间上限短得多
+NMAP_SERVICE_TIMEOUT = 600
+NMAP_MODES = ("fast", "full")
+# 相同目标和端口范围的扫描结果保留 6 小时，重复的全端口扫描直接返回缓存
+NMAP_CACHE_TTL = 6 * 3600
+NMAP_ERROR_PREFIX = "执行过程中发生错误"
 
 class NmapInput(BaseModel):
-    target: str = Field(description="要扫描的目标 IP 或域名")
+    target: str = Field(description="要扫描的目标 IP、域名或网段（CIDR），多个目标用空格或逗号分隔")
     ports: str = Field(
         description="要扫描的端口范围，例如 '1-65535'，默认扫描所有端口",
         default="1-65535"
     )
+    mode: str = Field(
+        description="fast：先快速找出开放端口，再只对开放端口探测服务版本（默认）；full：对整个端口范围直接 -sV",
+        default="fast"
+    )
+    refresh: bool = Field(default=False, description="为 true 时忽略缓存的扫描结果，重新扫描")
+
+def _format_report(report) -> str:
+    if not report.hosts and report.errors:
+        # 所有分片都没有结果，按错误处理，不写入缓存
+        return f"{NMAP_ERROR_PREFIX}：" + "；".join(report.errors)
+    return report.render()
+
+
+def _unknown_mode(mode: str) -> str:
+    return f"{NMAP_ERROR_PREFIX}：未知的扫描模式 {mode!r}，可选：{', '.join(NMAP_MODES)}"
+
+
+def run_nmap_scan(target: str, ports: str = "1-65535", mode: str = "fast") -> str:
+    """执行 nmap 扫描：按主机和端口范围分片并行运行，解析 XML 输出，返回开放端口和服务的表格"""
+    if mode not in NMAP_MODES:
+        return _unknown_mode(mode)
+    try:
+        if mode == "fast":
+            report = pipelined_scan(
+                target, ports, NMAP_MAX_PARALLEL, NMAP_TIMEOUT, NMAP_MAX_OUTPUT_BYTES, NMAP_SERVICE_TIMEOUT
+            )
+        else:
+            report = scan(target, ports, NMAP_MAX_PARALLEL, NMAP_TIMEOUT, NMAP_MAX_OUTPUT_BYTES)
+        return _format_report(report)
+    except FileNotFoundError:
+        return f"{NMAP_ERROR_PREFIX}：未找到 nmap，请先安装 nmap。"
+    except Exception as e:
+        return f"{NMAP_ERROR_PREFIX}：{str(e)}"
+
 
-def run_nmap_scan(target: str, ports: str = "1-65535") -> str:
-    """执行 nmap 扫描，实时返回开放的端口和运行的服务"""
+async def arun_nmap_scan(target: str, ports: str = "1-65535", mode: str = "fast") -> str:
+    """run_nmap_scan 的异步版本，基于 asyncio 子进程，不阻塞事件循环"""
+    if mode not in NMAP_MODES:
+        return _unknown_mode(mode)
     try:
-        # 构建 nmap 命令，使用 -T4 提高扫描速度，-p 指定端口范围，-sV 探测服务版本
-        command = f"nmap -T4 -p {ports} -sV {target}"
-        process = subprocess.Popen(
-            command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-
-        output_queue = queue.Queue()
-        error_queue = queue.Queue()
-
-        # 定义线程函数来读取输出
-        def read_output(pipe, q):
-            for line in iter(pipe.readline, ''):
-                if line:
-                    q.put(line)
-            pipe.close()
-
-        # 创建线程读取 stdout 和 stderr
-        stdout_thread = threading.Thread(target=read_output, args=(process.stdout, output_queue))
-        stderr_thread = threading.Thread(target=read_output, args=(process.stderr, error_queue))
-
-        stdout_thread.start()
-        stderr_thread.start()
-
-        # 实时收集输出
-        output_lines = []
-        error_lines = []
-        while True:
-            # 读取标准输出
-            while not output_queue.empty():
-                line = output_queue.get()
-                print(line, end='')  # 实时打印输出
-                output_lines.append(line)
-
-            # 读取标准错误
-            while not error_queue.empty():
-                line = error_queue.get()
-                print(line, end='')  # 实时打印错误
-                error_lines.append(line)
-
-            if process.poll() is not None and output_queue.empty() and error_queue.empty():
-                break
-
-            time.sleep(0.1)  # 避免占用过多 CPU
-
-        # 等待线程结束
-        stdout_thread.join()
-        stderr_thread.join()
-
-        # 处理输出，只提取开放的端口和服务信息
-        output = ''.join(output_lines)
-        open_ports = []
-        fingerprints = []
-        capture = False
-        for line in output.split('\n'):
-            if line.startswith("PORT"):
-                capture = True
-                continue
-            if capture:
-                if line.strip() == "" or line.startswith("Nmap done"):
-                    capture = False
-                    continue
-                # 分析每一行，确保端口是开放的
-                parts = line.split()
-                if len(parts) >= 3 and parts[1].lower() == "open":
-                    open_ports.append(line.strip())
-                # 检查是否有指纹信息
-                if "SF:" in line:
-                    fingerprints.append(line.strip())
-
-        result_sections = []
-
-        if open_ports:
-            ports_info = f"目标 {target} 的开放端口和服务信息：\n" + "\n".join(open_ports)
-            result_sections.append(ports_info)
+        if mode == "fast":
+            report = await apipelined_scan(
+                target, ports, NMAP_MAX_PARALLEL, NMAP_TIMEOUT, NMAP_MAX_OUTPUT_BYTES, NMAP_SERVICE_TIMEOUT
+            )
         else:
-            result_sections.append(f"未发现目标 {target} 的开放端口。")
-
-        if fingerprints:
-            fingerprints_info = "发现的服务指纹信息（可能未被识别）：\n" + "\n".join(fingerprints)
-            result_sections.append(fingerprints_info)
-
-        result_text = "\n\n".join(result_sections)
-
-        MAX_OUTPUT_LENGTH = 8000
-        if len(result_text) > MAX_OUTPUT_LENGTH:
-            # 尝试保留指纹信息
-            if fingerprints:
-                fingerprints_text = "\n\n".join([section for section in result_sections if "指纹信息" in section])
-                if len(fingerprints_text) <= MAX_OUTPUT_LENGTH:
-                    result_text = fingerprints_text + "\n...部分结果已截断。"
-                else:
-                    result_text = fingerprints_text[:MAX_OUTPUT_LENGTH] + "\n...结果过长，已截断。"
-            else:
-                result_text = result_text[:MAX_OUTPUT_LENGTH] + "\n...结果过长，已截断。"
-
-        return result_text
-
-    except subprocess.CalledProcessError as e:
-        return f"nmap 命令执行失败：{e.stderr.strip()}"
+            report = await ascan(target, ports, NMAP_MAX_PARALLEL, NMAP_TIMEOUT, NMAP_MAX_OUTPUT_BYTES)
+        return _format_report(report)
+    except FileNotFoundError:
+        return f"{NMAP_ERROR_PREFIX}：未找到 nmap，请先安装 nmap。"
     except Exception as e:
-        return f"执行过程中发生错误：{str(e)}"
+        return f"{NMAP_ERROR_PREFIX}：{str(e)}"
+
+
+# 多个目标之间的分隔符，与 NmapInput.target 的说明一致：空白和逗号都可以
+_TARGET_SEPARATORS = re.compile(r"[\s,]+")
+
+
+def _nmap_cache_key(args: dict) -> dict:
+    # 主机名不区分大小写，多个目标的顺序和分隔方式不影响结果；端口范围去掉空白
+    return {
+        "target": sorted(filter(None, _TARGET_SEPARATORS.split(args["target"].lower()))),
+        "ports": "".join(args["ports"].split()),
+        "mode": args["mode"],
+    }
+
+
+def _nmap_cacheable(result: str) -> bool:
+    # 出错、超时或输出被截断的扫描不完整，不缓存
+    return not result.startswith(NMAP_ERROR_PREFIX) and not any(
+        marker in result for marker in ("已被强制结束", "已被截断", "扫描错误：")
+    )
+
+
+_cache_nmap = cached_tool_result("NmapScan", NMAP_CACHE_TTL, key=_nmap_cache_key, cacheable=_nmap_cacheable)
 
 nmap_tool = StructuredTool.from_function(
-    func=run_nmap_scan,
+    func=_cache_nmap(run_nmap_scan),
+    coroutine=_cache_nmap(arun_nmap_scan),
     name="NmapScan",
-    description="用于扫描目标的开放端口和运行的服务。输入目标 IP 或域名，可选的端口范围。",
-    args_schema=NmapInput
+    description="用于扫描目标的开放端口和运行的服务。输入目标 IP、域名或网段，可选的端口范围。",
+    args_schema=NmapInput,
+    # 扫描不改变目标状态，允许在模型生成回复期间提前开始；全端口扫描耗时较长，也可以放到后台执行
+    metadata={"speculative": True, "background": True},
 )
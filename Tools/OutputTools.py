@@ -0,0 +1,52 @@
+import re
+from typing import Optional
+from langchain.tools import StructuredTool
+from pydantic.v1 import BaseModel, Field
+from ..Utils.ObservationPipeline import get_output_store
+
+# 一页最多的行数和字符数，避免分页读取本身又把大段输出塞进记忆
+MAX_PAGE_LINES = 200
+MAX_PAGE_CHARS = 8000
+
+class ReadOutputInput(BaseModel):
+    ref: str = Field(description="压缩结果末尾给出的输出编号，例如 out-1")
+    start_line: int = Field(default=1, description="从第几行开始，从 1 开始")
+    lines: int = Field(default=100, description=f"读取的行数，最多 {MAX_PAGE_LINES}")
+    pattern: Optional[str] = Field(default=None, description="只返回匹配这个正则表达式的行（忽略大小写），不填时按行号分页")
+
+def read_output(ref: str, start_line: int = 1, lines: int = 100, pattern: Optional[str] = None) -> str:
+    """分页查看被压缩的执行结果的完整输出，或者在其中搜索"""
+    store = get_output_store()
+    if store is None:
+        return "当前没有保存完整输出"
+    try:
+        all_lines = store.lines(ref)
+        regex = re.compile(pattern, re.I) if pattern else None
+    except ValueError as e:  # re.error 是 ValueError 的子类
+        return str(e)
+    start = max(1, start_line)
+    count = max(1, min(lines, MAX_PAGE_LINES))
+    numbered = [
+        (number, line) for number, line in enumerate(all_lines[start - 1:], start)
+        if regex is None or regex.search(line)
+    ]
+    page, used = [], 0
+    for number, line in numbered[:count]:
+        if page and used + len(line) > MAX_PAGE_CHARS:
+            break
+        page.append(f"{number}: {line}")
+        used += len(line)
+    if not page:
+        return f"{ref} 共 {len(all_lines)} 行，从第 {start} 行起没有{'匹配的' if regex else ''}内容"
+    header = f"{ref} 共 {len(all_lines)} 行" + (f"，从第 {start} 行起有 {len(numbered)} 行匹配" if regex else "")
+    remaining = len(numbered) - len(page)
+    last = int(page[-1].split(":", 1)[0])
+    footer = f"（还有 {remaining} 行，下一页从第 {last + 1} 行开始）" if remaining else "（已到末尾）"
+    return "\n".join([header, *page, footer])
+
+read_output_tool = StructuredTool.from_function(
+    func=read_output,
+    name="ReadOutput",
+    description="执行结果过长时会被压缩，完整输出保存为 out-N 编号；用这个工具按行号分页查看完整输出，或用正则搜索其中的行",
+    args_schema=ReadOutputInput
+)
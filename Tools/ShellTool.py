@@ -1,29 +1,21 @@
 import warnings
 warnings.filterwarnings("ignore")
 
-from langchain_community.utilities import SerpAPIWrapper
-from langchain.tools import Tool
-from .NetworkSecurityTool import cve_search_tool
-from .shell import shell_tool  # 导入 Shell 工具
-from .InstallTool import install_tool  # 导入安装工具
-from .PythonScriptTool import python_script_tool  
-from .NmapTool import nmap_tool  # 导入 Nmap 工具
-from .search_tool import search_tool
-from .Google_Search import google_search_tool
-from .HTTPRequestTool import http_request_tool  # 导入新的 HTTP 请求工具
-from .Builde_Server import build_server_tool
-from .Creat_File import create_file_tool
-# 定义可用的工具列表
-tools = [
-    #search_tool,
-    #cve_search_tool,
-    shell_tool,  
-    install_tool,
-    #python_script_tool,
-    nmap_tool,
-    google_search_tool,
-    http_request_tool,
-    build_server_tool,
-    create_file_tool,
-    # 可以在此添加更多工具
-]
+from ..Utils.ToolRegistry import ToolRegistry
+
+# 定义可用的工具：只登记名称和所在模块，工具模块（以及 requests、SerpAPI 等依赖）在第一次用到时才导入
+tools = ToolRegistry(package=__package__)
+# metadata 与工具定义中的一致，AutoGPT 据此决定是否启用提前执行和后台任务，不必导入工具
+#tools.register_lazy("Search", ".search_tool", "search_tool", metadata={"speculative": True})
+#tools.register_lazy("CVE Search", ".NetworkSecurityTool", "cve_search_tool", metadata={"speculative": True})
+tools.register_lazy("Shell", ".shell", "shell_tool", metadata={"background": True})  # Shell 工具
+tools.register_lazy("InstallTool", ".InstallTool", "install_tool", metadata={"background": True})  # 安装工具
+#tools.register_lazy("PythonScript", ".PythonScriptTool", "python_script_tool")
+tools.register_lazy("NmapScan", ".NmapTool", "nmap_tool", metadata={"speculative": True, "background": True})  # Nmap 工具
+tools.register_lazy("google_search", ".Google_Search", "google_search_tool", metadata={"speculative": True})
+tools.register_lazy("Send HTTP Request", ".HTTPRequestTool", "http_request_tool")  # HTTP 请求工具
+tools.register_lazy("build_server", ".Builde_Server", "build_server_tool")
+tools.register_lazy("stop_server", ".Builde_Server", "stop_server_tool")
+tools.register_lazy("list_servers", ".Builde_Server", "list_servers_tool")
+tools.register_lazy("create_file", ".Creat_File", "create_file_tool")
+# 可以在此添加更多工具
@@ -9,7 +9,8 @@ if serpapi_api_key:
     search_tool = Tool.from_function(
         func=search.run,
         name="Search",
-        description="Used to search for information on the Internet through search engines"
+        description="Used to search for information on the Internet through search engines",
+        metadata={"speculative": True},
     )
 else:
     def unavailable_search(query: str) -> str:
@@ -1,80 +1,58 @@
-import subprocess
 from langchain.tools import StructuredTool
 from pydantic.v1 import BaseModel, Field
-import threading
-import queue
-import time
+from ..Utils.ProcessUtils import arun_process, describe_limits, run_process, shell_argv
+
+# 单条命令允许运行的秒数，以及每个输出流最多保留的字节数；超出时结束整个进程组，避免失控的命令耗尽内存
+SHELL_TIMEOUT = 300
+SHELL_MAX_OUTPUT_BYTES = 1024 * 1024
 
 class ShellInput(BaseModel):
     command: str = Field(description="要执行的 Shell 命令")
 
+def _format_shell_result(result) -> str:
+    output, error = result.stdout, result.stderr
+    if output.strip():
+        text = output.decode(errors='ignore').strip()
+    elif error.strip():
+        text = f"命令执行错误：{error.decode(errors='ignore').strip()}"
+    else:
+        text = "命令执行完成，但没有输出。"
+    notes = describe_limits(result, SHELL_TIMEOUT, SHELL_MAX_OUTPUT_BYTES)
+    return f"{text}\n{notes}" if notes else text
+
 def run_shell_command(command: str) -> str:
     """执行一般的 Shell 命令，实时返回输出"""
     try:
-        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=1)
-
-        output_queue = queue.Queue()
-        error_queue = queue.Queue()
-
-        # 定义线程函数来读取输出
-        def read_output(pipe, queue):
-            while True:
-                chunk = pipe.read(1024)
-                if not chunk:
-                    break
-                queue.put(chunk)
-            pipe.close()
-
-        # 创建线程读取 stdout 和 stderr
-        stdout_thread = threading.Thread(target=read_output, args=(process.stdout, output_queue))
-        stderr_thread = threading.Thread(target=read_output, args=(process.stderr, error_queue))
-
-        stdout_thread.start()
-        stderr_thread.start()
+        result = run_process(
+            shell_argv(command),
+            timeout=SHELL_TIMEOUT,
+            max_output_bytes=SHELL_MAX_OUTPUT_BYTES,
+        )
+        return _format_shell_result(result)
 
-        # 实时收集输出
-        output = b''
-        error = b''
-        while True:
-            try:
-                chunk = output_queue.get_nowait()
-                output += chunk
-                print(chunk.decode(errors='ignore'), end='')  # 实时打印输出
-            except queue.Empty:
-                pass
-
-            try:
-                chunk = error_queue.get_nowait()
-                error += chunk
-                print(chunk.decode(errors='ignore'), end='')  # 实时打印错误
-            except queue.Empty:
-                pass
-
-            if process.poll() is not None and output_queue.empty() and error_queue.empty():
-                break
-
-            time.sleep(0.1)  # 避免占用过多 CPU
+    except Exception as e:
+        return f"命令执行过程中发生异常：{str(e)}"
 
-        # 等待线程结束
-        stdout_thread.join()
-        stderr_thread.join()
 
-        if output.strip():
-            return output.decode(errors='ignore').strip()
-        elif error.strip():
-            return f"命令执行错误：{error.decode(errors='ignore').strip()}"
-        else:
-            return "命令执行完成，但没有输出。"
+async def arun_shell_command(command: str) -> str:
+    """run_shell_command 的异步版本，基于 asyncio 子进程，不阻塞事件循环"""
+    try:
+        result = await arun_process(
+            shell_argv(command),
+            timeout=SHELL_TIMEOUT,
+            max_output_bytes=SHELL_MAX_OUTPUT_BYTES,
+        )
+        return _format_shell_result(result)
 
-    except subprocess.CalledProcessError as e:
-        return f"命令执行失败：{e.stderr.strip()}"
     except Exception as e:
         return f"命令执行过程中发生异常：{str(e)}"
 
 
 shell_tool = StructuredTool.from_function(
     func=run_shell_command,
+    coroutine=arun_shell_command,
     name="Shell",
     description="用于执行Shell 命令",
-    args_schema=ShellInput
+    args_schema=ShellInput,
+    metadata={"background": True},  # 长时间运行的命令可以通过 StartJob 放到后台
 )
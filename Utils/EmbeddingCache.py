@@ -0,0 +1,128 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def _as_float32(vectors):
+    # 统一按 float32 保存和返回，保证命中内存缓存、磁盘缓存和首次计算时拿到的向量完全一致
+    return np.asarray(vectors, dtype="float32").tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    给任意嵌入模型加一层按内容哈希的缓存：
+    - 内存中是容量为 max_entries 的 LRU
+    - 提供 cache_path 时再加一层 SQLite 磁盘缓存，进程重启后仍然有效
+    键由模型名、文档/查询类型和文本内容的 sha256 组成，相同文本不会重复请求嵌入接口。
+    """
+
+    def __init__(self, underlying: Embeddings, max_entries: int = 4096, cache_path: Optional[str] = None):
+        self.underlying = underlying
+        self.max_entries = max_entries
+        self.namespace = str(getattr(underlying, "model", None) or type(underlying).__name__)
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if cache_path is not None:
+            self._db = sqlite3.connect(cache_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._db.commit()
+
+    def cache_info(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._memory)}
+
+    def _key(self, kind, text):
+        return hashlib.sha256(f"{self.namespace}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _get(self, key):
+        # 调用方需持有 self._lock
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            return vector
+        if self._db is not None:
+            row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                vector = np.frombuffer(row[0], dtype="float32").tolist()
+                self._remember(key, vector)
+                return vector
+        return None
+
+    def _remember(self, key, vector):
+        # 调用方需持有 self._lock
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _put(self, items):
+        with self._lock:
+            for key, vector in items:
+                self._remember(key, vector)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, np.asarray(vector, dtype="float32").tobytes()) for key, vector in items],
+                )
+                self._db.commit()
+
+    def _lookup(self, kind, texts):
+        """返回 (每个文本的 key, 已命中的向量, 未命中的文本下标)"""
+        keys = [self._key(kind, text) for text in texts]
+        found = {}
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._get(key)
+                if vector is None:
+                    missing.append(i)
+                else:
+                    found[i] = vector
+            self.hits += len(found)
+            self.misses += len(missing)
+        return keys, found, missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup("document", texts)
+        if missing:
+            # 同一批里重复的文本只请求一次
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            vectors = dict(zip(unique, _as_float32(self.underlying.embed_documents(unique))))
+            self._put([(keys[i], vectors[texts[i]]) for i in missing])
+            for i in missing:
+                found[i] = vectors[texts[i]]
+        return [found[i] for i in range(len(texts))]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup("document", texts)
+        if missing:
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            vectors = dict(zip(unique, _as_float32(await self.underlying.aembed_documents(unique))))
+            self._put([(keys[i], vectors[texts[i]]) for i in missing])
+            for i in missing:
+                found[i] = vectors[texts[i]]
+        return [found[i] for i in range(len(texts))]
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, found, missing = self._lookup("query", [text])
+        if missing:
+            vector = _as_float32([self.underlying.embed_query(text)])[0]
+            self._put([(keys[0], vector)])
+            return vector
+        return found[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, found, missing = self._lookup("query", [text])
+        if missing:
+            vector = _as_float32([await self.underlying.aembed_query(text)])[0]
+            self._put([(keys[0], vector)])
+            return vector
+        return found[0]
@@ -1,4 +1,7 @@
+import hashlib
 import os
+import stat
+import uuid
 
 def load_file(file_path, file_name):
     full_path = os.path.join(file_path, file_name)
@@ -10,4 +13,41 @@ def load_file(file_path, file_name):
         raise
     except Exception as e:
         print(f"读取文件时发生错误：{e}")
-        raise
\ No newline at end of file
+        raise
+
+
+def file_digest(path):
+    """文件内容的 sha256，文件不存在时返回 None"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def atomic_write_text(path, content, encoding='utf-8'):
+    """
+    先写同目录下的临时文件再 os.replace 到目标路径：读者要么看到旧文件，要么看到完整的新文件。
+    目标文件已存在时保留它的权限位（例如脚本的可执行权限），新文件的权限和直接 open 创建的一样。
+    """
+    tmp_path = os.path.join(
+        os.path.dirname(os.path.abspath(path)), f".{os.path.basename(path)}.{uuid.uuid4().hex[:8]}.tmp"
+    )
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, 'w', encoding=encoding, newline='') as file:
+            file.write(content)
+        try:
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
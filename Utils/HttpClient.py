@@ -0,0 +1,181 @@
+import html
+import json
+import re
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from typing import Dict, List, NamedTuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 连接池：最多为 HTTP_POOL_HOSTS 个主机保留连接，每个主机同时最多 HTTP_MAX_PER_HOST 个连接，
+# 超出时等待空闲连接而不是新建，避免并行的工具调用对同一目标建立过多连接
+HTTP_POOL_HOSTS = 32
+HTTP_MAX_PER_HOST = 4
+DEFAULT_TIMEOUT = 10
+# 响应体最多读取的字节数；二进制内容只读开头一小段用于识别
+DEFAULT_MAX_BYTES = 256 * 1024
+BINARY_SNIFF_BYTES = 512
+CHUNK_SIZE = 16 * 1024
+
+_TEXT_TYPES = ("text/", "application/json", "application/xml", "application/javascript",
+               "application/x-www-form-urlencoded", "+json", "+xml")
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    进程内共享的 requests.Session：复用 TCP 连接和 TLS 会话（keep-alive），按主机限制连接数。
+    不保存 Cookie，和每次单独调用 requests.request 一样，不同目标、不同工具之间不会互相带上 Cookie。
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_HOSTS,
+                    pool_maxsize=HTTP_MAX_PER_HOST,
+                    pool_block=True,
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                _session = session
+    return _session
+
+
+class HttpResponse(NamedTuple):
+    status_code: int
+    reason: str
+    url: str
+    headers: Dict[str, str]
+    content_type: str  # 不含参数的 MIME 类型，例如 text/html
+    encoding: str
+    body: bytes  # 最多 max_bytes 字节；二进制内容只有开头一小段
+    truncated: bool  # 响应体没有读完
+
+    @property
+    def is_text(self) -> bool:
+        return is_text_type(self.content_type)
+
+    @property
+    def text(self) -> str:
+        return self.body.decode(self.encoding or "utf-8", errors="replace")
+
+    def json(self):
+        """解析 JSON 响应体；响应被截断时解析会失败，抛出 ValueError"""
+        if self.truncated:
+            raise ValueError(f"响应体超过 {len(self.body)} 字节，已截断，无法解析 JSON")
+        return json.loads(self.text)
+
+
+def is_text_type(content_type: str) -> bool:
+    # 没有 Content-Type 时按文本处理，由 summarize_body 再根据内容判断
+    return not content_type or any(marker in content_type for marker in _TEXT_TYPES)
+
+
+def fetch(method: str, url: str, max_bytes: int = DEFAULT_MAX_BYTES, timeout=DEFAULT_TIMEOUT, **kwargs) -> HttpResponse:
+    """
+    通过共享连接池发送请求，流式读取响应体：文本最多读 max_bytes 字节，二进制只读 BINARY_SNIFF_BYTES 字节，
+    超出部分不进入内存。其余参数（headers、data、params 等）原样交给 requests。网络错误以 requests 的异常抛出。
+    """
+    with get_session().request(method, url, timeout=timeout, stream=True, **kwargs) as response:
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        limit = max_bytes if is_text_type(content_type) else min(max_bytes, BINARY_SNIFF_BYTES)
+        body = bytearray()
+        truncated = False
+        for chunk in response.iter_content(CHUNK_SIZE):
+            body += chunk
+            if len(body) > limit:
+                del body[limit:]
+                truncated = True
+                break
+        return HttpResponse(
+            status_code=response.status_code,
+            reason=response.reason or "",
+            url=response.url,
+            headers=dict(response.headers),
+            content_type=content_type,
+            encoding=requests.utils.get_encoding_from_headers(response.headers) or "utf-8",
+            body=bytes(body),
+            truncated=truncated,
+        )
+
+
+def _clip(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return text[:limit] + f"\n...（还有 {len(text) - limit} 个字符未显示）"
+
+
+_HTML_COMMENT = re.compile(r"<!--(.*?)-->", re.S)
+_HTML_TITLE = re.compile(r"<title[^>]*>(.*?)</title\s*>", re.S | re.I)
+_HTML_FORM = re.compile(r"<form\b([^>]*)>(.*?)</form\s*>", re.S | re.I)
+_HTML_ATTR = re.compile(r"""\b(action|method|name|type)\s*=\s*["']?([^"'\s>]*)""", re.I)
+_HTML_INPUT = re.compile(r"<(?:input|select|textarea)\b([^>]*)>", re.I)
+_HTML_META_GENERATOR = re.compile(r"""<meta[^>]+name=["']generator["'][^>]*content=["']([^"']+)""", re.I)
+_HTML_SCRIPT_SRC = re.compile(r"""<script\b[^>]*\bsrc\s*=\s*["']?([^"'\s>]+)""", re.I)
+
+
+def _attrs(text: str) -> dict:
+    return {name.lower(): value for name, value in _HTML_ATTR.findall(text)}
+
+
+def _html_overview(text: str) -> List[str]:
+    # 页面标题、生成器、表单、外部脚本和注释对渗透测试最有用，放在源码前面；
+    # 源码本身完整保留，脚本、链接和属性都在里面，过长时由 ObservationPipeline 压缩并保存原文
+    lines = []
+    title = _HTML_TITLE.search(text)
+    if title:
+        lines.append(f"标题: {html.unescape(title.group(1)).strip()}")
+    generator = _HTML_META_GENERATOR.search(text)
+    if generator:
+        lines.append(f"生成器: {generator.group(1)}")
+    for attributes, body in _HTML_FORM.findall(text)[:10]:
+        form = _attrs(attributes)
+        fields = [
+            f"{field.get('name', '?')}({field.get('type', 'text')})"
+            for field in (_attrs(item) for item in _HTML_INPUT.findall(body))
+        ]
+        lines.append(
+            f"表单: {form.get('method', 'GET').upper()} {form.get('action', '') or '(当前页面)'} 字段: {', '.join(fields) or '无'}"
+        )
+    scripts = list(dict.fromkeys(_HTML_SCRIPT_SRC.findall(text)))
+    if scripts:
+        lines.append("脚本: " + ", ".join(scripts[:20]))
+    comments = [comment.strip() for comment in _HTML_COMMENT.findall(text) if comment.strip()]
+    if comments:
+        lines.append("注释: " + " | ".join(_clip(comment, 200) for comment in comments[:10]))
+    return lines
+
+
+def summarize_body(response: HttpResponse, limit: Optional[int] = None) -> str:
+    """
+    响应体写进观察结果的文本。文本内容原样给出（最多 fetch 读取的 max_bytes 字节）：JSON 格式化，
+    HTML 在源码前列出标题、表单、外部脚本和注释；过长时由 ObservationPipeline 压缩，完整内容可以用 ReadOutput 查看。
+    二进制内容只给出类型、大小和开头几个字节的十六进制。limit 不为 None 时按字符数截断。
+    """
+    notes = []
+    if response.truncated:
+        notes.append(f"（响应体超过 {len(response.body)} 字节，只读取了开头部分）")
+    if not response.is_text or b"\x00" in response.body[:BINARY_SNIFF_BYTES]:
+        size = response.headers.get("Content-Length", "未知")
+        return (
+            f"二进制内容（{response.content_type or '未知类型'}，{size} 字节），"
+            f"开头: {response.body[:16].hex(' ')}"
+        )
+    text = response.text
+    content_type = response.content_type
+    if "json" in content_type and not response.truncated:
+        try:
+            text = json.dumps(json.loads(text), ensure_ascii=False, indent=1)
+        except ValueError:
+            pass
+    elif "html" in content_type or (not content_type and text.lstrip()[:15].lower().startswith(("<!doctype html", "<html"))):
+        text = "\n".join([*_html_overview(text), "源码:", text])
+    if limit is not None:
+        text = _clip(text, limit)
+    return "\n".join([text, *notes])
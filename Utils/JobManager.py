@@ -0,0 +1,228 @@
+import asyncio
+import contextvars
+import json
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .Metrics import Metrics
+from .ProcessUtils import ProcessLimits, set_process_limits
+from .ThoughtAndAction import Action
+
+# 工具 metadata 中的这个键为 True 时，模型可以通过 StartJob 把它放到后台执行（运行时间长的工具）
+BACKGROUND_METADATA_KEY = "background"
+
+# 默认的后台任务限制：同时运行的数量、一次任务里最多创建的数量、每个任务保留的输出字节数
+DEFAULT_MAX_RUNNING_JOBS = 4
+DEFAULT_MAX_JOBS = 32
+DEFAULT_JOB_BUFFER_BYTES = 64 * 1024
+# 后台任务里的子进程默认调低优先级，并限制地址空间，避免扫描拖慢 agent 本身
+DEFAULT_JOB_LIMITS = ProcessLimits(memory_bytes=4 * 1024 * 1024 * 1024, nice=5)
+
+
+def is_background_tool(tool) -> bool:
+    return bool((getattr(tool, "metadata", None) or {}).get(BACKGROUND_METADATA_KEY))
+
+
+class OutputRing:
+    """固定容量的输出缓冲：只保留最后 capacity 个字节左右的文本，记录被丢弃的字节数"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.size = 0
+        self.dropped = 0
+        self._chunks = deque()
+
+    def append(self, text: str):
+        if not text:
+            return
+        self._chunks.append(text)
+        self.size += len(text)
+        while self.size > self.capacity and self._chunks:
+            excess = self.size - self.capacity
+            head = self._chunks[0]
+            if len(head) <= excess:
+                self._chunks.popleft()
+                self.size -= len(head)
+                self.dropped += len(head)
+            else:
+                self._chunks[0] = head[excess:]
+                self.size -= excess
+                self.dropped += excess
+
+    def tail(self, lines: int) -> str:
+        text = "".join(self._chunks)
+        return "\n".join(text.splitlines()[-lines:]) if lines > 0 else ""
+
+    @property
+    def total(self) -> int:
+        return self.size + self.dropped
+
+
+class JobOutputSink:
+    """与 ToolOutputSink 接口相同的输出去向，把后台任务的输出写进它的环形缓冲，不进入事件队列"""
+
+    def __init__(self, ring: OutputRing):
+        self.ring = ring
+        self.closed = False
+
+    def write(self, chunk, stream="stdout"):
+        if self.closed:
+            return
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode(errors="ignore")
+        self.ring.append(chunk)
+
+    async def awrite(self, chunk, stream="stdout"):
+        self.write(chunk, stream)
+
+
+class Job:
+    def __init__(self, job_id: str, action: Action, buffer_bytes: int):
+        self.id = job_id
+        self.action = action
+        self.output = OutputRing(buffer_bytes)
+        self.status = "queued"  # queued、running、done、failed、cancelled
+        self.result: Optional[str] = None
+        self.created_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Future] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def describe(self, tail_lines: int = 0) -> str:
+        """给模型看的任务状态：一行概要，结束时附上结果，否则附上最后几行输出"""
+        args = json.dumps(self.action.args, ensure_ascii=False)
+        lines = [
+            f"{self.id} [{self.status}] {self.action.name} {args}，"
+            f"已运行 {self.elapsed():.0f} 秒，输出 {self.output.total} 字节"
+        ]
+        if self.finished and self.result is not None:
+            lines.append(self.result)
+        elif tail_lines:
+            tail = self.output.tail(tail_lines)
+            if tail:
+                lines.append(f"最后 {tail_lines} 行输出：\n{tail}")
+        return "\n".join(lines)
+
+
+class JobManager:
+    """
+    一次任务中的后台任务：StartJob 立即返回任务编号，工具在后台运行，
+    模型可以继续思考或执行其他动作，之后再查询、查看输出、等待或取消。
+    - 同时运行的任务数不超过 max_running，其余排队
+    - 每个任务的输出写入容量为 buffer_bytes 的环形缓冲
+    - 任务中启动的子进程遵守 limits（CPU 时间、内存、优先级）
+    任务结束（aclose）时仍在运行的后台任务全部取消。
+    """
+
+    def __init__(
+        self,
+        run_action: Callable[[Action, JobOutputSink], Awaitable[str]],
+        find_tool: Callable[[str], object],
+        max_running: int = DEFAULT_MAX_RUNNING_JOBS,
+        max_jobs: int = DEFAULT_MAX_JOBS,
+        buffer_bytes: int = DEFAULT_JOB_BUFFER_BYTES,
+        limits: Optional[ProcessLimits] = DEFAULT_JOB_LIMITS,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.run_action = run_action
+        self.find_tool = find_tool
+        self.max_jobs = max_jobs
+        self.buffer_bytes = buffer_bytes
+        self.limits = limits
+        self.metrics = metrics or Metrics()
+        self._slots = asyncio.Semaphore(max(1, max_running))
+        self._jobs: Dict[str, Job] = {}
+        self._counter = 0  # 只增不减的编号，任务记录被清理后编号也不会重复
+
+    def start(self, tool_name: str, args: dict) -> Job:
+        """在后台开始执行工具，参数不合法时抛出 ValueError"""
+        tool = self.find_tool(tool_name)
+        if tool is None:
+            raise ValueError(f"找不到工具 '{tool_name}'")
+        if not is_background_tool(tool):
+            raise ValueError(f"工具 '{tool.name}' 不支持在后台执行，请直接调用")
+        if self._counter >= self.max_jobs:
+            raise ValueError(f"本次任务最多创建 {self.max_jobs} 个后台任务")
+        self._counter += 1
+        job = Job(f"job-{self._counter}", Action(name=tool.name, args=args or {}), self.buffer_bytes)
+        self._jobs[job.id] = job
+        # Task 创建时复制当前上下文，_run 里设置的资源限制只作用于这个任务启动的子进程
+        job.task = asyncio.ensure_future(self._run(job))
+        self.metrics.inc("jobs_started_total", tool=tool.name)
+        return job
+
+    async def _run(self, job: Job):
+        sink = JobOutputSink(job.output)
+        try:
+            async with self._slots:
+                job.status = "running"
+                job.started_at = time.monotonic()
+                set_process_limits(self.limits)
+                job.result = await self.run_action(job.action, sink)
+                job.status = "done"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.result = f"Error: {e}, {type(e).__name__}"
+        finally:
+            sink.closed = True
+            job.finished_at = time.monotonic()
+            self.metrics.inc("jobs_finished_total", tool=job.action.name, status=job.status)
+
+    def get(self, job_id: str) -> Job:
+        job = self._jobs.get(str(job_id).strip())
+        if job is None:
+            known = ", ".join(self._jobs) or "无"
+            raise ValueError(f"没有编号为 '{job_id}' 的后台任务（现有：{known}）")
+        return job
+
+    def jobs(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    async def wait(self, job_id: str, timeout: float) -> Job:
+        """等待任务结束，最多 timeout 秒；超时时任务继续在后台运行"""
+        job = self.get(job_id)
+        if not job.finished:
+            await asyncio.wait({job.task}, timeout=timeout)
+        return job
+
+    async def cancel(self, job_id: str) -> Job:
+        job = self.get(job_id)
+        if not job.finished:
+            job.task.cancel()
+            await asyncio.gather(job.task, return_exceptions=True)
+            job.status = "cancelled"  # 还没开始运行就被取消时 _run 不会执行
+        return job
+
+    async def aclose(self):
+        """取消所有还没结束的后台任务，它们的子进程随之结束"""
+        pending = [job for job in self._jobs.values() if not job.finished]
+        for job in pending:
+            job.task.cancel()
+        await asyncio.gather(*(job.task for job in pending), return_exceptions=True)
+        for job in pending:
+            job.status = "cancelled"
+
+
+# 当前动作所在任务的后台任务管理器，由 AutoGPT 在执行动作前设置，供 StartJob 等工具使用
+_job_manager: contextvars.ContextVar[Optional[JobManager]] = contextvars.ContextVar("job_manager", default=None)
+
+
+def set_job_manager(manager: Optional[JobManager]):
+    return _job_manager.set(manager)
+
+
+def get_job_manager() -> Optional[JobManager]:
+    return _job_manager.get()
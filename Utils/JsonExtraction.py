@@ -0,0 +1,268 @@
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.outputs import Generation
+
+# 扫描括号时把字符串整体跳过，字符串里的括号不参与配对
+_BRACKET_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|[{}\[\]]', re.S)
+# 修复时的词法单元：双引号字符串、单引号字符串、结构符号、其他连续文本、落单的引号（未闭合的字符串）
+_REPAIR_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|[{}\[\],:]|[^"\'{}\[\],:]+|["\']', re.S)
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_PYTHON_LITERAL_PATTERN = re.compile(r"\b(True|False|None)\b")
+_OPENERS = {"}": "{", "]": "["}
+# 最多尝试多少个 '{' 作为起点，避免在大段说明文字里反复扫描
+MAX_CANDIDATES = 8
+
+
+def _balanced_end(text: str, start: int) -> Optional[int]:
+    """从 start 处的 '{' 开始，返回与之配对的 '}' 之后的位置；没有闭合时返回 None"""
+    depth = 0
+    for match in _BRACKET_TOKEN.finditer(text, start):
+        token = match.group()
+        if token in "{[":
+            depth += 1
+        elif token in "}]":
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    return None
+
+
+def extract_json_object(text: str) -> Optional[str]:
+    """
+    从回复中取出第一个括号配对完整的 JSON 对象，忽略前后的说明文字和 ``` 代码块标记。
+    没有完整对象时返回从第一个 '{' 到结尾的部分（可能被截断），完全没有 '{' 时返回 None。
+    """
+    first = text.find("{")
+    if first < 0:
+        return None
+    start = first
+    for _ in range(MAX_CANDIDATES):
+        end = _balanced_end(text, start)
+        if end is None:
+            return text[start:]  # 从这里开始的对象被截断了
+        candidate = text[start:end]
+        # 说明文字里也可能出现 {xxx}，只有至少包含一个键值对的才认为是 JSON 对象
+        if ":" in candidate:
+            return candidate
+        start = text.find("{", start + 1)
+        if start < 0:
+            break
+    return text[first:]
+
+
+def _convert_single_quoted(token: str) -> str:
+    inner = token[1:-1].replace("\\'", "'")
+    inner = re.sub(r'(?<!\\)"', '\\"', inner)
+    return f'"{inner}"'
+
+
+def repair_json(text: str) -> str:
+    """
+    修复常见的 JSON 格式问题：
+    - 单引号字符串改为双引号
+    - Python 的 True / False / None 改为 JSON 的 true / false / null
+    - 去掉 } 和 ] 前多余的逗号
+    未闭合的字符串、括号不配对的输出（例如达到 max tokens 被截断的回复）不做补全，抛出 ValueError：
+    补全之后截断的命令也能通过解析并被执行，应该让模型重新回复。
+    """
+    output: List[str] = []
+    stack: List[str] = []
+
+    def drop_trailing_comma():
+        while output and not output[-1].strip():
+            output.pop()
+        if output and output[-1] == ",":
+            output.pop()
+
+    for match in _REPAIR_TOKEN.finditer(text):
+        token = match.group()
+        first = token[0]
+        if first == '"' and len(token) > 1:
+            output.append(token)
+        elif first == "'" and len(token) > 1:
+            output.append(_convert_single_quoted(token))
+        elif token in ('"', "'"):
+            raise ValueError("JSON 中有未闭合的字符串，回复可能被截断")
+        elif token in "{[":
+            stack.append(token)
+            output.append(token)
+        elif token in "}]":
+            if not stack or stack.pop() != _OPENERS[token]:
+                raise ValueError(f"JSON 中的括号不配对：多余的 '{token}'")
+            drop_trailing_comma()
+            output.append(token)
+        elif token in ",:":
+            output.append(token)
+        else:
+            output.append(_PYTHON_LITERAL_PATTERN.sub(lambda m: _PYTHON_LITERALS[m.group()], token))
+
+    if stack:
+        raise ValueError(f"JSON 中有 {len(stack)} 个括号没有闭合，回复可能被截断")
+    return "".join(output)
+
+
+def loads_tolerant(text: str) -> Any:
+    """提取并解析回复中的 JSON 对象；直接解析失败时先修复再解析，仍然失败时抛出 ValueError"""
+    stripped = text.strip()
+    if stripped.startswith("{") and stripped.endswith("}"):
+        # 大多数回复本身就是合法的 JSON，先直接解析，省掉提取和修复
+        try:
+            return json.loads(stripped, strict=False)
+        except json.JSONDecodeError:
+            pass
+    candidate = extract_json_object(text)
+    if candidate is None:
+        raise ValueError("回复中没有 JSON 对象")
+    try:
+        return json.loads(candidate, strict=False)  # strict=False 允许字符串里出现未转义的换行
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(repair_json(candidate), strict=False)
+    except json.JSONDecodeError as e:  # repair_json 拒绝修复时抛出的 ValueError 原样向上传递
+        raise ValueError(f"无法解析回复中的 JSON：{e}") from e
+
+
+class IncrementalJsonParser:
+    """
+    增量解析流式输出的 JSON 对象：每喂入一段文本，返回这段文本里刚刚完整结束的顶层字段名。
+    字段结束后即可通过 value() 取值，不必等整个回复生成完，例如 action 比 thought.speak 先结束时可以提前拿到。
+    每个字符只扫描一次。
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.started = False
+        self.done = False
+        self.completed: Dict[str, str] = {}  # 顶层字段名 -> 原始 JSON 文本
+        self._start = 0
+        self._depth = 0
+        self._quote = None
+        self._escape = False
+        self._expect = "key"  # key / value
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self._value_kind = None  # string / composite / primitive
+
+    def feed(self, chunk: str) -> List[str]:
+        finished = []
+        offset = len(self.buffer)
+        self.buffer += chunk
+        if self.done:
+            return finished
+        for i in range(offset, len(self.buffer)):
+            ch = self.buffer[i]
+            if not self.started:
+                if ch == "{":
+                    self.started = True
+                    self._start = i
+                    self._depth = 1
+                continue
+            if self._quote is not None:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == self._quote:
+                    self._quote = None
+                    self._on_string_end(i, finished)
+                continue
+            if ch in "\"'":
+                self._quote = ch
+                if self._depth == 1:
+                    if self._expect == "key":
+                        self._key_start = i
+                    elif self._value_start is None:
+                        self._value_start, self._value_kind = i, "string"
+            elif ch == ":" and self._depth == 1:
+                self._expect = "value"
+                self._value_start = None
+            elif ch in "{[":
+                if self._depth == 1 and self._expect == "value" and self._value_start is None:
+                    self._value_start, self._value_kind = i, "composite"
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._value_kind == "composite":
+                    self._complete(self.buffer[self._value_start:i + 1], finished)
+                elif self._depth == 0:
+                    if self._value_kind == "primitive":
+                        self._complete(self.buffer[self._value_start:i].strip(), finished)
+                    self.done = True
+                    break
+            elif ch == "," and self._depth == 1:
+                if self._value_kind == "primitive":
+                    self._complete(self.buffer[self._value_start:i].strip(), finished)
+                self._expect = "key"
+            elif (
+                self._depth == 1
+                and self._expect == "value"
+                and self._value_start is None
+                and not ch.isspace()
+            ):
+                self._value_start, self._value_kind = i, "primitive"
+        return finished
+
+    def _on_string_end(self, i, finished):
+        if self._depth != 1:
+            return
+        if self._expect == "key" and self._key_start is not None:
+            self._key = self.buffer[self._key_start + 1:i]
+            self._key_start = None
+        elif self._value_kind == "string":
+            self._complete(self.buffer[self._value_start:i + 1], finished)
+
+    def _complete(self, raw, finished):
+        if self._key is not None:
+            self.completed[self._key] = raw
+            finished.append(self._key)
+        self._key = None
+        self._value_start = None
+        self._value_kind = None
+        self._expect = "after_value"
+
+    def value(self, key: str) -> Any:
+        raw = self.completed[key]
+        try:
+            return json.loads(raw, strict=False)
+        except json.JSONDecodeError:
+            return json.loads(repair_json(raw), strict=False)
+
+    @property
+    def text(self) -> str:
+        """目前为止收到的 JSON 对象文本（去掉了前面的说明文字）"""
+        return self.buffer[self._start:] if self.started else ""
+
+
+class TolerantPydanticOutputParser(PydanticOutputParser):
+    """
+    PydanticOutputParser 的容错版本：先从回复中提取第一个完整的 JSON 对象并修复常见格式问题，再做 pydantic 校验。
+    校验失败时抛出 OutputParserException，llm_output 中保留原始回复。
+    """
+
+    def parse_result(self, result: List[Generation], *, partial: bool = False):
+        text = result[0].text
+        try:
+            obj = loads_tolerant(text)
+        except ValueError as e:
+            if partial:
+                return None
+            raise OutputParserException(str(e), llm_output=text) from e
+        if not isinstance(obj, dict):
+            if partial:
+                return None
+            raise OutputParserException("回复中的 JSON 不是对象", llm_output=text)
+        try:
+            return self._parse_obj(obj)
+        except OutputParserException:
+            if partial:
+                return None
+            raise
+
+    def parse(self, text: str):
+        return self.parse_result([Generation(text=text)])
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import warnings
+from typing import Any, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+# 缓存模式：
+# - auto：命中直接返回，未命中调用模型并写入缓存
+# - record：总是调用模型，并用最新的结果覆盖缓存
+# - replay：只从缓存读取，未命中时抛出 CacheMissError，保证离线、确定性的重放
+# - off：不读也不写
+CACHE_MODES = ("auto", "record", "replay", "off")
+
+
+class CacheMissError(KeyError):
+    """replay 模式下请求的 prompt 没有录制过"""
+
+
+class ResponseCache(BaseCache):
+    """
+    以 SQLite 文件保存的 LLM 响应缓存，通过 llm.cache 或 ChatOpenAI(cache=...) 挂到模型上。
+    键是完整渲染后的 prompt 加上模型参数（langchain 生成的 llm_string，包含模型名、温度等）的 sha256，
+    超过 max_entries 条或 max_bytes 字节时按最近使用时间淘汰。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: str = "auto",
+        max_entries: Optional[int] = 10000,
+        max_bytes: Optional[int] = 256 * 1024 * 1024,
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"未知的缓存模式 {mode!r}，可选：{', '.join(CACHE_MODES)}")
+        self.path = path
+        self.mode = mode
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._db.commit()
+
+    def cache_info(self) -> dict:
+        with self._lock:
+            count, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            return {"mode": self.mode, "hits": self.hits, "misses": self.misses, "size": count, "bytes": size}
+
+    def _key(self, prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if self.mode in ("off", "record"):
+            return None
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            row = self._db.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._db.commit()
+        if row is None:
+            if self.mode == "replay":
+                raise CacheMissError(f"replay 模式下没有找到录制的响应（key={key[:12]}）")
+            return None
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # langchain 的反序列化接口会给出 beta 警告
+            return [loads(item) for item in json.loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self.mode in ("off", "replay"):
+            return
+        value = json.dumps([dumps(generation) for generation in return_val], ensure_ascii=False)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (self._key(prompt, llm_string), value, len(value.encode("utf-8")), time.time()),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        # 调用方需持有 self._lock
+        count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        over_entries = count - self.max_entries if self.max_entries else 0
+        over_bytes = size - self.max_bytes if self.max_bytes else 0
+        if over_entries <= 0 and over_bytes <= 0:
+            return
+        victims = []
+        for key, item_size in self._db.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if over_entries <= 0 and over_bytes <= 0:
+                break
+            victims.append((key,))
+            over_entries -= 1
+            over_bytes -= item_size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        with self._lock:
+            self._db.close()
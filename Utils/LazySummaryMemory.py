@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional
+
+from langchain.memory import ConversationSummaryMemory
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.messages import BaseMessage, get_buffer_string
+from langchain_core.pydantic_v1 import PrivateAttr
+
+from .PromptBudget import count_tokens
+
+
+class LazySummaryMemory(ConversationSummaryMemory):
+    """
+    延迟总结的 ConversationSummaryMemory：
+    - save_context 只记录原始的对话轮次，不调用 LLM
+    - 读取摘要时，或者未总结的内容超过 max_pending_tokens 时，才把积攒的轮次一次性总结进摘要
+    - background 为 True 时，异步路径上超过阈值触发的总结放到后台任务里执行，与下一步的思考并行；
+      读取摘要前会先等待后台总结完成
+    同步接口（save_context / load_memory_variables）和异步接口不要在同一个实例上混用。
+    """
+
+    max_pending_tokens: int = 2000
+    background: bool = False
+    summarized_count: int = 0  # chat_memory 中已经并入摘要的消息条数
+
+    _sync_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _async_lock: Optional[asyncio.Lock] = PrivateAttr(default=None)
+    _background_task: Optional[asyncio.Task] = PrivateAttr(default=None)
+
+    def pending_messages(self) -> List[BaseMessage]:
+        return self.chat_memory.messages[self.summarized_count:]
+
+    def _over_threshold(self) -> bool:
+        pending = self.pending_messages()
+        if not pending:
+            return False
+        text = get_buffer_string(pending, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+        return count_tokens(text) > self.max_pending_tokens
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        BaseChatMemory.save_context(self, inputs, outputs)
+        if self._over_threshold():
+            self.flush()
+
+    def flush(self) -> None:
+        """把尚未总结的轮次合并进摘要，只调用一次 LLM"""
+        with self._sync_lock:
+            end = len(self.chat_memory.messages)
+            pending = self.chat_memory.messages[self.summarized_count:end]
+            if pending:
+                self.buffer = self.predict_new_summary(pending, self.buffer)
+                self.summarized_count = end
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        self.flush()
+        return super().load_memory_variables(inputs)
+
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        await BaseChatMemory.asave_context(self, inputs, outputs)
+        if not self._over_threshold():
+            return
+        if not self.background:
+            await self.aflush()
+        elif self._background_task is None or self._background_task.done():
+            # 后台总结期间新增的轮次会留到下一次触发或读取时再总结
+            self._background_task = asyncio.ensure_future(self.aflush())
+
+    async def aflush(self) -> None:
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            end = len(self.chat_memory.messages)
+            pending = self.chat_memory.messages[self.summarized_count:end]
+            if pending:
+                self.buffer = await self.apredict_new_summary(pending, self.buffer)
+                self.summarized_count = end
+
+    async def aload_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        # 先等待进行中的后台总结（它的异常也在这里抛出），再总结剩下的轮次
+        task, self._background_task = self._background_task, None
+        if task is not None:
+            await task
+        await self.aflush()
+        return super().load_memory_variables(inputs)
+
+    async def aclose(self) -> None:
+        """取消进行中的后台总结，任务提前结束时调用"""
+        task = self._background_task
+        self._background_task = None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def clear(self) -> None:
+        super().clear()
+        self.summarized_count = 0
@@ -0,0 +1,205 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+INDEX_FILE = "index.faiss"
+DB_FILE = "memory.sqlite3"
+
+
+def _read_index_mmap(path):
+    # 优先以内存映射方式只读加载快照，启动耗时与语料规模无关；旧版本 faiss 不支持时退回普通加载
+    for flag_name in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+        flag = getattr(faiss, flag_name, None)
+        if flag is None:
+            continue
+        try:
+            return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            continue
+    return faiss.read_index(path)
+
+
+class PersistentFAISSStore(VectorStore):
+    """
+    持久化到磁盘的 FAISS 向量库，用作长时记忆的后端：
+    - 文本、元数据和原始向量逐条追加写入 SQLite，每次 add_texts 立即落盘
+    - 启动时以内存映射方式加载上一次的压缩快照 (index.faiss)，再把快照之后追加的少量向量放进内存里的增量索引
+    - 增量索引达到 snapshot_every 条时，把快照和增量合并写出新的快照
+    检索时同时查询快照和增量索引并按距离合并；文档内容按需从 SQLite 读取，不在启动时整体加载。
+    """
+
+    def __init__(self, directory: str, embedding: Embeddings, snapshot_every: int = 256):
+        self.directory = directory
+        self.embedding = embedding
+        self.snapshot_every = snapshot_every
+        self._lock = threading.RLock()
+        self.generation = 0  # 每写入一次加一，供调用方判断缓存的检索结果是否过期
+
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, DB_FILE), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id INTEGER PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL, vector BLOB NOT NULL)"
+        )
+        self._db.commit()
+
+        self._base = None  # 内存映射的只读快照
+        self._delta = None  # 快照之后追加的向量
+        self._dimension = None
+        self._load()
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    @classmethod
+    def open(cls, directory: str, embedding: Embeddings, **kwargs: Any) -> "PersistentFAISSStore":
+        return cls(directory, embedding, **kwargs)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        directory: str = "./memory_store",
+        **kwargs: Any,
+    ) -> "PersistentFAISSStore":
+        store = cls(directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
+
+    def _load(self):
+        base_count = 0
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        if os.path.exists(index_path):
+            self._base = _read_index_mmap(index_path)
+            self._dimension = self._base.d
+            base_count = self._base.ntotal
+
+        # 快照之后追加的向量数量受 snapshot_every 限制，这里的回放开销是有上限的
+        rows = self._db.execute(
+            "SELECT vector FROM documents WHERE id >= ? ORDER BY id", (base_count,)
+        ).fetchall()
+        if rows:
+            vectors = np.vstack([np.frombuffer(row[0], dtype="float32") for row in rows])
+            self._ensure_delta(vectors.shape[1])
+            self._delta.add(vectors)
+
+    def _ensure_delta(self, dimension):
+        if self._dimension is None:
+            self._dimension = dimension
+        if dimension != self._dimension:
+            raise ValueError(f"向量维度不一致：索引为 {self._dimension}，新向量为 {dimension}")
+        if self._delta is None:
+            self._delta = faiss.IndexFlatL2(dimension)
+
+    def __len__(self):
+        with self._lock:
+            return self._base_count() + (self._delta.ntotal if self._delta is not None else 0)
+
+    def _base_count(self):
+        return self._base.ntotal if self._base is not None else 0
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.asarray(self.embedding.embed_documents(texts), dtype="float32")
+
+        with self._lock:
+            self._ensure_delta(vectors.shape[1])
+            start = len(self)
+            ids = list(range(start, start + len(texts)))
+            self._db.executemany(
+                "INSERT INTO documents (id, text, metadata, vector) VALUES (?, ?, ?, ?)",
+                [
+                    (i, text, json.dumps(metadata, ensure_ascii=False), vector.tobytes())
+                    for i, text, metadata, vector in zip(ids, texts, metadatas, vectors)
+                ],
+            )
+            self._db.commit()
+            self._delta.add(vectors)
+            self.generation += 1
+            if self._delta.ntotal >= self.snapshot_every:
+                self.compact()
+        return [str(i) for i in ids]
+
+    def compact(self):
+        """把快照和增量索引合并写出新的快照（先写临时文件再原子替换），然后重新以内存映射方式加载"""
+        with self._lock:
+            if self._delta is None or self._delta.ntotal == 0:
+                return
+            merged = faiss.IndexFlatL2(self._dimension)
+            if self._base is not None and self._base.ntotal:
+                merged.add(self._base.reconstruct_n(0, self._base.ntotal))
+            merged.add(self._delta.reconstruct_n(0, self._delta.ntotal))
+
+            index_path = os.path.join(self.directory, INDEX_FILE)
+            tmp_path = index_path + ".tmp"
+            faiss.write_index(merged, tmp_path)
+            os.replace(tmp_path, index_path)
+
+            self._base = _read_index_mmap(index_path)
+            self._delta = faiss.IndexFlatL2(self._dimension)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        query = np.asarray([embedding], dtype="float32")
+        with self._lock:
+            hits = []
+            base_count = self._base_count()
+            if base_count:
+                distances, indices = self._base.search(query, min(k, base_count))
+                hits.extend(zip(distances[0], indices[0]))
+            if self._delta is not None and self._delta.ntotal:
+                distances, indices = self._delta.search(query, min(k, self._delta.ntotal))
+                hits.extend((d, i + base_count) for d, i in zip(distances[0], indices[0]))
+            hits = sorted((float(d), int(i)) for d, i in hits if i >= 0)[:k]
+            if not hits:
+                return []
+
+            placeholders = ",".join("?" for _ in hits)
+            rows = self._db.execute(
+                f"SELECT id, text, metadata FROM documents WHERE id IN ({placeholders})",
+                [i for _, i in hits],
+            ).fetchall()
+        documents = {
+            row[0]: Document(page_content=row[1], metadata=json.loads(row[2])) for row in rows
+        }
+        return [(documents[i], d) for d, i in hits if i in documents]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        if len(self) == 0:
+            return []  # 空库不需要为查询计算嵌入
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
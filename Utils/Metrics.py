@@ -0,0 +1,225 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, Optional
+
+# span 耗时直方图的桶上限（秒），覆盖从模板渲染到长时间扫描的范围
+SPAN_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+METRIC_PREFIX = "autogpt_"
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+
+class MetricsSink:
+    """指标的输出目标：span 结束和计数器增加时各调用一次，实现需要是线程安全的"""
+
+    def on_span(self, name: str, labels: Dict[str, str], duration: float, end_time: float):
+        pass
+
+    def on_counter(self, name: str, labels: Dict[str, str], value: float):
+        pass
+
+    def close(self):
+        pass
+
+
+class MetricsRegistry(MetricsSink):
+    """进程内的聚合：计数器累加，span 耗时记入直方图；可以导出快照或 Prometheus 文本格式"""
+
+    def __init__(self, buckets=SPAN_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, label_key) -> value
+        self._spans = {}  # (name, label_key) -> [count, sum, bucket_counts]
+
+    def on_span(self, name, labels, duration, end_time):
+        key = (name, _label_key(labels))
+        index = bisect_left(self.buckets, duration)
+        with self._lock:
+            entry = self._spans.get(key)
+            if entry is None:
+                entry = self._spans[key] = [0, 0.0, [0] * len(self.buckets)]
+            entry[0] += 1
+            entry[1] += duration
+            if index < len(self.buckets):
+                entry[2][index] += 1
+
+    def on_counter(self, name, labels, value):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def span_totals(self) -> Dict[str, float]:
+        """每种 span 的总耗时（不区分标签）"""
+        totals = {}
+        with self._lock:
+            for (name, _), (count, total, _) in self._spans.items():
+                totals[name] = totals.get(name, 0.0) + total
+        return totals
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(key), "value": value}
+                    for (name, key), value in self._counters.items()
+                ],
+                "spans": [
+                    {"name": name, "labels": dict(key), "count": count, "sum": total}
+                    for (name, key), (count, total, _) in self._spans.items()
+                ],
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._spans.clear()
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式：计数器各自一个 family，span 统一为带 span 标签的直方图"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            spans = sorted((key, (count, total, list(buckets))) for key, (count, total, buckets) in self._spans.items())
+        lines = []
+        family = None
+        for (name, key), value in counters:
+            metric = METRIC_PREFIX + name
+            if metric != family:
+                lines.append(f"# TYPE {metric} counter")
+                family = metric
+            lines.append(f"{metric}{_format_labels(key)} {value}")
+        if spans:
+            metric = METRIC_PREFIX + "span_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for (name, key), (count, total, buckets) in spans:
+                labels = (("span", name),) + key
+                cumulative = 0
+                for bound, bucket in zip(self.buckets, buckets):
+                    cumulative += bucket
+                    lines.append(f"{metric}_bucket{_format_labels(labels, (('le', bound),))} {cumulative}")
+                lines.append(f"{metric}_bucket{_format_labels(labels, (('le', '+Inf'),))} {count}")
+                lines.append(f"{metric}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class JsonLinesSink(MetricsSink):
+    """把每个 span 和计数器增量以 JSON Lines 的形式追加到文件，攒够 flush_every 条再写盘"""
+
+    def __init__(self, path: str, flush_every: int = 64):
+        self.path = path
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._buffer.append(line)
+            if len(self._buffer) >= self.flush_every:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self._buffer and not self._file.closed:
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._file.flush()
+        self._buffer.clear()
+
+    def on_span(self, name, labels, duration, end_time):
+        self._write({"type": "span", "name": name, "labels": labels, "duration": duration, "time": end_time})
+
+    def on_counter(self, name, labels, value):
+        self._write({"type": "counter", "name": name, "labels": labels, "value": value, "time": time.time()})
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._file.close()
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.labels = {**self.labels, "error": exc_type.__name__}
+        end_time = time.time()
+        for sink in self.metrics.sinks:
+            sink.on_span(self.name, self.labels, duration, end_time)
+        return False
+
+
+class Metrics:
+    """
+    AutoGPT 使用的埋点入口：span 计时和计数器，分发给 registry 和额外的 sink。
+    每次记录只是一次 perf_counter 和几次加锁的字典更新，可以在负载下常开；enabled 为 False 时完全不记录。
+    """
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None, sinks: Iterable[MetricsSink] = (), enabled: bool = True):
+        self.registry = registry or MetricsRegistry()
+        self.sinks = [self.registry, *sinks]
+        self.enabled = enabled
+
+    def span(self, name: str, **labels):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, labels)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled or not value:
+            return
+        for sink in self.sinks:
+            sink.on_counter(name, labels, value)
+
+    def render_prometheus(self) -> str:
+        return self.registry.render_prometheus()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
@@ -0,0 +1,630 @@
+import asyncio
+import contextvars
+import ipaddress
+import re
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .ProcessUtils import arun_process, describe_limits, run_process
+from .StepEvents import emit_tool_output
+
+# 分片的粒度：每个 nmap 进程最多负责的主机数，以及端口范围拆分后每片至少包含的端口数
+HOSTS_PER_SHARD = 64
+MIN_PORTS_PER_SHARD = 2048
+MAX_SUBNETS = 1024
+MAX_PORT = 65535
+
+# 渲染给模型的表格的上限：超出部分只给出数量，不再按字符数截断
+MAX_RENDERED_HOSTS = 64
+MAX_PORTS_PER_HOST = 100
+MAX_FINGERPRINT_CHARS = 160
+
+_PORT_RANGE = re.compile(r"^(\d*)-(\d*)$")
+
+
+class NmapPort(NamedTuple):
+    protocol: str
+    port: int
+    state: str
+    service: str = ""
+    product: str = ""
+    version: str = ""
+    extrainfo: str = ""
+    fingerprint: str = ""  # 未识别服务的指纹（servicefp），已截短
+
+
+class NmapHost(NamedTuple):
+    address: str
+    hostnames: Tuple[str, ...]
+    status: str
+    ports: Tuple[NmapPort, ...]
+
+
+class NmapShard(NamedTuple):
+    targets: Tuple[str, ...]
+    ports: str
+
+
+# ---------------------------------------------------------------- 分片
+
+def _parse_ports(ports: str) -> Optional[List[Tuple[int, int]]]:
+    """把 "1-1024,8080" 解析成闭区间列表；带协议前缀、服务名等无法拆分的写法返回 None"""
+    ranges = []
+    for item in ports.replace(" ", "").split(","):
+        if not item:
+            continue
+        if item.isdigit():
+            ranges.append((int(item), int(item)))
+            continue
+        match = _PORT_RANGE.match(item)
+        if not match:
+            return None
+        low = int(match.group(1) or 1)
+        high = int(match.group(2) or MAX_PORT)
+        if low > high:
+            return None
+        ranges.append((low, high))
+    return ranges or None
+
+
+def _format_ports(ranges) -> str:
+    return ",".join(str(low) if low == high else f"{low}-{high}" for low, high in ranges)
+
+
+def split_ports(ports: str, shards: int) -> List[str]:
+    """把端口范围按端口数平均拆成至多 shards 段，每段不少于 MIN_PORTS_PER_SHARD 个端口"""
+    ranges = _parse_ports(ports)
+    if ranges is None:
+        return [ports]
+    total = sum(high - low + 1 for low, high in ranges)
+    shards = max(1, min(shards, total // MIN_PORTS_PER_SHARD))
+    if shards == 1:
+        return [ports]
+    size = -(-total // shards)
+    pieces, current, count = [], [], 0
+    for low, high in ranges:
+        while low <= high:
+            take = min(high - low + 1, size - count)
+            current.append((low, low + take - 1))
+            count += take
+            low += take
+            if count == size:
+                pieces.append(_format_ports(current))
+                current, count = [], 0
+    if current:
+        pieces.append(_format_ports(current))
+    return pieces
+
+
+def split_targets(target: str) -> List[List[str]]:
+    """
+    把目标拆成若干组，每组大约 HOSTS_PER_SHARD 台主机：大网段拆成子网，
+    主机名、单个地址和 nmap 的其他写法（例如 192.168.1.1-20）各算一台。
+    """
+    groups, current, count = [], [], 0
+    for token in target.replace(",", " ").split():
+        try:
+            network = ipaddress.ip_network(token, strict=False)
+        except ValueError:
+            network = None
+        if network is not None and network.num_addresses > HOSTS_PER_SHARD:
+            if network.num_addresses > HOSTS_PER_SHARD * MAX_SUBNETS:
+                groups.append([token])  # 过大的网段（例如 IPv6 /64）不拆，交给 nmap 自己处理
+                continue
+            prefix = network.max_prefixlen - (HOSTS_PER_SHARD.bit_length() - 1)
+            groups.extend([str(subnet)] for subnet in network.subnets(new_prefix=prefix))
+            continue
+        size = network.num_addresses if network is not None else 1
+        if current and count + size > HOSTS_PER_SHARD:
+            groups.append(current)
+            current, count = [], 0
+        current.append(token)
+        count += size
+    if current:
+        groups.append(current)
+    return groups
+
+
+def plan_shards(target: str, ports: str, max_shards: int) -> List[NmapShard]:
+    """
+    按主机和端口范围把扫描拆成多个分片。主机组数超过 max_shards 时仍然按主机组拆分（由并发上限排队执行），
+    主机组较少时再把端口范围拆开，让总分片数接近 max_shards。
+    目标里带 nmap 选项（以 - 开头）时不拆分，原样交给一个进程。
+    """
+    tokens = target.replace(",", " ").split()
+    if not tokens or any(token.startswith("-") for token in tokens):
+        return [NmapShard(tuple(tokens), ports)]
+    groups = split_targets(target)
+    port_pieces = split_ports(ports, max(1, max_shards // len(groups)))
+    return [NmapShard(tuple(group), piece) for group in groups for piece in port_pieces]
+
+
+# ---------------------------------------------------------------- XML 解析
+
+def _parse_host(element) -> NmapHost:
+    addresses = element.findall("address")
+    address = next(
+        (item.get("addr") for item in addresses if item.get("addrtype") in ("ipv4", "ipv6")),
+        addresses[0].get("addr") if addresses else "?",
+    )
+    hostnames = tuple(item.get("name") for item in element.findall("hostnames/hostname") if item.get("name"))
+    status = element.find("status")
+    ports = []
+    for port in element.findall("ports/port"):
+        state = port.find("state")
+        service = port.find("service")
+        service = service.attrib if service is not None else {}
+        fingerprint = service.get("servicefp", "")
+        ports.append(NmapPort(
+            protocol=port.get("protocol", "tcp"),
+            port=int(port.get("portid", 0)),
+            state=state.get("state", "") if state is not None else "",
+            service=service.get("name", ""),
+            product=service.get("product", ""),
+            version=service.get("version", ""),
+            extrainfo=service.get("extrainfo", ""),
+            fingerprint=fingerprint[:MAX_FINGERPRINT_CHARS],
+        ))
+    return NmapHost(
+        address=address,
+        hostnames=tuple(dict.fromkeys(hostnames)),
+        status=status.get("state", "unknown") if status is not None else "unknown",
+        ports=tuple(ports),
+    )
+
+
+class NmapXmlParser:
+    """
+    边读边解析 nmap -oX - 的输出：每个 <host> 元素结束时解析成 NmapHost 并回调 on_host，
+    然后清空该元素，内存占用不随扫描规模增长。输出不完整（进程被结束）时已解析的主机仍然有效。
+    """
+
+    def __init__(self, on_host: Optional[Callable[[NmapHost], None]] = None):
+        self.on_host = on_host
+        self.hosts: List[NmapHost] = []
+        self.hosts_down = 0
+        self.error = ""  # nmap 报告的错误或 XML 解析错误
+        self._parser = ET.XMLPullParser(events=("end",))
+        self._broken = False
+
+    def feed(self, chunk: bytes):
+        if self._broken:
+            return
+        try:
+            self._parser.feed(chunk)
+            self._drain()
+        except ET.ParseError as e:
+            self._broken = True
+            self.error = f"XML 解析失败：{e}"
+
+    def _drain(self):
+        for _, element in self._parser.read_events():
+            if element.tag == "host":
+                host = _parse_host(element)
+                self.hosts.append(host)
+                if self.on_host is not None:
+                    self.on_host(host)
+                element.clear()
+            elif element.tag == "hosts":
+                self.hosts_down += int(element.get("down", 0))
+            elif element.tag == "finished" and element.get("exit") == "error":
+                self.error = element.get("errormsg", "") or "nmap 异常退出"
+
+
+_DISCOVERED = re.compile(r"^Discovered open port (\d+)/(\w+) on (\S+)")
+_SCAN_REPORT = re.compile(r"^Nmap scan report for (\S+)(?: \(([^)]+)\))?( \[host down\])?")
+_NMAP_DONE = re.compile(r"^Nmap done: (\d+) IP address(?:es)? \((\d+) hosts? up\)")
+
+
+class NmapSweepParser:
+    """
+    逐行解析 nmap -v 的普通输出（两阶段扫描的第一阶段）。
+    "Discovered open port" 一出现就回调 on_port(地址, NmapPort)，不等该主机或整个分片扫完；
+    接口与 NmapXmlParser 相同，可以交给 NmapReport.add_shard 合并。
+    """
+
+    def __init__(self, on_port: Optional[Callable[[str, NmapPort], None]] = None):
+        self.on_port = on_port
+        self.hosts_down = 0
+        self.error = ""
+        self._buffer = b""
+        self._hosts: Dict[str, dict] = {}
+
+    def _host(self, address):
+        return self._hosts.setdefault(address, {"hostnames": {}, "ports": {}})
+
+    def feed(self, chunk: bytes):
+        *lines, self._buffer = (self._buffer + chunk).split(b"\n")
+        for line in lines:
+            self._line(line.decode(errors="ignore").rstrip("\r"))
+
+    def close(self):
+        if self._buffer:
+            self._line(self._buffer.decode(errors="ignore").rstrip("\r"))
+            self._buffer = b""
+
+    def _line(self, line: str):
+        match = _DISCOVERED.match(line)
+        if match:
+            port = NmapPort(protocol=match.group(2), port=int(match.group(1)), state="open")
+            ports = self._host(match.group(3))["ports"]
+            if (port.protocol, port.port) not in ports:
+                ports[(port.protocol, port.port)] = port
+                if self.on_port is not None:
+                    self.on_port(match.group(3), port)
+            return
+        match = _SCAN_REPORT.match(line)
+        if match and not match.group(3):
+            name, address = match.group(1), match.group(2)
+            host = self._host(address or name)
+            if address:
+                host["hostnames"][name] = None
+            return
+        match = _NMAP_DONE.match(line)
+        if match:
+            self.hosts_down = int(match.group(1)) - int(match.group(2))
+
+    @property
+    def hosts(self) -> List[NmapHost]:
+        return [
+            NmapHost(address, tuple(host["hostnames"]), "up", tuple(host["ports"].values()))
+            for address, host in self._hosts.items()
+        ]
+
+
+# ---------------------------------------------------------------- 合并与渲染
+
+def _sort_address(address: str):
+    try:
+        ip = ipaddress.ip_address(address)
+        return (0, ip.version, int(ip), "")
+    except ValueError:
+        return (1, 0, 0, address)
+
+
+def _describe_service(port: NmapPort) -> str:
+    parts = [f"{port.port}/{port.protocol}"]
+    if port.state != "open":
+        parts.append(f"[{port.state}]")
+    parts.append(port.service or "unknown")
+    detail = " ".join(item for item in (port.product, port.version) if item)
+    if port.extrainfo:
+        detail = f"{detail} ({port.extrainfo})" if detail else f"({port.extrainfo})"
+    if detail:
+        parts.append(detail)
+    if port.fingerprint and not detail:
+        parts.append(f"指纹: {port.fingerprint}")
+    return " ".join(parts)
+
+
+def describe_host(host: NmapHost) -> str:
+    """单台主机的一行概要，用于扫描过程中的进度输出"""
+    open_ports = [port for port in host.ports if port.state.startswith("open")]
+    name = f"{host.address} ({', '.join(host.hostnames)})" if host.hostnames else host.address
+    if not open_ports:
+        return f"{name}：{host.status}，无开放端口"
+    return f"{name}：" + "；".join(_describe_service(port) for port in open_ports)
+
+
+def _detail_level(port: NmapPort) -> int:
+    return sum(1 for item in (port.service, port.product, port.version, port.extrainfo, port.fingerprint) if item)
+
+
+class NmapReport:
+    """
+    各分片结果的合并：按地址合并主机。同一端口保留信息更完整的结果，
+    两阶段扫描中服务探测的结果可能先于发现它的扫描分片合并，不能被后者覆盖。
+    """
+
+    def __init__(self, target: str, ports: str, shards: int, pipelined: bool = False):
+        self.target = target
+        self.ports = ports
+        self.shards = shards
+        self.pipelined = pipelined
+        self.errors: List[str] = []
+        self.notes: List[str] = []
+        self._hosts: Dict[str, dict] = {}
+        self._down: Dict[Tuple[str, ...], int] = {}  # 每个主机组未响应的主机数，同组的端口分片只计一次
+        self._lock = threading.Lock()
+
+    def add_shard(self, shard: NmapShard, parser: NmapXmlParser, result, timeout, max_output_bytes):
+        with self._lock:
+            for host in parser.hosts:
+                merged = self._hosts.setdefault(host.address, {"hostnames": {}, "status": host.status, "ports": {}})
+                merged["hostnames"].update(dict.fromkeys(host.hostnames))
+                if host.status == "up":
+                    merged["status"] = "up"
+                for port in host.ports:
+                    key = (port.protocol, port.port)
+                    known = merged["ports"].get(key)
+                    if known is None or _detail_level(port) >= _detail_level(known):
+                        merged["ports"][key] = port
+            self._down[shard.targets] = max(self._down.get(shard.targets, 0), parser.hosts_down)
+            error = parser.error
+            if result is not None and result.returncode != 0 and not parser.hosts:
+                stderr_lines = result.stderr.decode(errors="ignore").strip().splitlines()
+                error = error or (stderr_lines[-1] if stderr_lines else f"nmap 退出码 {result.returncode}")
+            if error and error not in self.errors:
+                self.errors.append(error)
+            if result is not None:
+                note = describe_limits(result, timeout, max_output_bytes)
+                if note and note not in self.notes:
+                    self.notes.append(note)
+
+    @property
+    def hosts_down(self) -> int:
+        return sum(self._down.values())
+
+    @property
+    def hosts(self) -> List[NmapHost]:
+        hosts = []
+        for address in sorted(self._hosts, key=_sort_address):
+            merged = self._hosts[address]
+            ports = tuple(merged["ports"][key] for key in sorted(merged["ports"]))
+            hosts.append(NmapHost(address, tuple(merged["hostnames"]), merged["status"], ports))
+        return hosts
+
+    def render(self) -> str:
+        """紧凑的文本表格：每台在线主机一段，每个开放端口一行"""
+        hosts = [host for host in self.hosts if host.status == "up"]
+        with_ports = [host for host in hosts if any(port.state.startswith("open") for port in host.ports)]
+        open_count = sum(1 for host in with_ports for port in host.ports if port.state.startswith("open"))
+        lines = [
+            f"目标 {self.target}（端口 {self.ports}，{self.shards} 个分片{'，两阶段扫描' if self.pipelined else ''}）："
+            f"{len(hosts)} 台主机在线，共 {open_count} 个开放端口"
+            + (f"，{self.hosts_down} 台主机未响应" if self.hosts_down else "")
+        ]
+        if not with_ports:
+            lines.append(f"未发现目标 {self.target} 的开放端口。")
+        for host in with_ports[:MAX_RENDERED_HOSTS]:
+            name = f"{host.address} ({', '.join(host.hostnames)})" if host.hostnames else host.address
+            lines.append(name)
+            open_ports = [port for port in host.ports if port.state.startswith("open")]
+            lines.extend(f"  {_describe_service(port)}" for port in open_ports[:MAX_PORTS_PER_HOST])
+            if len(open_ports) > MAX_PORTS_PER_HOST:
+                lines.append(f"  ……另外 {len(open_ports) - MAX_PORTS_PER_HOST} 个开放端口未列出")
+        if len(with_ports) > MAX_RENDERED_HOSTS:
+            lines.append(f"……另外 {len(with_ports) - MAX_RENDERED_HOSTS} 台有开放端口的主机未列出")
+        idle = [host.address for host in hosts if host not in with_ports]
+        if idle:
+            shown = ", ".join(idle[:MAX_RENDERED_HOSTS])
+            more = f" 等 {len(idle)} 台" if len(idle) > MAX_RENDERED_HOSTS else ""
+            lines.append(f"在线但没有开放端口：{shown}{more}")
+        if self.errors:
+            lines.append("扫描错误：" + "；".join(self.errors))
+        lines.extend(self.notes)
+        return "\n".join(lines)
+
+
+# ---------------------------------------------------------------- 执行
+
+def nmap_xml_argv(shard: NmapShard, options=("-T4", "-sV")) -> list:
+    # -oX - 把 XML 结果写到 stdout；直接 exec，不经过 shell
+    return ["nmap", *options, "-oX", "-", "-p", shard.ports, *shard.targets]
+
+
+def nmap_sweep_argv(shard: NmapShard) -> list:
+    # 第一阶段不探测服务版本；-v 让 nmap 在发现开放端口的当下就输出 "Discovered open port"
+    return ["nmap", "-T4", "-v", "-p", shard.ports, *shard.targets]
+
+
+def nmap_service_argv(address: str, ports: List[NmapPort]) -> list:
+    # 第二阶段只针对已知开放的 TCP 端口，主机已确认在线，跳过主机发现
+    port_list = ",".join(str(port.port) for port in ports)
+    return ["nmap", "-T4", "-sV", "-Pn", "-oX", "-", "-p", port_list, address]
+
+
+def _shard_output(parser):
+    def on_output(chunk, stream):
+        if stream == "stdout":
+            parser.feed(chunk)
+    return on_output
+
+
+def _report_progress(label):
+    def on_host(host: NmapHost):
+        # 每扫完一台主机上报一行进度，代替原始的 XML 输出
+        emit_tool_output(f"[{label}] {describe_host(host)}\n")
+    return on_host
+
+
+def _shard_label(index, total):
+    return f"分片 {index + 1}/{total}"
+
+
+def _run_shards(shards, run_shard, max_parallel):
+    """在线程池里并行运行 run_shard(index, shard)，只有一个分片时直接在当前线程运行"""
+    if len(shards) == 1:
+        run_shard(0, shards[0])
+        return
+    with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="nmap") as executor:
+        # 每个分片复制一份当前上下文，线程里的进度输出才能找到当前工具的输出去向
+        futures = [
+            executor.submit(contextvars.copy_context().run, run_shard, index, shard)
+            for index, shard in enumerate(shards)
+        ]
+        for future in futures:
+            future.result()
+
+
+async def _await_all(tasks):
+    """等待所有任务完成；任一任务失败或自身被取消时取消其余任务，它们的 nmap 进程随之结束"""
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def scan(target: str, ports: str, max_parallel: int, timeout, max_output_bytes, options=("-T4", "-sV")) -> NmapReport:
+    """
+    同步执行分片扫描：最多 max_parallel 个 nmap 进程并行，每个分片在独立线程里运行 run_process。
+    timeout 和 max_output_bytes 作用于每个分片。找不到 nmap 时抛出 FileNotFoundError。
+    """
+    shards = plan_shards(target, ports, max_parallel)
+    report = NmapReport(target, ports, len(shards))
+
+    def run_shard(index, shard):
+        parser = NmapXmlParser(on_host=_report_progress(_shard_label(index, len(shards))))
+        result = run_process(
+            nmap_xml_argv(shard, options),
+            timeout=timeout,
+            max_output_bytes=max_output_bytes,
+            on_output=_shard_output(parser),
+        )
+        report.add_shard(shard, parser, result, timeout, max_output_bytes)
+
+    _run_shards(shards, run_shard, max_parallel)
+    return report
+
+
+async def ascan(target: str, ports: str, max_parallel: int, timeout, max_output_bytes, options=("-T4", "-sV")) -> NmapReport:
+    """scan 的异步版本：用信号量限制同时运行的 nmap 进程数，任务被取消时所有分片的进程一起结束"""
+    shards = plan_shards(target, ports, max_parallel)
+    report = NmapReport(target, ports, len(shards))
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def run_shard(index, shard):
+        async with semaphore:
+            parser = NmapXmlParser(on_host=_report_progress(_shard_label(index, len(shards))))
+            result = await arun_process(
+                nmap_xml_argv(shard, options),
+                timeout=timeout,
+                max_output_bytes=max_output_bytes,
+                on_output=_shard_output(parser),
+            )
+            report.add_shard(shard, parser, result, timeout, max_output_bytes)
+
+    await _await_all([asyncio.ensure_future(run_shard(index, shard)) for index, shard in enumerate(shards)])
+    return report
+
+
+class _PortBatches:
+    """
+    第二阶段的待探测端口，按主机分批：某台主机的探测还在排队时，新发现的端口并入同一批，
+    探测开始时取走整批。空闲时每个端口一发现就开始探测，繁忙时自然合并成较少的 nmap 进程。
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, List[NmapPort]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, address: str, port: NmapPort) -> bool:
+        """加入一个端口，返回 True 表示需要为这台主机安排一次新的探测"""
+        with self._lock:
+            batch = self._pending.get(address)
+            if batch is not None:
+                batch.append(port)
+                return False
+            self._pending[address] = [port]
+            return True
+
+    def take(self, address: str) -> List[NmapPort]:
+        with self._lock:
+            return self._pending.pop(address)
+
+
+def _announce_port(address: str, port: NmapPort):
+    emit_tool_output(f"[发现] {address} {port.port}/{port.protocol} open\n")
+
+
+def pipelined_scan(target: str, ports: str, max_parallel: int, timeout, max_output_bytes, service_timeout) -> NmapReport:
+    """
+    两阶段扫描：第一阶段的分片只做端口发现（不带 -sV），每发现一个开放端口就交给第二阶段，
+    第二阶段立即对它运行 -sV，不等整个端口范围扫完。两个阶段各自最多 max_parallel 个 nmap 进程。
+    """
+    shards = plan_shards(target, ports, max_parallel)
+    report = NmapReport(target, ports, len(shards), pipelined=True)
+    batches = _PortBatches()
+    futures = []
+
+    with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="nmap-sv") as services:
+
+        def run_service(address):
+            batch = batches.take(address)
+            parser = NmapXmlParser(on_host=_report_progress("服务"))
+            result = run_process(
+                nmap_service_argv(address, batch),
+                timeout=service_timeout,
+                max_output_bytes=max_output_bytes,
+                on_output=_shard_output(parser),
+            )
+            report.add_shard(NmapShard((address,), ""), parser, result, service_timeout, max_output_bytes)
+
+        def on_port(address, port):
+            _announce_port(address, port)
+            if port.protocol == "tcp" and batches.add(address, port):
+                futures.append(services.submit(contextvars.copy_context().run, run_service, address))
+
+        def run_sweep(index, shard):
+            parser = NmapSweepParser(on_port=on_port)
+            result = run_process(
+                nmap_sweep_argv(shard),
+                timeout=timeout,
+                max_output_bytes=max_output_bytes,
+                on_output=_shard_output(parser),
+            )
+            parser.close()
+            report.add_shard(shard, parser, result, timeout, max_output_bytes)
+
+        _run_shards(shards, run_sweep, max_parallel)
+        # 扫描阶段全部结束后不会再有新的探测任务
+        for future in futures:
+            future.result()
+    return report
+
+
+async def apipelined_scan(target: str, ports: str, max_parallel: int, timeout, max_output_bytes, service_timeout) -> NmapReport:
+    """pipelined_scan 的异步版本"""
+    shards = plan_shards(target, ports, max_parallel)
+    report = NmapReport(target, ports, len(shards), pipelined=True)
+    batches = _PortBatches()
+    sweep_slots = asyncio.Semaphore(max_parallel)
+    service_slots = asyncio.Semaphore(max_parallel)
+    services = []
+
+    async def run_service(address):
+        async with service_slots:
+            batch = batches.take(address)
+            parser = NmapXmlParser(on_host=_report_progress("服务"))
+            result = await arun_process(
+                nmap_service_argv(address, batch),
+                timeout=service_timeout,
+                max_output_bytes=max_output_bytes,
+                on_output=_shard_output(parser),
+            )
+            report.add_shard(NmapShard((address,), ""), parser, result, service_timeout, max_output_bytes)
+
+    def on_port(address, port):
+        _announce_port(address, port)
+        if port.protocol == "tcp" and batches.add(address, port):
+            services.append(asyncio.ensure_future(run_service(address)))
+
+    async def run_sweep(shard):
+        async with sweep_slots:
+            parser = NmapSweepParser(on_port=on_port)
+            result = await arun_process(
+                nmap_sweep_argv(shard),
+                timeout=timeout,
+                max_output_bytes=max_output_bytes,
+                on_output=_shard_output(parser),
+            )
+            parser.close()
+            report.add_shard(shard, parser, result, timeout, max_output_bytes)
+
+    sweeps = [asyncio.ensure_future(run_sweep(shard)) for shard in shards]
+    try:
+        await _await_all(sweeps)
+        # 扫描阶段全部结束后不会再有新的探测任务
+        await _await_all(services)
+    except BaseException:
+        # 扫描阶段出错或被取消时，已经开始的服务探测也一起结束
+        for task in services:
+            task.cancel()
+        await asyncio.gather(*services, return_exceptions=True)
+        raise
+    return report
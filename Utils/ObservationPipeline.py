@@ -0,0 +1,236 @@
+import contextvars
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+# 超过这么多字符的执行结果才压缩，短结果原样写进记忆
+DEFAULT_MAX_CHARS = 3000
+DEFAULT_HEAD_LINES = 40
+DEFAULT_TAIL_LINES = 20
+# 单行最多保留的字符数，例如 HTTP 响应头被写成一整行
+MAX_LINE_CHARS = 400
+# 至少这么多行相似的连续行才折叠
+MIN_RUN_LINES = 4
+MAX_FACTS = 20
+# 一次运行里保存的原始输出总字符数，超出时丢弃最早的输出
+DEFAULT_STORE_CHARS = 32 * 1024 * 1024
+
+LineStep = Callable[[List[str]], List[str]]
+# 提取规则：返回原始输出中的关键信息，最多 limit 条
+Extractor = Callable[[str, int], List[str]]
+
+
+def dedupe_lines(lines: List[str]) -> List[str]:
+    """连续重复的行只保留一行，标出重复次数"""
+    result = []
+    previous, count = None, 0
+    for line in lines + [None]:
+        if line == previous:
+            count += 1
+            continue
+        if previous is not None:
+            result.append(f"{previous}  [×{count}]" if count > 1 else previous)
+        previous, count = line, 1
+    return result
+
+
+_DROP_DIGITS = str.maketrans("", "", "0123456789")
+
+
+def _shapes(lines: List[str]) -> List[str]:
+    # 去掉数字之后相同的行视为相似，例如进度条、逐行递增的编号和地址；
+    # 对整段文本做一次 translate 再拆行，比逐行调用正则快一个数量级
+    return [shape.strip() for shape in "\n".join(lines).translate(_DROP_DIGITS).split("\n")]
+
+
+def collapse_runs(lines: List[str], min_run: int = MIN_RUN_LINES) -> List[str]:
+    """连续 min_run 行以上的相似行只保留第一行和最后一行，中间写成省略提示"""
+    shapes = _shapes(lines)
+    result = []
+    start = 0
+    while start < len(lines):
+        end = start + 1
+        while end < len(lines) and shapes[end] == shapes[start]:
+            end += 1
+        if end - start >= min_run:
+            result.extend([lines[start], f"  ...（省略 {end - start - 2} 行相似内容）", lines[end - 1]])
+        else:
+            result.extend(lines[start:end])
+        start = end
+    return result
+
+
+def clip_lines(lines: List[str], limit: int = MAX_LINE_CHARS) -> List[str]:
+    return [line if len(line) <= limit else f"{line[:limit]}…（本行还有 {len(line) - limit} 个字符）" for line in lines]
+
+
+def regex_extractor(*patterns: str, flags=re.M) -> Extractor:
+    """按正则从原始输出中提取关键信息：有分组时取第一个分组，否则取匹配到的整段文字"""
+    compiled = [re.compile(pattern, flags) for pattern in patterns]
+
+    def extract(text: str, limit: int = MAX_FACTS) -> List[str]:
+        # 用 dict 去重并保持顺序；够 limit 条就停止匹配，大输出里不会扫完所有匹配
+        facts = {}
+        for regex in compiled:
+            for match in regex.finditer(text):
+                fact = (match.group(1) if regex.groups else match.group(0)).strip()
+                if fact:
+                    facts[fact] = None
+                    if len(facts) >= limit:
+                        return list(facts)
+        return list(facts)
+
+    return extract
+
+
+# 常用的提取规则
+OPEN_PORTS = regex_extractor(r"^\s*(\d+/(?:tcp|udp)\s+open\b.*)$")
+HTTP_FACTS = regex_extractor(
+    r"^(HTTP 状态码: \d+)",
+    r"^(标题: .+)$",
+    r"^(生成器: .+)$",
+    r"'Server': '([^']+)'",
+    r"^(表单: .+)$",
+    r"^(脚本: .+)$",
+)
+ERROR_LINES = regex_extractor(r"^.*\b(?:error|denied|failed|refused|not found)\b.*$", flags=re.M | re.I)
+
+
+class ObservationPipeline:
+    """
+    单个工具的执行结果压缩流程：超过 max_chars 时依次执行 steps（默认是去重、折叠相似行、截断超长行），
+    仍然太长就只保留开头 head_lines 行和结尾 tail_lines 行；extractors 从原始输出中提取的关键信息放在最前面，
+    不会因为截断丢失。
+    """
+
+    def __init__(
+        self,
+        max_chars: int = DEFAULT_MAX_CHARS,
+        head_lines: int = DEFAULT_HEAD_LINES,
+        tail_lines: int = DEFAULT_TAIL_LINES,
+        steps: Sequence[LineStep] = (dedupe_lines, collapse_runs, clip_lines),
+        extractors: Sequence[Extractor] = (),
+    ):
+        self.max_chars = max_chars
+        self.head_lines = head_lines
+        self.tail_lines = tail_lines
+        self.steps = list(steps)
+        self.extractors = list(extractors)
+
+    def needs_compression(self, text: str) -> bool:
+        return len(text) > self.max_chars
+
+    def compress(self, text: str) -> str:
+        lines = text.splitlines()
+        for step in self.steps:
+            lines = step(lines)
+        if len("\n".join(lines)) > self.max_chars and len(lines) > self.head_lines + self.tail_lines:
+            omitted = len(lines) - self.head_lines - self.tail_lines
+            lines = lines[:self.head_lines] + [f"...（省略中间 {omitted} 行）..."] + lines[-self.tail_lines:]
+        body = "\n".join(lines)
+        if len(body) > self.max_chars:
+            # 行数不多但每行都很长时按字符截取首尾
+            head = self.max_chars * 2 // 3
+            tail = self.max_chars - head
+            body = f"{body[:head]}\n...（省略 {len(body) - self.max_chars} 个字符）...\n{body[-tail:]}"
+        facts = {}
+        for extractor in self.extractors:
+            if len(facts) >= MAX_FACTS:
+                break
+            for fact in extractor(text, MAX_FACTS - len(facts)):
+                facts[fact] = None
+        if facts:
+            more = "（只列出前几条）" if len(facts) >= MAX_FACTS else ""
+            body = "\n".join([f"关键信息{more}：", *(f"- {fact}" for fact in facts), "输出摘要：", body])
+        return body
+
+
+# 各工具默认的压缩流程；没有列出的工具使用 DEFAULT_PIPELINE，值为 None 的工具不压缩
+DEFAULT_PIPELINE = ObservationPipeline()
+DEFAULT_PIPELINES: Dict[str, Optional[ObservationPipeline]] = {
+    "Shell": ObservationPipeline(extractors=(OPEN_PORTS, ERROR_LINES)),
+    # 报告本身已经是每个端口一行，压缩时主要靠开放端口的提取保证不丢端口
+    "NmapScan": ObservationPipeline(max_chars=6000, head_lines=80, extractors=(OPEN_PORTS,)),
+    "Send HTTP Request": ObservationPipeline(extractors=(HTTP_FACTS,)),
+    "ReadOutput": None,  # 分页读取的就是原始输出，再压缩就读不到了
+    # 后台任务的结果在任务里执行时已经压缩过
+    "AwaitJob": None,
+    "PollJob": None,
+}
+
+
+class OutputStore:
+    """
+    被压缩的执行结果的原始输出，按引用编号（out-1、out-2……）保存在内存中，供 ReadOutput 分页查看。
+    总字符数超过 max_chars 时丢弃最早的输出。
+    """
+
+    def __init__(self, max_chars: int = DEFAULT_STORE_CHARS):
+        self.max_chars = max_chars
+        self.size = 0
+        self._lock = threading.Lock()
+        # 保存原始文本，第一次分页查看时才拆成行；大多数输出不会被查看
+        self._blobs: "OrderedDict[str, Union[str, List[str]]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._counter = 0
+
+    def put(self, text: str) -> str:
+        with self._lock:
+            self._counter += 1
+            ref = f"out-{self._counter}"
+            self._blobs[ref] = text
+            self._sizes[ref] = len(text)
+            self.size += len(text)
+            while self.size > self.max_chars and len(self._blobs) > 1:
+                old, _ = self._blobs.popitem(last=False)
+                self.size -= self._sizes.pop(old)
+            return ref
+
+    def lines(self, ref: str) -> List[str]:
+        """原始输出的全部行，引用不存在或已被丢弃时抛出 ValueError"""
+        ref = str(ref).strip()
+        with self._lock:
+            lines = self._blobs.get(ref)
+            if isinstance(lines, str):
+                lines = self._blobs[ref] = lines.splitlines()
+            known = ", ".join(self._blobs) or "无"
+        if lines is None:
+            raise ValueError(f"没有编号为 '{ref}' 的输出，可能属于更早的任务或已被丢弃（现有：{known}）")
+        return lines
+
+
+class ObservationCompressor:
+    """按工具名称选择压缩流程；被压缩的结果把原始输出存进 store，并在末尾注明引用编号"""
+
+    def __init__(self, store: OutputStore, pipelines: Optional[Dict[str, Optional[ObservationPipeline]]] = None):
+        self.store = store
+        self.pipelines = {**DEFAULT_PIPELINES, **(pipelines or {})}
+
+    def needs_compression(self, tool_name: str, observation: str) -> bool:
+        pipeline = self.pipelines.get(tool_name, DEFAULT_PIPELINE)
+        return pipeline is not None and pipeline.needs_compression(observation)
+
+    def compress(self, tool_name: str, observation: str) -> str:
+        if not self.needs_compression(tool_name, observation):
+            return observation
+        pipeline = self.pipelines[tool_name] if tool_name in self.pipelines else DEFAULT_PIPELINE
+        ref = self.store.put(observation)
+        total = observation.count("\n") + 1
+        return (
+            f"{pipeline.compress(observation)}\n"
+            f"[以上为压缩后的结果，完整输出共 {total} 行、{len(observation)} 个字符，已保存为 {ref}，"
+            f"可以用 ReadOutput 按行号查看或搜索]"
+        )
+
+
+# 当前任务的原始输出存储，由 AutoGPT 在执行动作前设置，供 ReadOutput 使用
+_output_store: contextvars.ContextVar[Optional[OutputStore]] = contextvars.ContextVar("output_store", default=None)
+
+
+def set_output_store(store: Optional[OutputStore]):
+    return _output_store.set(store)
+
+
+def get_output_store() -> Optional[OutputStore]:
+    return _output_store.get()
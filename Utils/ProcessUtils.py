@@ -0,0 +1,223 @@
+import asyncio
+import contextvars
+import os
+import selectors
+import signal
+import subprocess
+import sys
+import time
+from typing import NamedTuple, Optional
+
+from .StepEvents import aemit_tool_output, emit_tool_output
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 默认限制：单个输出流最多保留的字节数，以及整个进程允许运行的秒数；超出时结束整个进程组
+DEFAULT_MAX_OUTPUT_BYTES = 1024 * 1024
+DEFAULT_TIMEOUT = 600
+
+
+class ProcessResult(NamedTuple):
+    returncode: int
+    stdout: bytes
+    stderr: bytes
+    timed_out: bool = False  # 是否因为超时被结束
+    truncated: bool = False  # 是否因为输出超过上限被结束
+
+
+class ProcessLimits(NamedTuple):
+    """子进程的资源限制，在 exec 之前通过 setrlimit / nice 设置，只在 POSIX 系统上生效"""
+    cpu_seconds: Optional[int] = None  # CPU 时间上限（RLIMIT_CPU）
+    memory_bytes: Optional[int] = None  # 地址空间上限（RLIMIT_AS）
+    nice: int = 0  # 调低的优先级
+
+
+# 当前上下文里启动的子进程要遵守的资源限制，例如后台任务中的工具；没有设置时不加限制
+_process_limits: contextvars.ContextVar[Optional[ProcessLimits]] = contextvars.ContextVar(
+    "process_limits", default=None
+)
+
+
+def set_process_limits(limits: Optional[ProcessLimits]):
+    return _process_limits.set(limits)
+
+
+def _limits_preexec():
+    limits = _process_limits.get()
+    if limits is None or resource is None:
+        return None
+
+    def apply():
+        # 在 fork 之后、exec 之前运行，只调用不分配锁的系统调用
+        if limits.cpu_seconds:
+            resource.setrlimit(resource.RLIMIT_CPU, (limits.cpu_seconds, limits.cpu_seconds))
+        if limits.memory_bytes:
+            resource.setrlimit(resource.RLIMIT_AS, (limits.memory_bytes, limits.memory_bytes))
+        if limits.nice:
+            os.nice(limits.nice)
+
+    return apply
+
+
+def shell_argv(command: str) -> list:
+    """把 Shell 命令包装成可以直接 exec 的参数列表"""
+    if sys.platform == "win32":
+        return [os.environ.get("COMSPEC", "cmd.exe"), "/c", command]
+    return ["/bin/sh", "-c", command]
+
+
+def describe_limits(result: ProcessResult, timeout, max_output_bytes) -> str:
+    """生成超时/截断的提示文字，附加在工具返回结果后面，没有触发限制时返回空字符串"""
+    notes = []
+    if result.timed_out:
+        notes.append(f"命令运行超过 {timeout} 秒，已被强制结束。")
+    if result.truncated:
+        notes.append(f"输出超过 {max_output_bytes} 字节，已被截断并结束进程。")
+    return "\n".join(notes)
+
+
+def kill_process_tree(process):
+    """结束子进程所在的整个进程组（Windows 上只结束子进程本身）"""
+    try:
+        if sys.platform == "win32":
+            if process.returncode is None:
+                process.kill()
+        else:
+            # 即使 Shell 本身已经退出，它派生的进程仍可能在同一进程组里
+            os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_process(argv, timeout=DEFAULT_TIMEOUT, max_output_bytes=DEFAULT_MAX_OUTPUT_BYTES, chunk_size=65536, on_output=None) -> ProcessResult:
+    """
+    同步运行子进程：用 selectors 在当前线程里同时等待 stdout 和 stderr，不为每次调用创建读取线程，
+    也没有轮询等待。输出写入 bytearray，每读到一块都作为工具输出事件上报；
+    提供 on_output(chunk, stream) 时改为交给它处理，例如边读边解析的 XML 输出。
+    超过 timeout 秒或者任一输出流超过 max_output_bytes 时结束整个进程组。
+    """
+    on_output = on_output or emit_tool_output
+    process = subprocess.Popen(
+        argv,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=(sys.platform != "win32"),  # 独立的进程组，方便连同子进程一起结束
+        preexec_fn=_limits_preexec(),
+    )
+    if sys.platform == "win32":
+        # Windows 的管道不支持 select，退化为 communicate
+        return _communicate(process, timeout, max_output_bytes, on_output)
+
+    buffers = {"stdout": bytearray(), "stderr": bytearray()}
+    timed_out = False
+    truncated = False
+    deadline = time.monotonic() + timeout if timeout else None
+
+    with selectors.DefaultSelector() as selector:
+        selector.register(process.stdout, selectors.EVENT_READ, "stdout")
+        selector.register(process.stderr, selectors.EVENT_READ, "stderr")
+        while selector.get_map():
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+            for key, _ in selector.select(remaining):
+                chunk = os.read(key.fd, chunk_size)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    continue
+                on_output(chunk, key.data)
+                buffer = buffers[key.data]
+                room = max_output_bytes - len(buffer) if max_output_bytes else len(chunk)
+                buffer += chunk[:room]
+                if len(chunk) > room:
+                    truncated = True
+            if truncated:
+                break
+
+    if timed_out or truncated:
+        kill_process_tree(process)
+    process.stdout.close()
+    process.stderr.close()
+    returncode = process.wait()
+    return ProcessResult(returncode, bytes(buffers["stdout"]), bytes(buffers["stderr"]), timed_out, truncated)
+
+
+def _communicate(process, timeout, max_output_bytes, on_output) -> ProcessResult:
+    timed_out = False
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill_process_tree(process)
+        stdout, stderr = process.communicate()
+        timed_out = True
+    truncated = bool(max_output_bytes) and max(len(stdout), len(stderr)) > max_output_bytes
+    if max_output_bytes:
+        stdout, stderr = stdout[:max_output_bytes], stderr[:max_output_bytes]
+    on_output(stdout, "stdout")
+    on_output(stderr, "stderr")
+    return ProcessResult(process.returncode, stdout, stderr, timed_out, truncated)
+
+
+async def arun_process(argv, timeout=DEFAULT_TIMEOUT, max_output_bytes=DEFAULT_MAX_OUTPUT_BYTES, chunk_size=65536, on_output=None) -> ProcessResult:
+    """
+    run_process 的异步版本：使用 asyncio.create_subprocess_exec 启动子进程，在同一个事件循环里并发读取
+    stdout 和 stderr，不占用额外的线程。限制和上报方式与 run_process 相同，on_output 是同步的回调。
+    """
+    process = await asyncio.create_subprocess_exec(
+        *argv,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=(sys.platform != "win32"),  # 独立的进程组，方便连同子进程一起结束
+        preexec_fn=_limits_preexec(),
+    )
+    state = {"truncated": False}
+
+    async def read_stream(stream, name):
+        buffer = bytearray()
+        while True:
+            chunk = await stream.read(chunk_size)
+            if not chunk:
+                break
+            if on_output is None:
+                await aemit_tool_output(chunk, name)
+            else:
+                on_output(chunk, name)
+            room = max_output_bytes - len(buffer) if max_output_bytes else len(chunk)
+            buffer += chunk[:room]
+            if len(chunk) > room and not state["truncated"]:
+                # 超出上限：结束进程组，管道关闭后读取自然结束
+                state["truncated"] = True
+                kill_process_tree(process)
+        return bytes(buffer)
+
+    timed_out = False
+    readers = asyncio.gather(
+        read_stream(process.stdout, "stdout"),
+        read_stream(process.stderr, "stderr"),
+    )
+    try:
+        try:
+            stdout, stderr = await asyncio.wait_for(asyncio.shield(readers), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            kill_process_tree(process)
+            stdout, stderr = await readers
+        returncode = await process.wait()
+    except asyncio.CancelledError:
+        # 任务被取消时不能把子进程留在后台；Shell 命令可能派生了子进程并持有管道，所以结束整个进程组
+        kill_process_tree(process)
+        readers.cancel()
+        try:
+            await readers
+        except asyncio.CancelledError:
+            pass
+        # 读取协程停下时缓冲区可能已满、管道处于暂停读取状态，不读完剩下的内容管道不会关闭，wait 也不会返回
+        await process.communicate()
+        raise
+    return ProcessResult(returncode, stdout, stderr, timed_out, state["truncated"])
@@ -0,0 +1,156 @@
+import functools
+import threading
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+# 计数用的编码：tiktoken 的编码表第一次使用时需要联网下载，离线或未安装时退回按字符估算
+TOKEN_ENCODING = "cl100k_base"
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return _encoding
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+            except Exception:
+                _encoding = None
+            _encoding_loaded = True
+    return _encoding
+
+
+def _estimate_tokens(text: str) -> int:
+    # 粗略估算：ASCII 大约 4 个字符一个 token，中文等非 ASCII 字符大约一个字符一个 token
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+@functools.lru_cache(maxsize=256)
+def count_tokens(text: str) -> int:
+    """统计文本的 token 数；同一段文本（例如工具列表、历史记录）每一步都会被重复统计，所以做了缓存"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return _estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_middle(text: str, max_tokens: int) -> str:
+    """超过 max_tokens 时保留开头约 2/3 和结尾约 1/3，中间替换为省略提示"""
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return f"...[省略约 {total} tokens]..."
+    head_tokens = max_tokens * 2 // 3
+    tail_tokens = max_tokens - head_tokens
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        head = encoding.decode(tokens[:head_tokens])
+        tail = encoding.decode(tokens[-tail_tokens:]) if tail_tokens else ""
+    else:
+        # 没有分词器时按比例截取字符
+        head = text[: len(text) * head_tokens // total]
+        tail = text[len(text) - len(text) * tail_tokens // total:] if tail_tokens else ""
+    return f"{head}\n...[省略约 {total - max_tokens} tokens]...\n{tail}"
+
+
+class PromptBudget:
+    """
+    主 prompt 的 token 预算：工具列表、长时记忆、短时记忆三段各有固定上限。
+    - 工具列表超限时改用只含名称、描述首句和参数名的精简格式
+    - 长时记忆超限时截取首尾
+    - 短时记忆从最新一条往前装：最近一步的执行结果保留较多内容，更早的结果只保留首尾片段，
+      仍然装不下的最早记录整体省略
+    """
+
+    SECTIONS = ("tools", "long_term_memory", "short_term_memory")
+
+    def __init__(
+        self,
+        tools: int = 3000,
+        long_term_memory: int = 1500,
+        short_term_memory: int = 6000,
+        latest_observation: int = 2000,  # 最近一步的执行结果最多保留的 token 数
+        older_observation: int = 400,  # 更早的执行结果最多保留的 token 数
+    ):
+        self.budgets = {
+            "tools": tools,
+            "long_term_memory": long_term_memory,
+            "short_term_memory": short_term_memory,
+        }
+        self.latest_observation = latest_observation
+        self.older_observation = older_observation
+
+    def fit_tools(self, tools, tools_prompt: str) -> str:
+        budget = self.budgets["tools"]
+        if count_tokens(tools_prompt) <= budget:
+            return tools_prompt
+        lines = []
+        for i, tool in enumerate(tools):
+            description = tool.description.strip().splitlines()[0] if tool.description.strip() else ""
+            args = ", ".join(getattr(tool, "args", {}).keys())
+            lines.append(f"{i + 1}. {tool.name} : {description}, args: {args}")
+        return truncate_middle("\n".join(lines) + "\n", budget)
+
+    def fit_long_term_memory(self, text: str) -> str:
+        return truncate_middle(text, self.budgets["long_term_memory"])
+
+    def fit_short_term_memory(
+        self,
+        messages: List[BaseMessage],
+        human_prefix: str = "Human",
+        ai_prefix: str = "AI",
+    ) -> str:
+        """按 ConversationBufferWindowMemory 的格式（每条一行 "前缀: 内容"）渲染，保证总量不超过预算"""
+        budget = self.budgets["short_term_memory"]
+        lines = []
+        used = 0
+        omitted = 0
+        latest = len(messages) - 2  # 最后一对 (思考, 执行结果) 属于最近一步
+        for position in range(len(messages) - 1, -1, -1):
+            message = messages[position]
+            if isinstance(message, HumanMessage):
+                prefix = human_prefix
+            elif isinstance(message, AIMessage):
+                prefix = ai_prefix
+            else:
+                prefix = message.type
+            limit = self.latest_observation if position >= latest else self.older_observation
+            content = truncate_middle(str(message.content), limit)
+            line = f"{prefix}: {content}"
+            cost = count_tokens(line) + 1  # 换行符
+            if used + cost > budget:
+                # 放不下时再压缩一次，用剩余的预算尽量保留这一条的首尾
+                remaining = budget - used - count_tokens(prefix) - 8
+                if remaining < 32:
+                    omitted = position + 1
+                    break
+                line = f"{prefix}: {truncate_middle(content, remaining)}"
+                cost = count_tokens(line) + 1
+                if used + cost > budget:
+                    omitted = position + 1
+                    break
+            lines.append(line)
+            used += cost
+        lines.reverse()
+        if omitted:
+            lines.insert(0, f"（更早的 {omitted} 条记录因长度限制已省略）")
+        return "\n".join(lines)
+
+    def usage(self, sections: Dict[str, str], prompt: Optional[str] = None) -> Dict[str, int]:
+        """统计各段实际使用的 token 数；给出完整 prompt 时一并统计总数"""
+        report = {name: count_tokens(text) for name, text in sections.items()}
+        if prompt is not None:
+            report["total"] = count_tokens(prompt)
+        return report
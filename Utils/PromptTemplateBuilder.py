@@ -4,7 +4,58 @@ from langchain_core.output_parsers.base import BaseOutputParser
 from langchain_core.tools import BaseTool
 from .FileUtils import load_file
 from .CommonUtils import *
+from .ToolRegistry import ToolRegistry, render_tools_prompt, tools_fingerprint
 import json
+import os
+import threading
+
+# 进程级的模板编译缓存：
+# key 为 (prompt_path, prompt_file, 工具集指纹, output_parser 类型)，
+# value 为 (依赖的 templ 文件及其 mtime, 已填充好 partial 变量的 PromptTemplate)
+# 命中时只需要 stat 一下依赖文件确认 mtime 没变，不再读盘、不再递归构建子模板、不再序列化工具 schema
+_template_cache = {}
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def template_cache_info() -> dict:
+    """返回模板缓存的命中/未命中次数和当前条目数"""
+    with _cache_lock:
+        return {
+            "hits": _cache_stats["hits"],
+            "misses": _cache_stats["misses"],
+            "size": len(_template_cache),
+        }
+
+
+def clear_template_cache():
+    """清空模板缓存并重置计数器"""
+    with _cache_lock:
+        _template_cache.clear()
+        _cache_stats["hits"] = 0
+        _cache_stats["misses"] = 0
+
+
+def _file_mtime(full_path):
+    try:
+        return os.stat(full_path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _tools_fingerprint(tools):
+    if tools is None:
+        return None
+    if isinstance(tools, ToolRegistry):
+        return tools.fingerprint
+    return tools_fingerprint(tools)
+
+
+def _parser_fingerprint(output_parser):
+    if output_parser is None:
+        return None
+    return (type(output_parser), getattr(output_parser, "pydantic_object", None))
+
 
 class PromptTemplateBuilder:
     def __init__(self,
@@ -16,9 +67,38 @@ class PromptTemplateBuilder:
         
     def build(
         self,
-        tools: Optional[List[BaseTool]] = None,
+        tools: Optional[List[BaseTool] | ToolRegistry] = None,
         output_parser: Optional[BaseOutputParser] = None,
     ) -> PromptTemplate:
+        key = (
+            os.path.abspath(self.prompt_path),
+            self.prompt_file,
+            _tools_fingerprint(tools),
+            _parser_fingerprint(output_parser),
+        )
+        with _cache_lock:
+            entry = _template_cache.get(key)
+        if entry is not None:
+            dependencies, template = entry
+            # 任何一个 templ 文件被修改（或删除），缓存即失效
+            if all(_file_mtime(path) == mtime for path, mtime in dependencies):
+                with _cache_lock:
+                    _cache_stats["hits"] += 1
+                return template
+
+        dependencies = []
+        template = self._compile(tools, output_parser, dependencies)
+        with _cache_lock:
+            _cache_stats["misses"] += 1
+            _template_cache[key] = (tuple(dependencies), template)
+        return template
+
+    def _compile(self, tools, output_parser, dependencies) -> PromptTemplate:
+        # 先记录 mtime 再读文件：如果读的过程中文件被改了，下一次 build 会因为 mtime 不一致而重新编译
+        dependencies.append(
+            (os.path.join(self.prompt_path, self.prompt_file),
+             _file_mtime(os.path.join(self.prompt_path, self.prompt_file)))
+        )
         main_templ_str = load_file(self.prompt_path, self.prompt_file)
         main_templ = PromptTemplate.from_template(main_templ_str)   
         #使用了langchain的from_template方法，可以直接从字符串中构建PromptTemplate对象,字符串里面的占位会被解析为变量,然后通过partial_variables参数指定变量名和对应的值
@@ -31,7 +111,7 @@ class PromptTemplateBuilder:
         for var in main_templ.input_variables:
             if var.endswith("_templ"):
                 var_file = var[:-6] + ".templ"
-                var_str = self._get_prompt(var_file)
+                var_str = self._get_prompt(var_file, dependencies)
                 partial_variables[var] = var_str
             
         if tools is not None:
@@ -45,16 +125,14 @@ class PromptTemplateBuilder:
         return main_templ.partial(**partial_variables)  #返回填充了templ文件、tools、output_parser的prompt，其他变量用户单独传递
 
             
-    # 加载模板，返回给partial_variables使用
-    def _get_prompt(self, prompt_file):     #没有破环
+    # 加载模板，返回给partial_variables使用；子模板依赖的文件也一并记录，任何一层被修改都会让上层缓存失效
+    def _get_prompt(self, prompt_file, dependencies):     #没有破环
         builder = PromptTemplateBuilder(self.prompt_path,prompt_file=prompt_file)
-        return builder.build().format()
+        return builder._compile(None, None, dependencies).format()
     
     # 获取工具提示:根据工具集里面每个工具的提示生成对应的prompt
     def _get_tools_prompt(self, tools):
-        tools_prompt = ""
-        for i,tool in enumerate(tools):
-            tools_prompt += f"{i+1}. {tool.name} : {tool.description},\
-                args json schema: {json.dumps(tool.args,ensure_ascii=False)}\n"
-        return tools_prompt
+        if isinstance(tools, ToolRegistry):
+            return tools.render_prompt()
+        return render_tools_prompt(tools)
             
\ No newline at end of file
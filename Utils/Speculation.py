@@ -0,0 +1,74 @@
+import asyncio
+from typing import Optional
+
+from .StepEvents import ToolOutputSink
+from .ThoughtAndAction import Action
+
+# 工具 metadata 中的这个键为 True 时，允许在模型还在生成回复时提前执行（只读或幂等的工具）
+SPECULATIVE_METADATA_KEY = "speculative"
+
+
+def is_speculative_tool(tool) -> bool:
+    return bool((getattr(tool, "metadata", None) or {}).get(SPECULATIVE_METADATA_KEY))
+
+
+class ToolSpeculation:
+    """
+    一步中提前执行的动作：流式接收回复时，action 一解析完整就在后台开始执行工具，
+    输出写入本步的事件队列，等完整回复解析后再决定采用结果还是取消。
+    每步最多提前执行一个动作，即本步的第一个动作（序号 0）。
+    """
+
+    def __init__(self, step: int, limits, queue_size: int, last_action: Optional[Action] = None):
+        self.step = step
+        self.limits = limits
+        self.last_action = last_action
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.action: Optional[Action] = None
+        self.tool_name: Optional[str] = None  # 注册表中工具的名称，用作指标标签
+        self.sink: Optional[ToolOutputSink] = None
+        self.task: Optional[asyncio.Future] = None
+
+    @property
+    def started(self) -> bool:
+        return self.task is not None
+
+    def start(self, action: Action, tool_name: str, run_action):
+        """run_action(action, limits, sink) 返回执行该动作的协程"""
+        self.action = action
+        self.tool_name = tool_name
+        self.sink = ToolOutputSink(asyncio.get_running_loop(), self.queue, self.step, 0, action.name)
+        self.task = asyncio.ensure_future(run_action(action, self.limits, self.sink))
+
+    def matches(self, action: Action) -> bool:
+        return (
+            self.started
+            and action.name == self.action.name
+            and (action.args or {}) == (self.action.args or {})
+        )
+
+    def take(self):
+        """由执行方接管提前执行的任务，返回 (sink, task)；之后取消和清理都由执行方负责"""
+        sink, task = self.sink, self.task
+        self.action = None
+        self.tool_name = None
+        self.sink = None
+        self.task = None
+        return sink, task
+
+    async def cancel(self):
+        """取消提前执行的工具并丢弃已经产生的输出，之后可以为同一步重新提前执行"""
+        if self.task is not None:
+            self.sink.closed = True
+            if not self.task.done():
+                self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                pass
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.action = None
+        self.tool_name = None
+        self.sink = None
+        self.task = None
@@ -0,0 +1,165 @@
+import atexit
+import errno
+import os
+import threading
+import time
+from collections import deque
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_HOST = "0.0.0.0"
+# 等待 accept 的连接队列长度；目标机器同时下载多个文件时不会被拒绝连接
+REQUEST_QUEUE_SIZE = 128
+# 空闲连接最多保持的秒数，避免下载到一半的客户端一直占着线程
+CONNECTION_TIMEOUT = 60
+# 每个服务器保留的最近请求记录条数，list 时展示，用来确认目标是否来取过文件
+RECENT_REQUESTS = 20
+
+
+class StaticFileHandler(SimpleHTTPRequestHandler):
+    """
+    提供服务器目录中的静态文件，解析符号链接后不在目录内的路径返回 404。
+    文件内容通过 socket.sendfile 直接从文件发送到连接（Linux 上是 os.sendfile，
+    不经过用户态缓冲）；目录列表等内存中的内容由 socket.sendfile 自动退化为普通发送。
+    访问日志写进服务器的请求记录，不打印到终端。
+    """
+
+    timeout = CONNECTION_TIMEOUT
+
+    def __init__(self, request, client_address, server):
+        super().__init__(request, client_address, server, directory=server.directory)
+
+    def send_head(self):
+        # 服务目录里的符号链接可能指向目录之外，解析后不在服务目录内的路径一律当作不存在
+        real = os.path.realpath(self.translate_path(self.path))
+        if os.path.commonpath([self.directory, real]) != self.directory:
+            self.send_error(404, "File not found")
+            return None
+        return super().send_head()
+
+    def copyfile(self, source, outputfile):
+        try:
+            sent = self.connection.sendfile(source)
+        except (ConnectionError, TimeoutError):
+            # 客户端中途断开，不算服务器错误
+            self.close_connection = True
+            return
+        self.server.record_bytes(sent)
+
+    def log_request(self, code="-", size="-"):
+        self.server.record_request(f"{self.client_address[0]} \"{self.requestline}\" {code}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StaticFileServer(ThreadingHTTPServer):
+    """每个请求一个守护线程的静态文件服务器，统计请求数和发送的字节数"""
+
+    daemon_threads = True
+    request_queue_size = REQUEST_QUEUE_SIZE
+
+    def __init__(self, address: Tuple[str, int], directory: str):
+        self.directory = directory
+        self.started_at = time.time()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.recent = deque(maxlen=RECENT_REQUESTS)
+        self._stats_lock = threading.Lock()
+        super().__init__(address, StaticFileHandler)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def record_request(self, line: str):
+        with self._stats_lock:
+            self.requests += 1
+            self.recent.append(f"{time.strftime('%H:%M:%S')} {line}")
+
+    def record_bytes(self, count: int):
+        with self._stats_lock:
+            self.bytes_sent += count
+
+    def handle_error(self, request, client_address):
+        # 客户端断开之类的连接错误很常见，不把异常栈打印到终端
+        pass
+
+    def describe(self, recent: int = 0) -> str:
+        host = self.server_address[0]
+        shown = "localhost" if host in ("0.0.0.0", "") else host
+        # 请求线程随时在更新统计，计数和最近请求在同一次加锁中读出，彼此一致
+        with self._stats_lock:
+            requests, bytes_sent = self.requests, self.bytes_sent
+            records = list(self.recent)[-recent:] if recent else []
+        lines = [
+            f"http://{shown}:{self.port}/ （监听 {host}:{self.port}）-> {self.directory}，"
+            f"已运行 {time.time() - self.started_at:.0f} 秒，处理 {requests} 个请求，发送 {bytes_sent} 字节"
+        ]
+        if records:
+            lines.append("最近的请求：\n" + "\n".join(records))
+        return "\n".join(lines)
+
+
+class ServerRegistry:
+    """进程内运行中的静态文件服务器，按端口登记；每个服务器在自己的后台线程里 serve_forever，不阻塞 agent"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servers: Dict[int, Tuple[StaticFileServer, threading.Thread]] = {}
+
+    def start(self, directory: str, port: int, host: str = DEFAULT_HOST) -> StaticFileServer:
+        """启动服务器，端口被占用或没有权限时抛出 ValueError；port 为 0 时由系统分配空闲端口"""
+        directory = os.path.realpath(directory)
+        with self._lock:
+            if port in self._servers:
+                running = self._servers[port][0]
+                raise ValueError(f"端口 {port} 上已经有服务器在提供 {running.directory}，如需更换目录请先停止它")
+            os.makedirs(directory, exist_ok=True)
+            try:
+                server = StaticFileServer((host, port), directory)
+            except OSError as e:
+                if e.errno == errno.EADDRINUSE:
+                    raise ValueError(f"端口 {port} 已被其他进程占用，请换一个端口") from e
+                if e.errno == errno.EACCES:
+                    raise ValueError(f"没有权限监听端口 {port}，1024 以下的端口需要 root 权限") from e
+                raise
+            thread = threading.Thread(
+                target=server.serve_forever, name=f"static-server-{server.port}", daemon=True
+            )
+            thread.start()
+            self._servers[server.port] = (server, thread)
+            return server
+
+    def stop(self, port: int) -> StaticFileServer:
+        with self._lock:
+            entry = self._servers.pop(port, None)
+            known = ", ".join(str(running) for running in self._servers) or "无"
+        if entry is None:
+            raise ValueError(f"端口 {port} 上没有本工具启动的服务器（运行中的端口：{known}）")
+        server, thread = entry
+        server.shutdown()
+        server.server_close()
+        thread.join()
+        return server
+
+    def get(self, port: int) -> Optional[StaticFileServer]:
+        with self._lock:
+            entry = self._servers.get(port)
+        return entry[0] if entry else None
+
+    def servers(self) -> List[StaticFileServer]:
+        with self._lock:
+            return [server for server, _ in self._servers.values()]
+
+    def stop_all(self):
+        for server in self.servers():
+            self.stop(server.port)
+
+
+_registry = ServerRegistry()
+atexit.register(_registry.stop_all)
+
+
+def get_server_registry() -> ServerRegistry:
+    return _registry
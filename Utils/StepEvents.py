@@ -0,0 +1,134 @@
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional
+import asyncio
+import concurrent.futures
+import contextvars
+
+from .ThoughtAndAction import Action, Thought
+
+
+class StepEvent(BaseModel):
+    """AutoGPT.run_stream / astream 产出的事件基类"""
+    type: str
+    step: int = Field(default=0, description="所在的思考轮数，从 0 开始")
+
+
+class PromptUsageEvent(StepEvent):
+    type: Literal["prompt_usage"] = "prompt_usage"
+    sections: Dict[str, int] = Field(default_factory=dict, description="各段以及整个 prompt（total）的 token 数")
+    budgets: Dict[str, int] = Field(default_factory=dict, description="各段的 token 预算")
+
+
+class ThoughtEvent(StepEvent):
+    type: Literal["thought"] = "thought"
+    thought: Thought
+    actions: List[Action] = Field(default_factory=list)
+
+
+class ActionStartEvent(StepEvent):
+    type: Literal["action_start"] = "action_start"
+    index: int = Field(default=0, description="动作在本步中的序号")
+    action: Action
+
+
+class ToolOutputEvent(StepEvent):
+    type: Literal["tool_output"] = "tool_output"
+    index: int = 0
+    tool: str
+    stream: Literal["stdout", "stderr"] = "stdout"
+    chunk: str
+
+
+class ObservationEvent(StepEvent):
+    type: Literal["observation"] = "observation"
+    index: int = 0
+    action: Action
+    result: str = Field(description="写入短时记忆的执行结果")
+
+
+class FinalEvent(StepEvent):
+    type: Literal["final"] = "final"
+    reply: str
+    finished: bool = Field(default=True, description="是否是通过 FINISH 指令正常结束的")
+
+
+# 当前正在执行的工具的输出去向。工具在读到子进程输出时调用 emit_tool_output / aemit_tool_output，
+# 没有设置时（例如直接调用工具函数）输出被直接丢弃
+_tool_output_sink: contextvars.ContextVar[Optional["ToolOutputSink"]] = contextvars.ContextVar(
+    "tool_output_sink", default=None
+)
+
+
+class ToolOutputSink:
+    """
+    把工具输出转换为 ToolOutputEvent 放入事件队列。队列是有界的：
+    消费者跟不上时，读取线程会在 write 上阻塞，异步读取协程会在 awrite 上等待，
+    从而把背压一路传递到子进程的管道上，而不是在内存里无限堆积输出。
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, step: int, index: int, tool: str):
+        self.loop = loop
+        self.queue = queue
+        self.step = step
+        self.index = index
+        self.tool = tool
+        self.closed = False
+
+    def _event(self, chunk, stream):
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode(errors="ignore")
+        return ToolOutputEvent(step=self.step, index=self.index, tool=self.tool, stream=stream, chunk=chunk)
+
+    def write(self, chunk, stream="stdout"):
+        """线程安全的写入，可以在工具的读取线程中调用"""
+        if self.closed:
+            return
+        event = self._event(chunk, stream)
+        if _in_loop_thread(self.loop):
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.loop.create_task(self.queue.put(event))
+            return
+        try:
+            future = asyncio.run_coroutine_threadsafe(self.queue.put(event), self.loop)
+        except RuntimeError:  # 事件循环已经关闭
+            return
+        while True:
+            try:
+                future.result(timeout=0.5)
+                return
+            except concurrent.futures.TimeoutError:
+                if self.closed:
+                    future.cancel()
+                    return
+
+    async def awrite(self, chunk, stream="stdout"):
+        if self.closed:
+            return
+        await self.queue.put(self._event(chunk, stream))
+
+
+def _in_loop_thread(loop):
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+def set_tool_output_sink(sink: Optional[ToolOutputSink]):
+    return _tool_output_sink.set(sink)
+
+
+def emit_tool_output(chunk, stream="stdout"):
+    """在同步代码（例如读取线程）中上报一块工具输出"""
+    sink = _tool_output_sink.get()
+    if sink is not None:
+        sink.write(chunk, stream)
+
+
+async def aemit_tool_output(chunk, stream="stdout"):
+    """在协程中上报一块工具输出，事件队列满时会等待"""
+    sink = _tool_output_sink.get()
+    if sink is not None:
+        await sink.awrite(chunk, stream)
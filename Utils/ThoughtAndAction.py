@@ -17,4 +17,27 @@ class ThoughtAndAction(BaseModel):
     action: Action = Field(description="当前的执行动作")
 
     def is_finish(self) -> bool:
-        return self.action.name.lower() == "finish"
\ No newline at end of file
+        return self.action.name.lower() == "finish"
+
+    # 本步需要执行的全部动作；单动作格式下就是 action 本身
+    def all_actions(self) -> List[Action]:
+        return [self.action]
+
+
+class ThoughtAndActions(ThoughtAndAction):
+    """扩展的输出格式：除了 action 之外，还允许在一步里给出多个相互独立、可以同时执行的动作"""
+    actions: List[Action] = Field(
+        default_factory=list,
+        description="可选：与 action 相互独立、可以和 action 同时执行的其他动作列表（例如对多个目标分别扫描），没有则为空列表",
+    )
+
+    def all_actions(self) -> List[Action]:
+        # action 在前，其余按给出的顺序；去掉 FINISH 和重复的动作
+        result = [self.action]
+        for action in self.actions:
+            if action.name.lower() == "finish":
+                continue
+            if any(a.name == action.name and a.args == action.args for a in result):
+                continue
+            result.append(action)
+        return result
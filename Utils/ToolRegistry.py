@@ -0,0 +1,183 @@
+import importlib
+import json
+import re
+import threading
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:  # 注册表本身不依赖 langchain，导入工具包时不需要加载它
+    from langchain_core.tools import BaseTool
+
+_NAME_SEPARATORS = re.compile(r"[\s_\-]+")
+
+
+def normalize_tool_name(name: str) -> str:
+    """
+    工具名称的规范形式：忽略大小写，空白、下划线和连字符都视为一个空格。
+    模型经常把 "Send HTTP Request" 写成 "send http request" 或 "send_http_request"。
+    """
+    return _NAME_SEPARATORS.sub(" ", str(name)).strip().lower()
+
+
+def render_tools_prompt(tools: Iterable["BaseTool"]) -> str:
+    """主 prompt 中的工具列表：每行一个工具，包括名称、描述和参数的 JSON schema"""
+    tools_prompt = ""
+    for i, tool in enumerate(tools):
+        tools_prompt += f"{i+1}. {tool.name} : {tool.description},\
+                args json schema: {json.dumps(tool.args,ensure_ascii=False)}\n"
+    return tools_prompt
+
+
+def tools_fingerprint(tools: Iterable["BaseTool"]) -> Tuple:
+    # 工具对象本身不可哈希，用名称、描述和参数 schema 的内容（字段名、类型、说明）作为指纹；
+    # 用 schema 类的身份会在类被重新定义或地址复用时得到错误的缓存
+    return tuple(
+        (tool.name, tool.description, json.dumps(tool.args, sort_keys=True, ensure_ascii=False))
+        for tool in tools
+    )
+
+
+class _LazyEntry:
+    """尚未导入的工具：记录所在模块和变量名，第一次用到时再导入"""
+    __slots__ = ("name", "module", "attribute", "package", "metadata")
+
+    def __init__(self, name, module, attribute, package, metadata=None):
+        self.name = name
+        self.module = module
+        self.attribute = attribute
+        self.package = package
+        self.metadata = dict(metadata or {})  # 登记时声明的工具 metadata，不导入就能读取
+
+    def load(self) -> "BaseTool":
+        module = importlib.import_module(self.module, package=self.package)
+        return getattr(module, self.attribute)
+
+
+class ToolRegistry:
+    """
+    按名称查找工具的注册表：字典查找，名称按 normalize_tool_name 匹配。
+    可以直接注册工具对象，也可以只登记模块和变量名，导入推迟到第一次查找或列出工具时，
+    这样导入工具包本身不会连带导入各个工具的依赖。
+    可以当作工具列表使用（迭代、len），工具列表和 prompt 文本在注册新工具之前只生成一次。
+    """
+
+    def __init__(self, tools: Iterable["BaseTool"] = (), package: Optional[str] = None):
+        self.package = package  # register_lazy 中相对模块名的基准包
+        self._lock = threading.RLock()
+        self._entries: Dict[str, Union["BaseTool", _LazyEntry]] = {}
+        self._order: List[str] = []  # 注册顺序，决定 prompt 中的编号
+        self._tools: Optional[List["BaseTool"]] = None
+        self._prompt: Optional[str] = None
+        self._fingerprint: Optional[Tuple] = None
+        for tool in tools:
+            self.register(tool)
+
+    def _add(self, name, entry):
+        key = normalize_tool_name(name)
+        with self._lock:
+            if key in self._entries:
+                raise ValueError(f"工具名称 {name!r} 与已注册的工具重复")
+            self._entries[key] = entry
+            self._order.append(key)
+            self._invalidate()
+
+    def _invalidate(self):
+        self._tools = None
+        self._prompt = None
+        self._fingerprint = None
+
+    def register(self, tool: "BaseTool") -> "BaseTool":
+        self._add(tool.name, tool)
+        return tool
+
+    def register_lazy(self, name: str, module: str, attribute: str, metadata: Optional[Dict] = None):
+        """
+        登记一个延迟导入的工具；name 必须与导入后工具的 name 一致。
+        metadata 声明工具的 metadata 标记（例如 speculative、background），has_metadata 不导入工具就能读到；
+        导入后会检查声明的标记与工具本身的 metadata 一致。
+        """
+        self._add(name, _LazyEntry(name, module, attribute, self.package, metadata))
+
+    def extended(self, tools: Iterable["BaseTool"]) -> "ToolRegistry":
+        """返回包含本注册表全部工具和 tools 的新注册表，本注册表不变；尚未导入的工具仍然延迟导入"""
+        registry = ToolRegistry(package=self.package)
+        with self._lock:
+            registry._entries = dict(self._entries)
+            registry._order = list(self._order)
+        for tool in tools:
+            registry.register(tool)
+        return registry
+
+    def _resolve(self, key) -> "BaseTool":
+        entry = self._entries[key]
+        if isinstance(entry, _LazyEntry):
+            tool = entry.load()
+            if normalize_tool_name(tool.name) != key:
+                raise ValueError(f"{entry.module}.{entry.attribute} 的名称是 {tool.name!r}，与登记的 {entry.name!r} 不一致")
+            metadata = getattr(tool, "metadata", None) or {}
+            for flag, value in entry.metadata.items():
+                if metadata.get(flag) != value:
+                    raise ValueError(
+                        f"{entry.module}.{entry.attribute} 的 metadata[{flag!r}] 是 {metadata.get(flag)!r}，"
+                        f"与登记的 {value!r} 不一致"
+                    )
+            self._entries[key] = entry = tool
+        return entry
+
+    def get(self, name: str) -> Optional["BaseTool"]:
+        """按名称查找工具，找不到时返回 None"""
+        key = normalize_tool_name(name)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if isinstance(entry, _LazyEntry):
+            with self._lock:
+                return self._resolve(key)
+        return entry
+
+    def names(self) -> List[str]:
+        """已注册的工具名称，不会触发导入"""
+        with self._lock:
+            return [
+                entry.name
+                for entry in (self._entries[key] for key in self._order)
+            ]
+
+    def has_metadata(self, flag: str) -> bool:
+        """是否有工具的 metadata[flag] 为真；尚未导入的工具读取登记时声明的 metadata，不会触发导入"""
+        with self._lock:
+            entries = list(self._entries.values())
+        return any(
+            (entry.metadata if isinstance(entry, _LazyEntry) else getattr(entry, "metadata", None) or {}).get(flag)
+            for entry in entries
+        )
+
+    def tools(self) -> List["BaseTool"]:
+        """按注册顺序返回全部工具，延迟导入的工具在这里被导入"""
+        tools = self._tools
+        if tools is None:
+            with self._lock:
+                tools = self._tools = [self._resolve(key) for key in self._order]
+        return tools
+
+    def render_prompt(self) -> str:
+        prompt = self._prompt
+        if prompt is None:
+            prompt = self._prompt = render_tools_prompt(self.tools())
+        return prompt
+
+    @property
+    def fingerprint(self) -> Tuple:
+        """与 PromptTemplateBuilder 的模板缓存配合使用的工具集指纹"""
+        fingerprint = self._fingerprint
+        if fingerprint is None:
+            fingerprint = self._fingerprint = tools_fingerprint(self.tools())
+        return fingerprint
+
+    def __contains__(self, name) -> bool:
+        return normalize_tool_name(name) in self._entries
+
+    def __iter__(self) -> Iterator["BaseTool"]:
+        return iter(self.tools())
+
+    def __len__(self) -> int:
+        return len(self._order)
@@ -0,0 +1,238 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+# 模型可以在工具参数里带上 refresh=true 跳过缓存，强制重新执行
+REFRESH_ARG = "refresh"
+DEFAULT_TOOL_CACHE_MODE = "on"
+DEFAULT_LONG_TERM_MEMORY_DIR = "./memory_store"
+
+
+def _format_age(seconds: float) -> str:
+    seconds = max(0, int(seconds))
+    if seconds < 60:
+        return f"{seconds} 秒"
+    if seconds < 3600:
+        return f"{seconds // 60} 分钟"
+    if seconds < 86400:
+        return f"{seconds // 3600} 小时"
+    return f"{seconds // 86400} 天"
+
+
+def annotate_cached(value: str, created_at: float, now: Optional[float] = None) -> str:
+    """在缓存命中的结果前面注明来源和时间，让模型判断结果是否已经过时"""
+    age = _format_age((now or time.time()) - created_at)
+    return f"[缓存结果：{age}前执行的相同请求，如需最新结果请在参数中加入 \"{REFRESH_ARG}\": true]\n{value}"
+
+
+class ToolResultCache:
+    """
+    工具结果缓存，按工具名称和规范化后的参数做键：
+    - 内存中是容量为 max_entries 的 LRU
+    - 提供 path 时再加一层 SQLite 磁盘缓存，跨任务、跨进程重启仍然有效
+    每条结果带过期时间，过期的结果在读取时删除；ttls 可以按工具名称覆盖装饰器给出的默认 TTL。
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 512, ttls: Optional[Dict[str, float]] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttls = dict(ttls or {})
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (value, created_at, expires_at, tool)
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tool_results ("
+                "key TEXT PRIMARY KEY, tool TEXT NOT NULL, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def cache_info(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._memory)}
+
+    def ttl_for(self, tool: str, default: float) -> float:
+        return self.ttls.get(tool, default)
+
+    @staticmethod
+    def make_key(tool: str, args: dict) -> str:
+        payload = json.dumps(args, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(f"{tool}\0{payload}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """返回 (结果, 写入时间)，未命中或已过期时返回 None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created_at, expires_at, tool FROM tool_results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = tuple(row)
+                    self._remember(key, entry)
+            if entry is not None and entry[2] <= now:
+                self._forget(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key: str, tool: str, value: str, ttl: float):
+        if ttl <= 0:
+            return
+        now = time.time()
+        entry = (value, now, now + ttl, tool)
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO tool_results (key, value, created_at, expires_at, tool) VALUES (?, ?, ?, ?, ?)",
+                    (key, *entry),
+                )
+                self._db.execute("DELETE FROM tool_results WHERE expires_at <= ?", (now,))
+                self._db.commit()
+
+    def clear(self, tool: Optional[str] = None):
+        """清空缓存；给出 tool 时只清空该工具的内存和磁盘结果"""
+        with self._lock:
+            if tool is None:
+                self._memory.clear()
+            else:
+                for key in [key for key, entry in self._memory.items() if entry[3] == tool]:
+                    del self._memory[key]
+            if self._db is not None:
+                if tool is None:
+                    self._db.execute("DELETE FROM tool_results")
+                else:
+                    self._db.execute("DELETE FROM tool_results WHERE tool = ?", (tool,))
+                self._db.commit()
+
+    def _remember(self, key, entry):
+        # 调用方需持有 self._lock
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _forget(self, key):
+        # 调用方需持有 self._lock
+        self._memory.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM tool_results WHERE key = ?", (key,))
+            self._db.commit()
+
+
+def _parse_ttls(text: str) -> Dict[str, float]:
+    """解析 TOOL_CACHE_TTLS，例如 "NmapScan=21600,CVE Search=86400"（秒）"""
+    ttls = {}
+    for item in (text or "").split(","):
+        name, sep, seconds = item.partition("=")
+        if sep and name.strip():
+            ttls[name.strip()] = float(seconds)
+    return ttls
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_tool_cache() -> Optional[ToolResultCache]:
+    """
+    按环境变量创建的进程级缓存，第一次调用工具时才创建；TOOL_CACHE_MODE=off 时返回 None。
+    磁盘文件默认放在长时记忆目录下，目录不存在时只使用内存缓存。
+    """
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                if (os.getenv("TOOL_CACHE_MODE") or DEFAULT_TOOL_CACHE_MODE) == "off":
+                    _default_cache = False
+                else:
+                    memory_dir = os.getenv("LONG_TERM_MEMORY_DIR") or DEFAULT_LONG_TERM_MEMORY_DIR
+                    path = os.getenv("TOOL_CACHE_PATH") or os.path.join(memory_dir, "tool_cache.sqlite3")
+                    if not os.path.isdir(os.path.dirname(path) or "."):
+                        path = None
+                    _default_cache = ToolResultCache(path, ttls=_parse_ttls(os.getenv("TOOL_CACHE_TTLS")))
+    return _default_cache or None
+
+
+def set_tool_cache(cache: Optional[ToolResultCache]):
+    """替换进程级缓存（例如在基准测试中使用纯内存缓存），传入 None 时关闭缓存"""
+    global _default_cache
+    with _default_cache_lock:
+        _default_cache = cache if cache is not None else False
+
+
+def cached_tool_result(
+    tool: str,
+    ttl: float,
+    key: Optional[Callable[[dict], Optional[dict]]] = None,
+    cacheable: Optional[Callable[[str], bool]] = None,
+    cache: Optional[ToolResultCache] = None,
+):
+    """
+    给工具函数（同步或 async）加上结果缓存的装饰器。
+    - key：把绑定好默认值的参数字典转换成规范形式，返回 None 表示这次调用不缓存（例如非 GET 请求）
+    - cacheable：判断结果能否写入缓存，出错、超时之类的结果不应该被缓存
+    被装饰的函数多接受一个 refresh 参数，为 True 时跳过读取，但仍然用新结果更新缓存。
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def lookup(args, kwargs, refresh):
+            target = cache or get_tool_cache()
+            if target is None:
+                return None, None, None
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            normalized = key(dict(bound.arguments)) if key else dict(bound.arguments)
+            if normalized is None:
+                return None, None, None
+            cache_key = target.make_key(tool, normalized)
+            hit = None if refresh else target.get(cache_key)
+            return target, cache_key, hit
+
+        def store(target, cache_key, result):
+            if target is not None and isinstance(result, str) and (cacheable is None or cacheable(result)):
+                target.put(cache_key, tool, result, target.ttl_for(tool, ttl))
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, refresh: bool = False, **kwargs):
+                target, cache_key, hit = lookup(args, kwargs, refresh)
+                if hit is not None:
+                    return annotate_cached(*hit)
+                result = await func(*args, **kwargs)
+                store(target, cache_key, result)
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, refresh: bool = False, **kwargs):
+            target, cache_key, hit = lookup(args, kwargs, refresh)
+            if hit is not None:
+                return annotate_cached(*hit)
+            result = func(*args, **kwargs)
+            store(target, cache_key, result)
+            return result
+
+        return wrapper
+
+    return decorator
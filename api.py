@@ -1,51 +1,480 @@
-from .Tools.ShellTool import tools  
-from .AutoAgent.AutoGPT import AutoGPT
-
-from langchain_openai.chat_models import ChatOpenAI
-from langchain_openai import OpenAIEmbeddings
-from langchain.schema import Document
-from langchain_community.vectorstores import FAISS
+from .Tools.ShellTool import tools
+from .Utils.Metrics import JsonLinesSink, Metrics
 
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from collections import Counter, OrderedDict, deque
+import argparse
+import asyncio
+import json
 import os
+import threading
+import time
+import uuid
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .AutoAgent.AutoGPT import AutoGPT
 
 DEFAULT_OPENAI_API_BASE = "https://api.openai.com/v1"
+DEFAULT_LONG_TERM_MEMORY_DIR = "./memory_store"
+DEFAULT_LLM_CACHE_MODE = "off"
+DEFAULT_PROMPTS_PATH = "./action/Prompts"
+# 结束的任务记录保留的秒数和条数，超出后从最早结束的开始丢弃
+DEFAULT_FINISHED_TASK_TTL = 3600
+DEFAULT_MAX_FINISHED_TASKS = 500
+# 没有排队或运行中任务的会话，空闲超过这么多秒后丢弃短时记忆；会话总数超过上限时从最久未用的开始丢弃
+DEFAULT_SESSION_TTL = 3600
+DEFAULT_MAX_SESSIONS = 1000
+# 每个任务只缓冲最近的这么多字符的 tool_output 事件，供正在收听的流式客户端读取
+MAX_TASK_OUTPUT_CHARS = 256 * 1024
 
-def get_AutoGPT():
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    openai_api_base = os.getenv("OPENAI_BASEURL") or DEFAULT_OPENAI_API_BASE
+# 进程内共享的 LLM、嵌入模型和向量库，只在第一次使用时创建
+_shared_clients = None
+_shared_lock = threading.Lock()
 
-    if not openai_api_key :
-        print("请在 'api_keys.env' 文件中设置 'OPENAI_API_KEY' ")
-        return
 
-    # 初始化语言模型
-    llm = ChatOpenAI(
-        model_name="gpt-4o-ca",
-        openai_api_key=openai_api_key,
-        openai_api_base=openai_api_base
-    )
-    prompts_path = "./action/Prompts"
+def get_shared_clients():
+    """
+    返回 (llm, embeddings, retriever)。所有会话共用同一组客户端和同一个向量库，
+    避免每个请求都重新创建客户端并加载向量索引。未配置 OPENAI_API_KEY 时返回 None。
+    """
+    global _shared_clients
+    with _shared_lock:
+        if _shared_clients is not None:
+            return _shared_clients
 
-    # 初始化嵌入模型
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-ada-002",
-        openai_api_key=openai_api_key,
-        openai_api_base=openai_api_base
-    )
+        # LangChain、OpenAI 客户端和 FAISS 导入较慢，第一次创建客户端时才导入，导入本模块只需要几毫秒
+        from langchain_openai.chat_models import ChatOpenAI
+        from langchain_openai import OpenAIEmbeddings
+        from .Utils.MemoryStore import PersistentFAISSStore
+        from .Utils.EmbeddingCache import CachedEmbeddings
+        from .Utils.LLMCache import ResponseCache
+
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+        openai_api_base = os.getenv("OPENAI_BASEURL") or DEFAULT_OPENAI_API_BASE
+
+        llm_cache_mode = os.getenv("LLM_CACHE_MODE") or DEFAULT_LLM_CACHE_MODE
+
+        if not openai_api_key and llm_cache_mode != "replay":  # replay 模式只读缓存，可以离线运行
+            print("请在 'api_keys.env' 文件中设置 'OPENAI_API_KEY' ")
+            return None
+
+        memory_dir = os.getenv("LONG_TERM_MEMORY_DIR") or DEFAULT_LONG_TERM_MEMORY_DIR
+        os.makedirs(memory_dir, exist_ok=True)
+
+        # LLM 响应缓存：按完整 prompt 和模型参数录制/重放，off 时不启用
+        llm_cache = None
+        if llm_cache_mode != "off":
+            llm_cache = ResponseCache(
+                os.getenv("LLM_CACHE_PATH") or os.path.join(memory_dir, "llm_cache.sqlite3"),
+                mode=llm_cache_mode,
+            )
+
+        # 初始化语言模型
+        llm = ChatOpenAI(
+            model_name="gpt-4o-ca",
+            openai_api_key=openai_api_key or "replay",
+            openai_api_base=openai_api_base,
+            cache=llm_cache,
+        )
+
+        # 初始化嵌入模型，外面包一层按内容哈希的缓存（内存 LRU + 磁盘 SQLite），相同文本不重复请求嵌入接口
+        embeddings = CachedEmbeddings(
+            OpenAIEmbeddings(
+                model="text-embedding-ada-002",
+                openai_api_key=openai_api_key or "replay",
+                openai_api_base=openai_api_base
+            ),
+            cache_path=os.path.join(memory_dir, "embeddings.sqlite3"),
+        )
+
+        # 初始化向量数据库，用于长时记忆；持久化在磁盘上，重启后历史记录仍然可用
+        db = PersistentFAISSStore.open(memory_dir, embeddings)
+        retriever = db.as_retriever()
 
-    # 初始化向量数据库，用于长时记忆
-    db = FAISS.from_documents(
-        [Document(page_content="")],
-        embeddings
-    ) 
-    retriever = db.as_retriever()
+        _shared_clients = (llm, embeddings, retriever)
+        return _shared_clients
+
+
+def get_AutoGPT(manual=True, prompts_path=DEFAULT_PROMPTS_PATH):
+    clients = get_shared_clients()
+    if clients is None:
+        return
+    llm, _, retriever = clients
+    from .AutoAgent.AutoGPT import AutoGPT
+
+    # 指标始终在进程内聚合（GET /metrics），设置 METRICS_JSONL 时另外逐条写入 JSON Lines 文件
+    metrics_path = os.getenv("METRICS_JSONL")
+    metrics = Metrics(sinks=[JsonLinesSink(metrics_path)] if metrics_path else [])
 
     agent = AutoGPT(
         llm=llm,
         prompts_path=prompts_path,
         tools=tools,
         memory_retriever=retriever,
-        manual=True
+        manual=manual,
+        metrics=metrics,
     )
     return agent
 
+
+class AgentService:
+    """
+    长期运行的多会话 agent 服务：
+    - 所有会话共用同一个 AutoGPT 实例（以及它背后的 LLM、嵌入模型和向量库）
+    - 每个会话有自己的短时记忆，同一会话内的任务按提交顺序串行执行
+    - 通过信号量限制同时运行的会话数，超出的任务在队列中等待，队列满时拒绝提交
+    - 结束的任务记录最多保留 finished_task_ttl 秒、max_finished_tasks 条；没有排队或运行中任务的会话
+      空闲 session_ttl 秒后丢弃，会话数超过 max_sessions 时丢弃最久未用的空闲会话；
+      工具的实时输出（tool_output 事件）不写入步骤记录，只在环形缓冲中推送给正在收听的流式客户端
+    所有任务都在一个后台线程的事件循环里运行，HTTP 处理线程通过线程安全的方法和它交互。
+    """
+
+    def __init__(
+        self,
+        agent: "AutoGPT",
+        max_concurrent_sessions=4,
+        max_queued_tasks=100,
+        finished_task_ttl=DEFAULT_FINISHED_TASK_TTL,
+        max_finished_tasks=DEFAULT_MAX_FINISHED_TASKS,
+        session_ttl=DEFAULT_SESSION_TTL,
+        max_sessions=DEFAULT_MAX_SESSIONS,
+    ):
+        self.agent = agent
+        self.max_concurrent_sessions = max_concurrent_sessions
+        self.max_queued_tasks = max_queued_tasks
+        self.finished_task_ttl = finished_task_ttl
+        self.max_finished_tasks = max_finished_tasks
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+
+        self._sessions = OrderedDict()  # session_id -> 短时记忆，按最近使用时间排列，最久未用的在前
+        self._session_used = {}  # session_id -> 最近一次提交或结束任务的时间
+        self._session_pending = Counter()  # session_id -> 排队或运行中的任务数，不为 0 的会话不会被丢弃
+        # session_id -> [asyncio.Lock, 引用它的排队或运行中的任务数]，只在事件循环线程中访问；
+        # 没有任务引用时删除，锁的数量不随历史会话增长
+        self._session_locks = {}
+        self._tasks = {}  # task_id -> 任务记录
+        self._finished = OrderedDict()  # task_id -> 结束时间，按结束顺序排列
+        self._condition = threading.Condition()
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="agent-service", daemon=True)
+        self._thread.start()
+        self._admission = asyncio.run_coroutine_threadsafe(self._create_semaphore(), self._loop).result()
+
+    async def _create_semaphore(self):
+        return asyncio.Semaphore(self.max_concurrent_sessions)
+
+    def submit(self, task_description: str, session_id=None) -> dict:
+        """提交任务，立即返回任务记录；队列已满时抛出 RuntimeError"""
+        with self._condition:
+            self._evict_finished()
+            pending = sum(1 for t in self._tasks.values() if t["status"] in ("queued", "running"))
+            if pending >= self.max_queued_tasks:
+                raise RuntimeError("任务队列已满，请稍后再试。")
+
+            session_id = session_id or uuid.uuid4().hex
+            self._session_memory(session_id)
+            self._session_pending[session_id] += 1
+
+            task_id = uuid.uuid4().hex
+            self._tasks[task_id] = {
+                "task_id": task_id,
+                "session_id": session_id,
+                "task": task_description,
+                "status": "queued",
+                "steps": [],
+                "reply": None,
+                "error": None,
+                "created_at": time.time(),
+                # 以下划线开头的字段只在内部使用，不出现在返回的记录中：
+                # 事件序号、每条步骤记录的序号，以及 tool_output 事件的环形缓冲 (序号, 事件)
+                "_seq": 0,
+                "_step_seqs": [],
+                "_output": deque(),
+                "_output_chars": 0,
+            }
+        asyncio.run_coroutine_threadsafe(self._run_task(task_id), self._loop)
+        return self.get(task_id)
+
+    def get(self, task_id: str, since: int = 0):
+        """返回任务状态以及从第 since 步开始的步骤记录，任务不存在时返回 None"""
+        with self._condition:
+            record = self._tasks.get(task_id)
+            if record is None:
+                return None
+            return self._snapshot(record, since)
+
+    def iter_steps(self, task_id: str, timeout: float = 30.0):
+        """
+        依次产出任务的每一个事件，任务结束后产出最终状态；timeout 秒内没有新进展时产出一次心跳。
+        tool_output 事件按发生顺序穿插在步骤之间，读得太慢时较早的输出会被环形缓冲丢弃。
+        """
+        since = 0
+        last_seq = 0
+        while True:
+            with self._condition:
+                record = self._tasks.get(task_id)
+                if record is None:
+                    return
+                if record["_seq"] <= last_seq and record["status"] in ("queued", "running"):
+                    self._condition.wait(timeout)
+                events = list(zip(record["_step_seqs"][since:], record["steps"][since:]))
+                events.extend(item for item in record["_output"] if item[0] > last_seq)
+                finished = record["status"] not in ("queued", "running")
+                since = len(record["steps"])
+                last_seq = record["_seq"]
+                snapshot = self._snapshot(record, since)
+            events.sort(key=lambda item: item[0])
+            for _, step in events:
+                yield {"task_id": task_id, **step}
+            if finished:
+                yield {"type": "status", **snapshot}
+                return
+            if not events:
+                yield {"type": "heartbeat", "task_id": task_id, "status": snapshot["status"]}
+
+    def drop_session(self, session_id: str) -> bool:
+        """丢弃会话的短时记忆，之后用同一 session_id 提交的任务会从空记忆开始"""
+        with self._condition:
+            self._session_used.pop(session_id, None)
+            return self._sessions.pop(session_id, None) is not None
+
+    def shutdown(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def _snapshot(self, record, since):
+        snapshot = {k: v for k, v in record.items() if k != "steps" and not k.startswith("_")}
+        snapshot["steps"] = list(record["steps"][since:])
+        snapshot["next"] = len(record["steps"])
+        return snapshot
+
+    def _update(self, task_id, **fields):
+        with self._condition:
+            record = self._tasks[task_id]
+            record.update(fields)
+            if record["status"] not in ("queued", "running"):
+                # 结束后不再需要输出缓冲；正在收听的客户端已经读走了它来得及读的部分
+                record["_output"].clear()
+                record["_output_chars"] = 0
+                self._finished[task_id] = time.time()
+                session_id = record["session_id"]
+                self._session_pending[session_id] -= 1
+                if self._session_pending[session_id] <= 0:
+                    del self._session_pending[session_id]
+                if session_id in self._sessions:
+                    self._touch_session(session_id)
+                self._evict_finished()
+            self._condition.notify_all()
+
+    def _append_step(self, task_id, step):
+        with self._condition:
+            record = self._tasks[task_id]
+            record["_seq"] += 1
+            if step.get("type") == "tool_output":
+                # 工具的原始输出可能有几十 MB，只保留最近的一段，不写入步骤记录
+                output = record["_output"]
+                output.append((record["_seq"], step))
+                record["_output_chars"] += len(step.get("chunk") or "")
+                while record["_output_chars"] > MAX_TASK_OUTPUT_CHARS and len(output) > 1:
+                    _, dropped = output.popleft()
+                    record["_output_chars"] -= len(dropped.get("chunk") or "")
+            else:
+                record["steps"].append(step)
+                record["_step_seqs"].append(record["_seq"])
+            self._condition.notify_all()
+
+    def _evict_finished(self):
+        # 调用方持有 self._condition
+        now = time.time()
+        while self._finished:
+            task_id, finished_at = next(iter(self._finished.items()))
+            if now - finished_at <= self.finished_task_ttl and len(self._finished) <= self.max_finished_tasks:
+                break
+            del self._finished[task_id]
+            self._tasks.pop(task_id, None)
+        # 空闲会话：按最近使用时间从旧到新检查，有任务的会话跳过
+        for session_id in list(self._sessions):
+            idle = now - self._session_used[session_id] > self.session_ttl
+            if not idle and len(self._sessions) <= self.max_sessions:
+                break
+            if self._session_pending[session_id]:
+                continue
+            del self._sessions[session_id]
+            del self._session_used[session_id]
+
+    def _touch_session(self, session_id):
+        # 调用方持有 self._condition
+        self._sessions.move_to_end(session_id)
+        self._session_used[session_id] = time.time()
+
+    def _session_memory(self, session_id):
+        """返回会话的短时记忆，不存在时创建，并记为最近使用；调用方持有 self._condition"""
+        memory = self._sessions.get(session_id)
+        if memory is None:
+            memory = self._sessions[session_id] = self.agent.new_short_term_memory()
+        self._touch_session(session_id)
+        return memory
+
+    async def _run_task(self, task_id):
+        with self._condition:
+            record = self._tasks[task_id]
+            session_id = record["session_id"]
+            task_description = record["task"]
+        entry = self._session_locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            await self._run_task_locked(task_id, session_id, task_description, entry[0])
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._session_locks[session_id]
+
+    async def _run_task_locked(self, task_id, session_id, task_description, session_lock):
+        async with session_lock:
+            async with self._admission:
+                with self._condition:
+                    # 会话可能在排队期间被 drop_session 丢弃，此时重新创建一份空记忆
+                    memory = self._session_memory(session_id)
+                self._update(task_id, status="running", started_at=time.time())
+                try:
+                    reply = None
+                    async for event in self.agent.astream(task_description, short_term_memory=memory):
+                        self._append_step(task_id, event.dict())
+                        if event.type == "final":
+                            reply = event.reply
+                    self._update(
+                        task_id,
+                        status="finished",
+                        reply=reply,
+                        finished_at=time.time(),
+                    )
+                except Exception as e:
+                    self._update(
+                        task_id,
+                        status="failed",
+                        error=f"{type(e).__name__}: {e}",
+                        finished_at=time.time(),
+                    )
+
+
+def make_handler(service: AgentService):
+    class AgentRequestHandler(BaseHTTPRequestHandler):
+        """
+        POST   /tasks                 {"task": "...", "session_id": "可选"} 提交任务
+        GET    /tasks/<id>?since=N    轮询任务状态和第 N 个事件之后的事件
+        GET    /tasks/<id>/stream     以 JSON Lines 的形式流式返回事件，任务结束后关闭
+        GET    /metrics               Prometheus 文本格式的指标
+        DELETE /sessions/<id>         丢弃会话记忆
+        """
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _path_parts(self):
+            parsed = urlparse(self.path)
+            return [p for p in parsed.path.split("/") if p], parse_qs(parsed.query)
+
+        def do_POST(self):
+            parts, _ = self._path_parts()
+            if parts != ["tasks"]:
+                return self._send_json(404, {"error": "not found"})
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except (ValueError, json.JSONDecodeError):
+                return self._send_json(400, {"error": "请求体必须是 JSON"})
+            task = payload.get("task")
+            if not isinstance(task, str) or not task.strip():
+                return self._send_json(400, {"error": "缺少 task 字段"})
+            try:
+                record = service.submit(task, session_id=payload.get("session_id"))
+            except RuntimeError as e:
+                return self._send_json(503, {"error": str(e)})
+            self._send_json(202, record)
+
+        def _send_text(self, status, text, content_type="text/plain; version=0.0.4; charset=utf-8"):
+            body = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parts, query = self._path_parts()
+            if parts == ["metrics"]:
+                return self._send_text(200, service.agent.metrics.render_prometheus())
+            if len(parts) == 2 and parts[0] == "tasks":
+                try:
+                    since = int(query.get("since", ["0"])[0])
+                except ValueError:
+                    since = 0
+                record = service.get(parts[1], since=since)
+                if record is None:
+                    return self._send_json(404, {"error": "任务不存在"})
+                return self._send_json(200, record)
+            if len(parts) == 3 and parts[0] == "tasks" and parts[2] == "stream":
+                if service.get(parts[1]) is None:
+                    return self._send_json(404, {"error": "任务不存在"})
+                return self._stream(parts[1])
+            self._send_json(404, {"error": "not found"})
+
+        def do_DELETE(self):
+            parts, _ = self._path_parts()
+            if len(parts) == 2 and parts[0] == "sessions":
+                return self._send_json(200, {"dropped": service.drop_session(parts[1])})
+            self._send_json(404, {"error": "not found"})
+
+        def _stream(self, task_id):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for event in service.iter_steps(task_id):
+                    line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+                    self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # 客户端提前断开
+
+    return AgentRequestHandler
+
+
+def serve(host="127.0.0.1", port=8000, max_concurrent_sessions=4, prompts_path=DEFAULT_PROMPTS_PATH):
+    """启动本地 HTTP/JSON 服务，阻塞直到进程被中断"""
+    agent = get_AutoGPT(manual=False, prompts_path=prompts_path)
+    if agent is None:
+        return
+    service = AgentService(agent, max_concurrent_sessions=max_concurrent_sessions)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f"Agent 服务已在 http://{host}:{port} 启动")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+        agent.metrics.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AutoGPT 多会话 HTTP 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-sessions", type=int, default=4)
+    parser.add_argument("--prompts-path", default=DEFAULT_PROMPTS_PATH)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.max_sessions, args.prompts_path)
@@ -0,0 +1,11 @@
+"""
+AutoGPT 主循环的离线基准测试：用按脚本回复的假模型和固定延迟、固定输出大小的假工具驱动 AutoGPT，
+统计各阶段耗时、内存峰值，以及入口模块在新解释器里的导入耗时，并与保存的基线比较。
+
+    python -m <package>.benchmarks                      # 运行全部场景并与 baseline.json 比较
+    python -m <package>.benchmarks --save-baseline      # 把本次结果保存为新的基线
+"""
+from .fakes import ScriptedChatModel, make_stub_tool, step_response
+from .harness import ScriptedAutoGPT, compare, run_scenario
+from .imports import compare_imports, profile_imports
+from .scenarios import SCENARIOS, Scenario, get_scenario
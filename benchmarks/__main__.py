@@ -0,0 +1,144 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from .harness import GATED_METRICS, PHASES, compare, environment, median_result, run_scenario
+from .imports import compare_imports, print_import_results, profile_import, profile_imports
+from .scenarios import SCENARIOS, get_scenario
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def run_isolated(scenario, repeat, llm_latency):
+    # 每个场景在新的子进程里运行，最大常驻内存不会被前面的场景抬高
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_scenario, scenario, repeat, llm_latency).result()
+
+
+def print_results(results):
+    header = f"{'scenario':<18}{'wall(ms)':>10}" + "".join(f"{name:>14}" for name in PHASES) + f"{'rss(MB)':>10}{'alloc(MB)':>11}"
+    print(header)
+    for result in results:
+        line = f"{result['name']:<18}{result['wall']['median'] * 1000:>10.1f}"
+        line += "".join(f"{result['phases'].get(name, 0.0) * 1000:>14.2f}" for name in PHASES)
+        rss = result.get("peak_rss_kb")
+        line += f"{rss / 1024:>10.1f}" if rss else f"{'-':>10}"
+        allocations = result.get("allocations")
+        line += f"{allocations['peak_bytes'] / 1024 / 1024:>11.1f}" if allocations else f"{'-':>11}"
+        print(line)
+
+
+def _suspects(rows, metric):
+    return {row["name"] for row in rows if row["status"] == "regressed" and row["metric"] == metric}
+
+
+def confirm_regressions(results, imports, baseline, args, run):
+    """
+    共享机器上单轮的中位数可能偶然超过阈值。总耗时或导入耗时看起来退化的场景和入口模块再运行 args.confirm 轮，
+    用各轮中位数居中的那一轮重新比较；只有多数轮次都变慢才算退化，基线本身不变。
+    """
+    slow_scenarios = _suspects(compare(results, baseline, args.threshold), "wall")
+    slow_imports = {
+        name.split(":", 1)[1] for name in _suspects(compare_imports(imports, baseline, args.threshold), "import")
+    }
+    if not slow_scenarios and not slow_imports:
+        return results, imports
+    print(f"\n复测看起来退化的项目，各再运行 {args.confirm} 轮：{', '.join(sorted(slow_scenarios | slow_imports))}")
+    results = [
+        median_result(
+            [result] + [run(get_scenario(result["name"])) for _ in range(args.confirm)],
+            key=lambda item: item["wall"]["median"],
+        ) if result["name"] in slow_scenarios else result
+        for result in results
+    ]
+    imports = [
+        median_result(
+            [result] + [profile_import(result["name"], args.repeat) for _ in range(args.confirm)],
+            key=lambda item: item["total"],
+        ) if result["name"] in slow_imports else result
+        for result in imports
+    ]
+    return results, imports
+
+
+def print_comparison(rows):
+    for row in rows:
+        if row["status"] == "new":
+            print(f"{row['name']:<24} 基线中没有这个场景")
+        elif row["status"] != "ok" or row["metric"] in GATED_METRICS:
+            ratio = f"{row['ratio']:.2f}x" if row["ratio"] is not None else "-"
+            print(f"{row['name']:<24}{row['metric']:<20}{ratio:>8}  {row['status']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AutoGPT 主循环基准测试")
+    parser.add_argument("--scenario", action="append", help="只运行指定场景，可重复；默认运行全部")
+    parser.add_argument("--repeat", type=int, default=3, help="每个场景的运行次数，耗时取中位数")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="假模型每次调用的延迟（秒）")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果写入基线文件")
+    parser.add_argument("--threshold", type=float, default=1.2, help="超过基线多少倍视为退化")
+    parser.add_argument(
+        "--confirm", type=int, default=2, help="看起来退化的场景和导入再运行几轮，取居中的一轮判断；0 表示不复测"
+    )
+    parser.add_argument("--output", help="把本次结果另存为 JSON")
+    parser.add_argument("--in-process", action="store_true", help="所有场景在当前进程里运行")
+    parser.add_argument("--list", action="store_true", help="列出全部场景")
+    parser.add_argument("--skip-imports", action="store_true", help="不测量入口模块的导入耗时")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for scenario in SCENARIOS:
+            print(f"{scenario.name:<18}{scenario.description}")
+        return 0
+
+    def run(scenario):
+        if args.in_process:
+            return run_scenario(scenario, args.repeat, args.llm_latency)
+        return run_isolated(scenario, args.repeat, args.llm_latency)
+
+    scenarios = [get_scenario(name) for name in args.scenario] if args.scenario else SCENARIOS
+    results = [run(scenario) for scenario in scenarios]
+    print_results(results)
+
+    # 入口模块的导入耗时（冷启动）；只运行部分场景时不测
+    imports = []
+    if not args.skip_imports and not args.scenario:
+        imports = profile_imports(repeat=args.repeat)
+        print()
+        print_import_results(imports)
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if args.confirm > 0:
+            results, imports = confirm_regressions(results, imports, baseline, args, run)
+
+    report = {"environment": environment(args.repeat, args.llm_latency), "scenarios": results}
+    if imports:
+        report["imports"] = imports
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到 {args.baseline}")
+        return 0
+
+    if baseline is None:
+        print(f"没有找到基线文件 {args.baseline}，使用 --save-baseline 生成")
+        return 0
+    rows = compare(results, baseline, args.threshold) + compare_imports(imports, baseline, args.threshold)
+    print()
+    print_comparison(rows)
+    regressed = [row for row in rows if row["status"] == "regressed" and row["metric"] in GATED_METRICS]
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain.tools import StructuredTool
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
+from pydantic.v1 import BaseModel, Field
+
+# 用 prompt 里的固定文字区分调用来自哪里：摘要记忆的总结 prompt、最终回复 prompt，其余都视为思考步骤
+SUMMARY_MARKER = "Progressively summarize"
+FINAL_MARKER = "provide your final answer"
+
+
+def step_response(action_name: str, args: Optional[dict] = None, speak: str = "ok") -> str:
+    """生成一条可以被 ThoughtAndAction 解析的思考步骤回复"""
+    return json.dumps(
+        {
+            "thought": {
+                "text": f"run {action_name}",
+                "reasoning": "scripted",
+                "plan": ["scripted"],
+                "criticism": "none",
+                "speak": speak,
+            },
+            "action": {"name": action_name, "args": args or {}},
+        },
+        ensure_ascii=False,
+    )
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    按脚本回复的聊天模型，用于离线基准测试：
+    思考步骤依次返回 script 中的回复（用完后返回 FINISH），摘要和最终回复返回固定文本。
+    每次调用前等待 latency 秒，模拟网络和推理延迟；另外 tail_latency 秒模拟模型在 JSON 之后继续生成的尾部，
+    流式调用时这段时间在回复内容发出之后。
+    """
+
+    script: List[str] = Field(default_factory=list)
+    latency: float = 0.0
+    tail_latency: float = 0.0
+    summary_reply: str = "scripted summary"
+    final_reply: str = "scripted final reply"
+
+    _position: int = PrivateAttr(default=0)
+    _calls: Dict[str, int] = PrivateAttr(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    @property
+    def calls(self) -> Dict[str, int]:
+        """各类调用的次数：step / summary / final"""
+        return dict(self._calls)
+
+    def _reply(self, messages: List[BaseMessage]) -> ChatResult:
+        prompt = str(messages[-1].content) if messages else ""
+        if SUMMARY_MARKER in prompt:
+            kind, text = "summary", self.summary_reply
+        elif FINAL_MARKER in prompt:
+            kind, text = "final", self.final_reply
+        else:
+            kind = "step"
+            if self._position < len(self.script):
+                text = self.script[self._position]
+                self._position += 1
+            else:
+                text = step_response("FINISH")
+        self._calls[kind] = self._calls.get(kind, 0) + 1
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency or self.tail_latency:
+            time.sleep(self.latency + self.tail_latency)
+        return self._reply(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency or self.tail_latency:
+            await asyncio.sleep(self.latency + self.tail_latency)
+        return self._reply(messages)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        text = self._reply(messages).generations[0].message.content
+        yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+        if self.tail_latency:
+            await asyncio.sleep(self.tail_latency)
+        yield ChatGenerationChunk(message=AIMessageChunk(content="\n"))
+
+
+class StubInput(BaseModel):
+    target: str = Field(description="目标")
+
+
+def _stub_output(output_bytes: int) -> str:
+    # 模拟扫描器的输出：每行一个端口，总长度为 output_bytes
+    lines = []
+    size = 0
+    i = 0
+    while size < output_bytes:
+        line = f"{i % 65536}/tcp open service-{i % 17} version {i}.{i % 10}\n"
+        lines.append(line)
+        size += len(line)
+        i += 1
+    return "".join(lines)[:output_bytes]
+
+
+def make_stub_tool(name: str = "Stub", latency: float = 0.0, output_bytes: int = 256, speculative: bool = False) -> StructuredTool:
+    """创建一个固定延迟、固定输出大小的工具，同步和异步路径都可用；speculative 为 True 时允许提前执行"""
+    output = _stub_output(output_bytes)
+
+    def run(target: str) -> str:
+        if latency:
+            time.sleep(latency)
+        return output
+
+    async def arun(target: str) -> str:
+        if latency:
+            await asyncio.sleep(latency)
+        return output
+
+    return StructuredTool.from_function(
+        func=run,
+        coroutine=arun,
+        name=name,
+        description=f"基准测试用的工具，耗时 {latency} 秒，返回 {output_bytes} 字节",
+        args_schema=StubInput,
+        metadata={"speculative": True} if speculative else None,
+    )
@@ -0,0 +1,196 @@
+import gc
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from ..AutoAgent.AutoGPT import AutoGPT
+from ..Utils.MemoryStore import PersistentFAISSStore
+from ..Utils.Metrics import Metrics
+from .fakes import ScriptedChatModel, make_stub_tool
+from .scenarios import Scenario
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROMPTS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Prompts")
+
+# 报告中的阶段，以及各阶段由 AutoGPT 的哪些 span 组成；并发执行的工具各自计时后累加
+PHASE_SPANS = {
+    "prompt_build": ("template_build", "prompt_render"),
+    "memory_load": ("long_term_retrieval", "summary_load"),
+    "llm": ("llm_invoke",),
+    "parse": ("output_parse",),
+    "tool": ("tool_run",),
+    "memory_save": ("memory_save",),
+    "final": ("final_step",),
+}
+PHASES = tuple(PHASE_SPANS)
+
+
+def phase_totals(metrics: Metrics) -> Dict[str, float]:
+    spans = metrics.registry.span_totals()
+    return {phase: sum(spans.get(name, 0.0) for name in names) for phase, names in PHASE_SPANS.items()}
+
+
+class ScriptedAutoGPT(AutoGPT):
+    """人工检查模式下的用户输入按脚本回答，其余行为与 AutoGPT 相同；各阶段耗时来自 AutoGPT 自带的 metrics"""
+
+    def __init__(self, *args, confirmations: Optional[List[bool]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._confirmations = list(confirmations or [])
+
+    def _prompt_user_confirmation(self, action):
+        return self._confirmations.pop(0) if self._confirmations else True
+
+    def _prompt_user_choice(self) -> str:
+        return "2"
+
+    def _get_user_input(self, prompt: str) -> str:
+        return "只关注 80 和 443 端口"
+
+
+def peak_rss_kb() -> Optional[int]:
+    """进程的最大常驻内存（KB）；Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _run_once(scenario: Scenario, llm_latency: float, directory: str):
+    llm = ScriptedChatModel(script=scenario.script(), latency=llm_latency, tail_latency=scenario.llm_tail)
+    retriever = None
+    if scenario.long_term_memory:
+        store = PersistentFAISSStore.open(directory, DeterministicFakeEmbedding(size=256))
+        retriever = store.as_retriever()
+    agent = ScriptedAutoGPT(
+        llm=llm,
+        prompts_path=PROMPTS_PATH,
+        tools=[make_stub_tool(
+            latency=scenario.tool_latency, output_bytes=scenario.output_bytes, speculative=scenario.speculative,
+        )],
+        max_thought_steps=scenario.steps + 2,
+        memory_retriever=retriever,
+        manual=scenario.manual,
+        metrics=Metrics(),
+        confirmations=scenario.confirmations(),
+    )
+    start = time.perf_counter()
+    agent.run(f"benchmark {scenario.name}")
+    wall = time.perf_counter() - start
+    return wall, phase_totals(agent.metrics), llm.calls
+
+
+def run_scenario(scenario: Scenario, repeat: int = 3, llm_latency: float = 0.0, trace_allocations: bool = True) -> Dict:
+    """
+    运行 repeat 次取各项耗时的中位数；再单独运行一次，用 tracemalloc 统计分配峰值，
+    避免 tracemalloc 的开销混进计时。
+    """
+    walls = []
+    phases = defaultdict(list)
+    calls = {}
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as directory:
+            gc.collect()
+            wall, run_phases, calls = _run_once(scenario, llm_latency, directory)
+        walls.append(wall)
+        for name in PHASES:
+            phases[name].append(run_phases.get(name, 0.0))
+
+    allocations = None
+    if trace_allocations:
+        with tempfile.TemporaryDirectory() as directory:
+            gc.collect()
+            tracemalloc.start()
+            try:
+                _run_once(scenario, llm_latency, directory)
+                current, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        allocations = {"peak_bytes": peak, "retained_bytes": current}
+
+    return {
+        "name": scenario.name,
+        "description": scenario.description,
+        "wall": {
+            "median": statistics.median(walls),
+            "min": min(walls),
+            "max": max(walls),
+        },
+        "phases": {name: statistics.median(values) for name, values in phases.items()},
+        "llm_calls": calls,
+        "peak_rss_kb": peak_rss_kb(),
+        "allocations": allocations,
+    }
+
+
+def median_result(results: List[Dict], key: Callable[[Dict], float]) -> Dict:
+    """多轮运行同一个场景（或入口模块）时，取 key 值居中的那一轮的完整结果；轮数为偶数时取偏大的一轮"""
+    return sorted(results, key=key)[len(results) // 2]
+
+
+def environment(repeat: int, llm_latency: float) -> Dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "llm_latency": llm_latency,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+# 参与判定是否退化的指标；各阶段耗时只作参考，太短的阶段波动很大。import 是入口模块的导入耗时，见 imports.py
+GATED_METRICS = ("wall", "alloc_peak", "import")
+MIN_PHASE_SECONDS = 0.001
+
+
+def compare(results: List[Dict], baseline: Dict, threshold: float = 1.2) -> List[Dict]:
+    """
+    与基线逐项比较：总耗时中位数、各阶段耗时和分配峰值。
+    比值超过 threshold 记为 regressed，低于 1 / threshold 记为 improved；
+    基线和当前都不到 MIN_PHASE_SECONDS 的阶段不做判断。
+    """
+    baseline_by_name = {item["name"]: item for item in baseline.get("scenarios", [])}
+    rows = []
+    for result in results:
+        base = baseline_by_name.get(result["name"])
+        if base is None:
+            rows.append({"name": result["name"], "metric": "wall", "status": "new"})
+            continue
+        metrics = [("wall", result["wall"]["median"], base["wall"]["median"])]
+        metrics += [
+            (f"phase.{name}", result["phases"].get(name, 0.0), base["phases"].get(name, 0.0))
+            for name in PHASES
+        ]
+        if result.get("allocations") and base.get("allocations"):
+            metrics.append(("alloc_peak", result["allocations"]["peak_bytes"], base["allocations"]["peak_bytes"]))
+        for metric, current, previous in metrics:
+            ratio = current / previous if previous else None
+            too_small = metric.startswith("phase.") and max(current, previous) < MIN_PHASE_SECONDS
+            if ratio is None or too_small:
+                status = "ok"
+            elif ratio > threshold:
+                status = "regressed"
+            elif ratio < 1 / threshold:
+                status = "improved"
+            else:
+                status = "ok"
+            rows.append({
+                "name": result["name"],
+                "metric": metric,
+                "current": current,
+                "baseline": previous,
+                "ratio": ratio,
+                "status": status,
+            })
+    return rows
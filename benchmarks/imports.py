@@ -0,0 +1,111 @@
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+# 被测包的名称（本目录的上一级），以及它所在的目录，子进程在那里运行 import
+PACKAGE = __package__.rsplit(".", 1)[0]
+PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 关心启动耗时的入口模块：CLI、HTTP 服务和工具包
+ENTRY_MODULES = ("main", "api", "Tools.ShellTool")
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)\s*$")
+
+
+def _parse_importtime(stderr: str):
+    """解析 python -X importtime 的输出，返回 [(模块名, 自身耗时秒, 累计耗时秒, 嵌套深度)]"""
+    rows = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            rows.append((name, int(own) / 1e6, int(cumulative) / 1e6, len(indent) // 2))
+    return rows
+
+
+def _import_once(module: str):
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PACKAGE_PARENT,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败：{completed.stderr.strip().splitlines()[-1:]}")
+    return _parse_importtime(completed.stderr)
+
+
+def profile_import(module: str, repeat: int = 3, top: int = 8) -> Dict:
+    """
+    在新的解释器里导入 module（相对于被测包），重复 repeat 次取中位数。
+    返回总耗时，以及按顶层包汇总的自身耗时中最大的 top 项，用来定位是哪个依赖拖慢了启动。
+    第一次导入会编译 .pyc，不计入结果。
+    """
+    full_name = f"{PACKAGE}.{module}"
+    _import_once(full_name)
+    totals = []
+    packages = defaultdict(list)
+    for _ in range(repeat):
+        rows = _import_once(full_name)
+        totals.append(next(cumulative for name, _, cumulative, depth in rows if name == full_name and depth == 0))
+        by_package = defaultdict(float)
+        for name, own, _, _ in rows:
+            by_package[name.split(".")[0]] += own
+        for name, own in by_package.items():
+            packages[name].append(own)
+    medians = {name: statistics.median(values + [0.0] * (repeat - len(values))) for name, values in packages.items()}
+    heaviest = sorted(medians.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "name": module,
+        "total": statistics.median(totals),
+        "packages": dict(heaviest),
+    }
+
+
+def profile_imports(modules=ENTRY_MODULES, repeat: int = 3) -> List[Dict]:
+    return [profile_import(module, repeat) for module in modules]
+
+
+def print_import_results(results: List[Dict]):
+    for result in results:
+        heaviest = ", ".join(f"{name} {seconds * 1000:.0f}" for name, seconds in result["packages"].items())
+        print(f"import {result['name']:<18}{result['total'] * 1000:>9.1f} ms   {heaviest}")
+
+
+# 导入耗时很短时波动相对较大，基线和当前都低于这个值时不判断退化
+MIN_IMPORT_SECONDS = 0.05
+
+
+def compare_imports(results: List[Dict], baseline: Dict, threshold: float = 1.2) -> List[Dict]:
+    """与基线中的 imports 逐个入口模块比较总耗时，规则与 harness.compare 相同"""
+    baseline_by_name = {item["name"]: item for item in baseline.get("imports", [])}
+    rows = []
+    for result in results:
+        name = f"import:{result['name']}"
+        base = baseline_by_name.get(result["name"])
+        if base is None:
+            rows.append({"name": name, "metric": "import", "status": "new"})
+            continue
+        current, previous = result["total"], base["total"]
+        ratio = current / previous if previous else None
+        if ratio is None or max(current, previous) < MIN_IMPORT_SECONDS:
+            status = "ok"
+        elif ratio > threshold:
+            status = "regressed"
+        elif ratio < 1 / threshold:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append({
+            "name": name,
+            "metric": "import",
+            "current": current,
+            "baseline": previous,
+            "ratio": ratio,
+            "status": status,
+        })
+    return rows
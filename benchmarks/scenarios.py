@@ -0,0 +1,60 @@
+from typing import List, NamedTuple
+
+from .fakes import step_response
+
+
+class Scenario(NamedTuple):
+    name: str
+    description: str
+    steps: int  # 调用工具的思考步数，之后一步返回 FINISH
+    tool_latency: float = 0.0
+    output_bytes: int = 256
+    manual_replans: int = 0  # 人工检查模式下，用户拒绝并补充讨论的次数
+    rethink_every: int = 0  # 每隔多少步重复一次上一步的动作，触发强制重新思考
+    long_term_memory: bool = True
+    llm_tail: float = 0.0  # 流式回复在 JSON 结束后的尾部耗时
+    speculative: bool = False  # 工具是否标记为可以提前执行
+
+    def script(self) -> List[str]:
+        """思考步骤的回复脚本，与 confirmations 配合使用"""
+        responses = []
+        # 被用户拒绝的动作也会消耗一次思考
+        for i in range(self.manual_replans):
+            responses.append(step_response("Stub", {"target": f"rejected-{i}"}))
+        for i in range(self.steps):
+            if self.rethink_every and i and i % self.rethink_every == 0:
+                # 先重复上一步的动作，重新思考后再给出新的动作
+                responses.append(step_response("Stub", {"target": f"host-{i - 1}"}))
+            responses.append(step_response("Stub", {"target": f"host-{i}"}))
+        responses.append(step_response("FINISH"))
+        return responses
+
+    def confirmations(self) -> List[bool]:
+        """人工检查模式下用户对每个动作的确认结果，用完后一律确认"""
+        return [False] * self.manual_replans
+
+    @property
+    def manual(self) -> bool:
+        return self.manual_replans > 0
+
+
+SCENARIOS = [
+    Scenario("steps_1", "1 步工具调用", steps=1),
+    Scenario("steps_10", "10 步工具调用", steps=10),
+    Scenario("steps_50", "50 步工具调用，短时记忆窗口被填满", steps=50),
+    Scenario("big_observations", "10 步，每步工具输出 200KB", steps=10, output_bytes=200 * 1024),
+    Scenario("manual_replan", "人工检查模式，用户拒绝 2 次并补充讨论后重新规划", steps=5, manual_replans=2),
+    Scenario("rethink", "10 步，每隔 2 步重复动作触发重新思考", steps=10, rethink_every=2),
+    Scenario("llm_tail", "10 步，工具 50ms，回复尾部 50ms，逐步串行执行", steps=10, tool_latency=0.05, llm_tail=0.05),
+    Scenario(
+        "speculative", "同 llm_tail，但工具可以在回复生成期间提前执行",
+        steps=10, tool_latency=0.05, llm_tail=0.05, speculative=True,
+    ),
+]
+
+
+def get_scenario(name: str) -> Scenario:
+    for scenario in SCENARIOS:
+        if scenario.name == name:
+            return scenario
+    raise KeyError(f"未知的场景 {name!r}，可选：{', '.join(s.name for s in SCENARIOS)}")
@@ -1,48 +1,88 @@
 
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+import logging
 import os
 
 # 加载环境变量
 load_dotenv("api_keys.env", override=True)  
 DEFAULT_OPENAI_API_BASE = "https://api.openai.com/v1"
+DEFAULT_LONG_TERM_MEMORY_DIR = "./memory_store"
+DEFAULT_LLM_CACHE_MODE = "off"
+DEFAULT_LOG_LEVEL = "INFO"
 from .Tools.ShellTool import tools  
-from .AutoAgent.AutoGPT import AutoGPT
+from .Utils.Metrics import JsonLinesSink, Metrics
 
-from langchain_openai.chat_models import ChatOpenAI
-from langchain_openai import OpenAIEmbeddings
-from langchain.schema import Document
-from langchain_community.vectorstores import FAISS
+# LangChain、OpenAI 客户端、FAISS 和工具模块的导入要一秒左右，都放在 _build_clients 里，
+# 由后台线程在用户选择模式的同时完成
 
-def main():
 
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    openai_api_base = os.getenv("OPENAI_BASEURL") or DEFAULT_OPENAI_API_BASE
+def _build_clients(openai_api_key, openai_api_base, llm_cache_mode, memory_dir):
+    """创建语言模型和长时记忆的检索器，返回 (llm, retriever)"""
+    from langchain_openai.chat_models import ChatOpenAI
+    from langchain_openai import OpenAIEmbeddings
+    from .Utils.MemoryStore import PersistentFAISSStore
+    from .Utils.EmbeddingCache import CachedEmbeddings
+    from .Utils.LLMCache import ResponseCache
+    from .AutoAgent.AutoGPT import AutoGPT  # 预先导入，选择模式后可以直接创建 agent
 
-    if not openai_api_key :
-        print("请在 'api_keys.env' 文件中设置 'OPENAI_API_KEY' ")
-        return
+    # LLM 响应缓存：按完整 prompt 和模型参数录制/重放，off 时不启用
+    llm_cache = None
+    if llm_cache_mode != "off":
+        llm_cache = ResponseCache(
+            os.getenv("LLM_CACHE_PATH") or os.path.join(memory_dir, "llm_cache.sqlite3"),
+            mode=llm_cache_mode,
+        )
 
     # 初始化语言模型
     llm = ChatOpenAI(
         model_name="gpt-4o",
-        openai_api_key=openai_api_key,
-        openai_api_base=openai_api_base
+        openai_api_key=openai_api_key or "replay",
+        openai_api_base=openai_api_base,
+        cache=llm_cache,
     )
-    prompts_path = "./Prompts"
 
-    # 初始化嵌入模型
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-ada-002",
-        openai_api_key=openai_api_key,
-        openai_api_base=openai_api_base
+    # 初始化嵌入模型，外面包一层按内容哈希的缓存（内存 LRU + 磁盘 SQLite），相同文本不重复请求嵌入接口
+    embeddings = CachedEmbeddings(
+        OpenAIEmbeddings(
+            model="text-embedding-ada-002",
+            openai_api_key=openai_api_key or "replay",
+            openai_api_base=openai_api_base
+        ),
+        cache_path=os.path.join(memory_dir, "embeddings.sqlite3"),
     )
 
-    # 初始化向量数据库，用于长时记忆
-    db = FAISS.from_documents(
-        [Document(page_content="")],
-        embeddings
-    ) 
-    retriever = db.as_retriever()
+    # 初始化向量数据库，用于长时记忆；持久化在磁盘上，重启后历史记录仍然可用，空库启动时也不需要调用嵌入接口
+    db = PersistentFAISSStore.open(memory_dir, embeddings)
+
+    # 工具模块也在这里导入，第一步生成 prompt 时不用再等
+    tools.tools()
+    return llm, db.as_retriever()
+
+
+def main():
+
+    # agent 的提示和诊断信息通过 logging 输出到终端；LOG_LEVEL=DEBUG 时还会显示 prompt 各部分的 token 数和无法解析的原始回复
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger(__package__).setLevel(os.getenv("LOG_LEVEL") or DEFAULT_LOG_LEVEL)
+
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    openai_api_base = os.getenv("OPENAI_BASEURL") or DEFAULT_OPENAI_API_BASE
+
+    llm_cache_mode = os.getenv("LLM_CACHE_MODE") or DEFAULT_LLM_CACHE_MODE
+
+    if not openai_api_key and llm_cache_mode != "replay":  # replay 模式只读缓存，可以离线运行
+        print("请在 'api_keys.env' 文件中设置 'OPENAI_API_KEY' ")
+        return
+
+    memory_dir = os.getenv("LONG_TERM_MEMORY_DIR") or DEFAULT_LONG_TERM_MEMORY_DIR
+    os.makedirs(memory_dir, exist_ok=True)
+    prompts_path = "./Prompts"
+
+    # 客户端和向量库在后台创建，和下面等待用户选择模式的时间重叠
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="startup")
+    clients = executor.submit(_build_clients, openai_api_key, openai_api_base, llm_cache_mode, memory_dir)
+    executor.shutdown(wait=False)
 
     # 选择模式
     while True:
@@ -56,13 +96,20 @@ def main():
         else:
             print("无效输入，请输入 '1' 或 '2'。")
 
-    # 初始化智能代理
+    # 设置 METRICS_JSONL 时把各阶段耗时和计数逐条写入 JSON Lines 文件
+    metrics_path = os.getenv("METRICS_JSONL")
+    metrics = Metrics(sinks=[JsonLinesSink(metrics_path)] if metrics_path else [])
+
+    # 初始化智能代理；后台的创建还没完成时在这里等待，创建失败时异常在这里抛出
+    llm, retriever = clients.result()
+    from .AutoAgent.AutoGPT import AutoGPT
     agent = AutoGPT(
         llm=llm,
         prompts_path=prompts_path,
         tools=tools,
         memory_retriever=retriever,
-        manual=manual
+        manual=manual,
+        metrics=metrics,
     )
 
     while True:
@@ -72,6 +119,7 @@ def main():
             break
         reply = agent.run(task_description=task, verbose=True)
         print(f"\n回复：\n{reply}\n")
+    metrics.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file